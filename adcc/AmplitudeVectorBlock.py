@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import numpy as np
+
+from functools import lru_cache
+
+from .AmplitudeVector import AmplitudeVector
+
+__all__ = ["AmplitudeVectorBlock"]
+
+#: Tolerance used for the symmetry check when converting a row of the block
+#: back into the symmetry-adapted tensors of an AmplitudeVector
+SYMMETRY_TOLERANCE = 1e-12
+
+
+def _symmetry_tolerance(dtype):
+    """
+    Tolerance for the symmetry checks of vectors stored in the passed
+    floating-point type, which allows for the rounding errors of
+    single-precision rows.
+    """
+    return max(SYMMETRY_TOLERANCE, 100 * np.finfo(dtype).eps)
+
+
+def _antisymmetric_pairs(tensor):
+    """
+    Return the pairs of axes with respect to which the amplitudes stored in
+    `tensor` are antisymmetric. These are the occupied and the virtual
+    index pairs of a doubles block, if both indices run over the same space
+    (compare :py:meth:`adcc.AdcMatrix.construct_symmetrisation_for_blocks`).
+    """
+    if tensor.ndim != 4:
+        return ()
+    subspaces = tensor.subspaces
+    return tuple((p, p + 1) for p in (0, 2) if subspaces[p] == subspaces[p + 1])
+
+
+@lru_cache(maxsize=16)
+def _packed_index(shape, pairs):
+    """
+    Flat indices of the elements of a tensor of the passed shape, which are
+    unique with respect to antisymmetry in the passed pairs of axes,
+    i.e. the elements with ``i < j`` for all index pairs ``(i, j)``.
+    """
+    mask = np.ones(shape, dtype=bool)
+    for p, q in pairs:
+        ip = np.arange(shape[p]).reshape([-1 if k == p else 1
+                                          for k in range(len(shape))])
+        iq = np.arange(shape[q]).reshape([-1 if k == q else 1
+                                          for k in range(len(shape))])
+        mask &= ip < iq
+    return np.flatnonzero(mask)
+
+
+def _packed_size(shape, pairs):
+    size = int(np.prod(shape))
+    for p, q in pairs:
+        size = size // (shape[p] * shape[q]) * (shape[p] * (shape[p] - 1) // 2)
+    return size
+
+
+def _row_chunks(n_rows, chunk_size):
+    """Split the range of `n_rows` rows into slices of `chunk_size` rows."""
+    if chunk_size is None or n_rows <= chunk_size:
+        return [slice(0, n_rows)]
+    return [slice(start, min(start + chunk_size, n_rows))
+            for start in range(0, n_rows, chunk_size)]
+
+
+class AmplitudeVectorBlock:
+    def __init__(self, template, capacity=0, dtype=np.float64, scratch_dir=None,
+                 chunk_size=None):
+        """
+        Construct an empty block of amplitude vectors, which stores a set of
+        vectors contiguously. For each block (ph, pphh, ...) all vectors are
+        kept as the rows of a single dense matrix, such that projections
+        (:py:meth:`dot`) and linear combinations (:py:meth:`lincomb`) of all
+        vectors are performed as a single matrix-matrix product.
+
+        For doubles blocks only the elements unique with respect to the
+        antisymmetry of the occupied and virtual index pairs are stored
+        (``i < j`` and ``a < b``), which is a quarter of the full tensor.
+        Their contribution to the dot products is weighted accordingly.
+        Elements vanishing or mirrored due to spin symmetry are stored.
+
+        Parameters
+        ----------
+        template : AmplitudeVector
+            Vector defining the blocks, shapes and tensor symmetry of the
+            vectors contained in this block. The data of the template is not
+            used and the template is not modified.
+        capacity : int, optional
+            Number of vectors to preallocate storage for.
+        dtype : numpy.dtype, optional
+            Floating-point type used for storing the vectors.
+        scratch_dir : str or NoneType, optional
+            If not None, the vectors are not kept in memory, but in
+            memory-mapped (anonymous) scratch files inside this directory.
+            The operating system keeps recently used vectors in the page cache
+            and evicts the others as memory is needed.
+        chunk_size : int or NoneType, optional
+            Maximal number of vectors processed at once in :py:meth:`dot`,
+            :py:meth:`rowwise_dot` and :py:meth:`lincomb`, such that
+            memory-mapped vectors are streamed chunk by chunk. None processes
+            all vectors at once.
+        """
+        if not isinstance(template, AmplitudeVector):
+            raise TypeError("template needs to be an AmplitudeVector")
+        self.template = template
+        self.dtype = np.dtype(dtype)
+        self.scratch_dir = scratch_dir
+        self.chunk_size = chunk_size
+        self.shapes = {b: template[b].shape for b in template.blocks_ph}
+        self.antisymmetric_pairs = {b: _antisymmetric_pairs(template[b])
+                                    for b in template.blocks_ph}
+        self.n_vectors = 0
+        self._data = {b: self.__allocate(capacity, size)
+                      for b, size in self.row_sizes.items()}
+
+    def __allocate(self, n_rows, n_cols):
+        if self.scratch_dir is None or n_rows * n_cols == 0:
+            return np.empty((n_rows, n_cols), dtype=self.dtype)
+        # The file is unlinked when closed, but stays alive as long as
+        # it is mapped, i.e. until the memmap array is garbage-collected.
+        with tempfile.TemporaryFile(dir=self.scratch_dir) as fp:
+            return np.memmap(fp, dtype=self.dtype, mode="w+",
+                             shape=(n_rows, n_cols))
+
+    @classmethod
+    def from_vectors(cls, vectors, capacity=None, dtype=np.float64):
+        """
+        Construct a block from a list of AmplitudeVector objects.
+
+        Parameters
+        ----------
+        vectors : list
+            Non-empty list of AmplitudeVector objects
+        capacity : int or NoneType, optional
+            Number of vectors to preallocate storage for
+            (defaults to the number of vectors passed).
+        dtype : numpy.dtype, optional
+            Floating-point type used for storing the vectors.
+        """
+        if isinstance(vectors, AmplitudeVector):
+            vectors = [vectors]
+        if len(vectors) == 0:
+            raise ValueError("List of vectors cannot be empty")
+        if capacity is None:
+            capacity = len(vectors)
+        ret = cls(vectors[0], max(capacity, len(vectors)), dtype=dtype)
+        ret.extend(vectors)
+        return ret
+
+    @classmethod
+    def from_data(cls, template, data):
+        """
+        Construct a block wrapping a dictionary of existing 2D arrays
+        (one for each block of the template, one vector per row).
+        No copy of the data is made.
+        """
+        ret = cls(template, 0, dtype=next(iter(data.values())).dtype)
+        ret._data = data
+        ret.n_vectors = next(iter(data.values())).shape[0]
+        return ret
+
+    @property
+    def blocks_ph(self):
+        """Return the blocks which are used inside the vectors."""
+        return sorted(self.shapes.keys())
+
+    @property
+    def row_sizes(self):
+        """Number of stored elements per vector for each block"""
+        return {b: _packed_size(shape, self.antisymmetric_pairs[b])
+                for b, shape in self.shapes.items()}
+
+    def __weight(self, b):
+        # Number of elements of the full tensor represented by
+        # each stored element (up to the sign)
+        return 2 ** len(self.antisymmetric_pairs[b])
+
+    def to_rows(self, vector):
+        """
+        Return the data of an AmplitudeVector (or a vector of the same
+        structure, e.g. the matrix diagonal) in the storage layout of this
+        block, i.e. as a dictionary of 1D arrays. No symmetry check is done.
+        """
+        ret = {}
+        for b, pairs in self.antisymmetric_pairs.items():
+            full = vector[b].to_ndarray()
+            if pairs:
+                ret[b] = full.ravel()[_packed_index(full.shape, pairs)]
+            else:
+                ret[b] = full.ravel()
+        return ret
+
+    def packed_positions(self, b, index):
+        """
+        Return the positions inside the rows of block `b`, at which the
+        elements of the full tensor with the passed multi-index (tuple of
+        integer arrays) are stored, together with the signs relating the
+        stored to the full elements. Elements vanishing due to antisymmetry
+        get a sign of zero (and an arbitrary position).
+        """
+        shape = self.shapes[b]
+        pairs = self.antisymmetric_pairs[b]
+        index = list(np.broadcast_arrays(*index))
+        signs = np.ones(index[0].shape)
+        for p, q in pairs:
+            swap = index[p] > index[q]
+            index[p], index[q] = (np.where(swap, index[q], index[p]),
+                                  np.where(swap, index[p], index[q]))
+            signs[swap] *= -1
+            signs[index[p] == index[q]] = 0
+        positions = np.ravel_multi_index(tuple(index), shape)
+        if pairs:
+            packed = _packed_index(shape, pairs)
+            positions = np.minimum(np.searchsorted(packed, positions),
+                                   len(packed) - 1)
+        return positions, signs
+
+    def __to_row(self, b, tensor):
+        pairs = self.antisymmetric_pairs[b]
+        full = tensor.to_ndarray()
+        if not pairs:
+            return full.ravel()
+        tolerance = _symmetry_tolerance(self.dtype) \
+            * max(1.0, np.max(np.abs(full)))
+        for p, q in pairs:
+            if np.max(np.abs(full + full.swapaxes(p, q))) > tolerance:
+                raise ValueError(f"Block {b} of the AmplitudeVector is not "
+                                 f"antisymmetric with respect to the axes "
+                                 f"{p} and {q}, which is required to store it "
+                                 "inside an AmplitudeVectorBlock.")
+        return full.ravel()[_packed_index(full.shape, pairs)]
+
+    def __from_row(self, b, row):
+        shape = self.shapes[b]
+        pairs = self.antisymmetric_pairs[b]
+        if not pairs:
+            return row.reshape(shape)
+        full = np.zeros(shape, dtype=row.dtype)
+        full.ravel()[_packed_index(shape, pairs)] = row
+        for p, q in pairs:
+            full = full - full.swapaxes(p, q)
+        return full
+
+    @property
+    def capacity(self):
+        """Number of vectors for which storage is allocated"""
+        return next(iter(self._data.values())).shape[0]
+
+    @property
+    def data(self):
+        """
+        Return a dictionary mapping from the block label to the 2D array
+        view containing the data of all vectors (one vector per row).
+        For doubles blocks the rows only contain the elements unique
+        with respect to antisymmetry (see :py:meth:`to_rows`).
+        """
+        return {b: arr[:self.n_vectors] for b, arr in self._data.items()}
+
+    @property
+    def is_out_of_core(self):
+        """Are the vectors stored in memory-mapped scratch files"""
+        return any(isinstance(arr, np.memmap) for arr in self._data.values())
+
+    @property
+    def nbytes(self):
+        """Number of bytes required to store the vectors of this block."""
+        return sum(arr.nbytes for arr in self.data.values())
+
+    def __len__(self):
+        return self.n_vectors
+
+    def __iter__(self):
+        for i in range(self.n_vectors):
+            yield self[i]
+
+    def __repr__(self):
+        return (f"AmplitudeVectorBlock({self.n_vectors} vectors, "
+                + "=..., ".join(self.blocks_ph) + "=...)")
+
+    def reserve(self, capacity):
+        """Make sure storage for at least `capacity` vectors is available."""
+        if capacity <= self.capacity:
+            return
+        for b, arr in self._data.items():
+            newarr = self.__allocate(capacity, arr.shape[1])
+            for rows in _row_chunks(self.n_vectors, self.chunk_size):
+                newarr[rows] = arr[rows]
+            self._data[b] = newarr
+
+    def append(self, vector):
+        """Append a single AmplitudeVector to the block."""
+        self.extend([vector])
+
+    def extend(self, vectors):
+        """
+        Append a list of AmplitudeVector objects or the vectors of
+        another AmplitudeVectorBlock to this block.
+        """
+        n_new = len(vectors)
+        if self.n_vectors + n_new > self.capacity:
+            self.reserve(max(self.n_vectors + n_new, 2 * self.capacity))
+        if isinstance(vectors, AmplitudeVectorBlock):
+            self.__check_compatible(vectors)
+            for b, arr in vectors.data.items():
+                self._data[b][self.n_vectors:self.n_vectors + n_new] = arr
+            self.n_vectors += n_new
+        else:
+            for vec in vectors:
+                self.n_vectors += 1
+                self[self.n_vectors - 1] = vec
+
+    def __check_compatible(self, other):
+        if sorted(other.shapes.items()) != sorted(self.shapes.items()):
+            raise ValueError("Blocks and shapes of both AmplitudeVectorBlock "
+                             "objects need to agree.")
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, list, np.ndarray)):
+            ret = AmplitudeVectorBlock.from_data(self.template, {
+                b: arr[index] for b, arr in self.data.items()
+            })
+            ret.chunk_size = self.chunk_size
+            return ret
+        else:
+            index = range(self.n_vectors)[index]  # Bounds check and negative idx
+            ret = self.template.empty_like()
+            for b, arr in self._data.items():
+                ret[b].set_from_ndarray(self.__from_row(b, arr[index]),
+                                        _symmetry_tolerance(arr.dtype))
+            return ret
+
+    def __setitem__(self, index, vector):
+        if isinstance(vector, AmplitudeVectorBlock):
+            # Assign multiple rows at once
+            self.__check_compatible(vector)
+            index = np.arange(self.n_vectors)[index]
+            if len(index) != len(vector):
+                raise ValueError("Number of indices and number of assigned "
+                                 "vectors need to agree.")
+            for b, arr in vector.data.items():
+                self._data[b][index] = arr
+            return
+        if not isinstance(vector, AmplitudeVector):
+            raise TypeError("Only AmplitudeVector objects can be assigned to "
+                            "an element of an AmplitudeVectorBlock")
+        if sorted(vector.blocks_ph) != self.blocks_ph:
+            raise ValueError("Blocks of AmplitudeVector and "
+                             "AmplitudeVectorBlock need to agree.")
+        index = range(self.n_vectors)[index]
+        for b, arr in self._data.items():
+            arr[index] = self.__to_row(b, vector[b])
+
+    def to_list(self):
+        """Return the vectors of this block as a list of AmplitudeVector"""
+        return [self[i] for i in range(self.n_vectors)]
+
+    def evaluate(self):
+        # The data of a block is always fully evaluated
+        return self
+
+    def copy(self):
+        """Return a (compact) copy of the block"""
+        return AmplitudeVectorBlock.from_data(self.template, {
+            b: arr.copy() for b, arr in self.data.items()
+        })
+
+    def astype(self, dtype):
+        """Return a copy of the block using the passed floating-point type"""
+        return AmplitudeVectorBlock.from_data(self.template, {
+            b: arr.astype(dtype) for b, arr in self.data.items()
+        })
+
+    def dot(self, other):
+        """
+        Return the matrix of dot products between the vectors of this block
+        and the vectors of another AmplitudeVectorBlock, i.e. the element
+        ``(i, j)`` of the returned array is ``self[i] @ other[j]``.
+        If `other` is a single AmplitudeVector a 1D array is returned.
+        """
+        if isinstance(other, AmplitudeVector):
+            other = AmplitudeVectorBlock.from_vectors([other])
+            return self.dot(other)[:, 0]
+        elif isinstance(other, list):
+            other = AmplitudeVectorBlock.from_vectors(other)
+        self.__check_compatible(other)
+        odata = other.data
+        ret = np.zeros((len(self), len(other)))
+        for b, arr in self.data.items():
+            weight = self.__weight(b)
+            for rows in _row_chunks(len(self), self.chunk_size):
+                for cols in _row_chunks(len(other), other.chunk_size):
+                    ret[rows, cols] += weight * (arr[rows] @ odata[b][cols].T)
+        return ret
+
+    def rowwise_dot(self, other):
+        """
+        Return the dot products between corresponding vectors of this block
+        and another AmplitudeVectorBlock, i.e. the diagonal of
+        ``self.dot(other)``.
+        """
+        if len(other) != len(self):
+            raise ValueError("Number of vectors in both blocks needs to agree.")
+        odata = other.data
+        ret = np.zeros(len(self))
+        for b, arr in self.data.items():
+            weight = self.__weight(b)
+            for rows in _row_chunks(len(self), self.chunk_size):
+                ret[rows] += weight * np.einsum("ij,ij->i", arr[rows],
+                                                odata[b][rows])
+        return ret
+
+    def norms(self):
+        """Return the l2 norms of all vectors of this block."""
+        return np.sqrt(self.rowwise_dot(self))
+
+    def lincomb(self, coefficients):
+        """
+        Form linear combinations of the vectors of this block.
+
+        If `coefficients` is a 2D array of shape ``(m, len(self))``, an
+        AmplitudeVectorBlock containing ``m`` linear combinations is returned,
+        each of them formed by reading the coefficients row-by-row. If
+        `coefficients` is a 1D array a single AmplitudeVector is returned.
+        """
+        coefficients = np.asarray(coefficients)
+        if coefficients.shape[-1] != len(self):
+            raise ValueError("Number of coefficient values does not match "
+                             "number of vectors.")
+        if coefficients.ndim == 1:
+            return self.lincomb(coefficients[None, :])[0]
+        coefficients = coefficients.astype(self.dtype, copy=False)
+
+        # The result is allocated like the storage of this block, such that
+        # out-of-core blocks also produce out-of-core linear combinations.
+        ret = AmplitudeVectorBlock(self.template, coefficients.shape[0],
+                                   dtype=self.dtype, scratch_dir=self.scratch_dir,
+                                   chunk_size=self.chunk_size)
+        ret.n_vectors = coefficients.shape[0]
+        chunks = _row_chunks(len(self), self.chunk_size)
+        for b, arr in self.data.items():
+            out = ret._data[b]
+            for i, rows in enumerate(chunks):
+                if i == 0:
+                    np.matmul(coefficients[:, rows], arr[rows], out=out)
+                else:
+                    out += coefficients[:, rows] @ arr[rows]
+        return ret
+
+    def __binary_blockwise(self, other, operator):
+        if isinstance(other, AmplitudeVectorBlock):
+            self.__check_compatible(other)
+            if len(other) != len(self):
+                raise ValueError("Number of vectors in both blocks need to agree")
+            odata = other.data
+            return AmplitudeVectorBlock.from_data(self.template, {
+                b: operator(arr, odata[b]) for b, arr in self.data.items()
+            })
+        elif isinstance(other, np.ndarray) and other.ndim == 1:
+            # One scalar per vector
+            if other.size != len(self):
+                raise ValueError("Number of scalars and number of vectors "
+                                 "need to agree")
+            other = other[:, None].astype(self.dtype, copy=False)
+            return AmplitudeVectorBlock.from_data(self.template, {
+                b: operator(arr, other) for b, arr in self.data.items()
+            })
+        elif isinstance(other, (float, int, np.number)):
+            return AmplitudeVectorBlock.from_data(self.template, {
+                b: operator(arr, other) for b, arr in self.data.items()
+            })
+        return NotImplemented
+
+    def __add__(self, other):
+        return self.__binary_blockwise(other, np.add)
+
+    def __sub__(self, other):
+        return self.__binary_blockwise(other, np.subtract)
+
+    def __mul__(self, other):
+        return self.__binary_blockwise(other, np.multiply)
+
+    def __rmul__(self, other):
+        return self.__binary_blockwise(other, np.multiply)
+
+    def __truediv__(self, other):
+        return self.__binary_blockwise(other, np.true_divide)
+
+    def __neg__(self):
+        return -1.0 * self
+
+    def __matmul__(self, other):
+        if isinstance(other, (AmplitudeVector, AmplitudeVectorBlock)):
+            return self.dot(other)
+        if isinstance(other, list):
+            if all(isinstance(elem, AmplitudeVector) for elem in other):
+                return self.dot(other)
+        return NotImplemented
+
+    def __rmatmul__(self, other):
+        if isinstance(other, AmplitudeVector):
+            return self.dot(other)
+        return NotImplemented
@@ -39,8 +39,9 @@ from .ExcitedStates import ExcitedStates
 from .DataHfProvider import DataHfProvider, DictHfProvider
 from .ReferenceState import ReferenceState
 from .AmplitudeVector import AmplitudeVector
+from .AmplitudeVectorBlock import AmplitudeVectorBlock
 from .OneParticleOperator import OneParticleOperator
-from .opt_einsum_integration import register_with_opt_einsum
+from .opt_einsum_integration import contraction_plans, register_with_opt_einsum
 
 # This has to be the last set of import
 from .guess import (guess_symmetries, guess_zero, guesses_any, guesses_singlet,
@@ -54,6 +55,7 @@ __all__ = ["run_adc", "InputError", "AdcMatrix", "AdcBlockView",
            "lincomb", "nosym_like", "ones_like", "transpose",
            "linear_combination", "zeros_like", "direct_sum",
            "memory_pool", "set_n_threads", "get_n_threads", "AmplitudeVector",
+           "AmplitudeVectorBlock", "contraction_plans",
            "HartreeFockProvider", "ExcitedStates", "State2States",
            "Tensor", "DictHfProvider", "DataHfProvider", "OneParticleOperator",
            "guesses_singlet", "guesses_triplet", "guesses_any",
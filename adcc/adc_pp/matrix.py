@@ -30,13 +30,10 @@ from adcc.AmplitudeVector import AmplitudeVector
 
 __all__ = ["block"]
 
-# TODO One thing one could still do to improve timings is implement a "fast einsum"
-#      that does not call opt_einsum, but directly dispatches to libadcc. This could
-#      lower the call overhead in the applies for the cases where we have only a
-#      trivial einsum to do. For the moment I'm not convinced that is worth the
-#      effort ... I suppose it only makes a difference for the cheaper ADC variants
-#      (ADC(0), ADC(1), CVS-ADC(0-2)-x), but then on the other hand they are not
-#      really so much our focus.
+# Note: The contractions in the apply functions below are compiled into
+#       contraction plans on the first apply (see adcc.contraction_plans),
+#       such that the later applies dispatch directly to libadcc without
+#       parsing the subscripts or searching for a contraction path in opt_einsum.
 
 
 #
@@ -22,9 +22,8 @@
 ## ---------------------------------------------------------------------
 import libadcc
 
-import opt_einsum
-
 from .AmplitudeVector import AmplitudeVector
+from .opt_einsum_integration import contraction_plans
 
 
 def dot(a, b):
@@ -214,9 +213,12 @@ def einsum(subscripts, *operands, optimise="auto"):
     optimise : str, list or bool, optional (default: ``auto``)
         Choose the type of the path optimisation, see
         opt_einsum.contract for details.
+
+    The contraction path is only determined on the first call for
+    a particular combination of subscripts and operand shapes and
+    replayed afterwards (see ``adcc.contraction_plans``).
     """
-    return opt_einsum.contract(subscripts, *operands, optimize=optimise,
-                               backend="libadcc")
+    return contraction_plans.contract(subscripts, *operands, optimise=optimise)
 
 
 def contract(subscripts, a, b):
@@ -33,7 +33,7 @@ from .guess_zero import guess_zero
 
 def guesses_from_diagonal(matrix, n_guesses, block="ph", spin_change=0,
                           spin_block_symmetrisation="none",
-                          degeneracy_tolerance=1e-14):
+                          degeneracy_tolerance=1e-14, target=None):
     """
     Obtain guesses by inspecting a block of the diagonal of the passed ADC
     matrix. The symmetry of the returned vectors is already set-up properly.
@@ -59,6 +59,9 @@ def guesses_from_diagonal(matrix, n_guesses, block="ph", spin_change=0,
     degeneracy_tolerance
                  Tolerance for two entries of the diagonal to be considered
                  degenerate, i.e. identical.
+    target       If not None, the guesses are constructed from the entries
+                 of the diagonal closest to this value instead of the
+                 smallest entries (only supported for the "ph" block).
     """
     if not isinstance(matrix, AdcMatrixlike):
         raise TypeError("matrix needs to be of type AdcMatrixlike")
@@ -81,15 +84,21 @@ def guesses_from_diagonal(matrix, n_guesses, block="ph", spin_change=0,
         return []
 
     if block == "ph":
-        guessfunction = guesses_from_diagonal_singles
+        return guesses_from_diagonal_singles(
+            matrix, n_guesses, spin_change, spin_block_symmetrisation,
+            degeneracy_tolerance, target=target
+        )
     elif block == "pphh":
-        guessfunction = guesses_from_diagonal_doubles
+        if target is not None:
+            raise ValueError("Guesses closest to a target value can only be "
+                             "generated for the singles block.")
+        return guesses_from_diagonal_doubles(
+            matrix, n_guesses, spin_change, spin_block_symmetrisation,
+            degeneracy_tolerance
+        )
     else:
         raise ValueError(f"Don't know how to generate guesses for block {block}")
 
-    return guessfunction(matrix, n_guesses, spin_change,
-                         spin_block_symmetrisation, degeneracy_tolerance)
-
 
 class TensorElement:
     def __init__(self, motrans, index, value):
@@ -195,7 +204,7 @@ def find_smallest_matching_elements(predicate, tensor, motrans, n_elements,
 
 def guesses_from_diagonal_singles(matrix, n_guesses, spin_change=0,
                                   spin_block_symmetrisation="none",
-                                  degeneracy_tolerance=1e-14):
+                                  degeneracy_tolerance=1e-14, target=None):
     motrans = MoIndexTranslation(matrix.mospaces, matrix.axis_spaces["ph"])
     if n_guesses == 0:
         return []
@@ -212,8 +221,12 @@ def guesses_from_diagonal_singles(matrix, n_guesses, spin_change=0,
         return (ret[0].ph.is_allowed(telem.index)
                 and telem.spin_change == spin_change)
 
+    # For a target value search the smallest squared distances instead
+    diagonal = matrix.diagonal().ph
+    if target is not None:
+        diagonal = evaluate((diagonal - target) * (diagonal - target))
     elements = find_smallest_matching_elements(
-        pred_singles, matrix.diagonal().ph, motrans, n_guesses,
+        pred_singles, diagonal, motrans, n_guesses,
         degeneracy_tolerance=degeneracy_tolerance
     )
     if len(elements) == 0:
@@ -22,7 +22,10 @@
 ## ---------------------------------------------------------------------
 
 
-__all__ = ["register_with_opt_einsum"]
+import libadcc
+import numpy as np
+
+__all__ = ["register_with_opt_einsum", "ContractionPlan", "contraction_plans"]
 
 
 def _dispatch_diagonal(subscript, outstring, operand):
@@ -130,3 +133,128 @@ def register_with_opt_einsum():
     EVAL_CONSTS_BACKENDS["libadcc"] = libadcc_evaluate_constants
     _has_einsum["libadcc"] = False
     _cached_funcs[('einsum', 'libadcc')] = _fallback_einsum
+
+
+class ContractionPlan:
+    def __init__(self, subscripts, shapes, optimise="auto"):
+        """
+        Compile the contraction sequence of an einsum expression into a plan,
+        which can be replayed for operands of the same shapes.
+
+        The contraction path is determined once by opt_einsum and each
+        pairwise contraction is translated into a direct call to
+        ``libadcc.tensordot`` followed by a transpose, such that applying
+        the plan neither parses the subscripts nor searches for a path.
+
+        Parameters
+        ----------
+        subscripts : str
+            Einsum subscripts of the contraction
+        shapes : list
+            Shapes of the operands
+        optimise : str, list or bool, optional
+            Path optimisation, see opt_einsum.contract for details.
+        """
+        import opt_einsum
+
+        self.subscripts = subscripts
+        expr = opt_einsum.contract_expression(subscripts, *shapes,
+                                              optimize=optimise)
+        self.steps = []
+        for inds, idx_rm, einsum_str, _, blas_flag in expr.contraction_list:
+            if not blas_flag:
+                # Not a pairwise contraction, which needs the fallback
+                self.steps.append((inds, einsum_str, None, None))
+                continue
+            input_str, result = einsum_str.split("->")
+            left, right = input_str.split(",")
+            tensor_result = "".join(c for c in left + right if c not in idx_rm)
+            axes = tuple(zip(*sorted((left.find(c), right.find(c))
+                                     for c in idx_rm)))
+            if not axes:
+                axes = ((), ())
+            permutation = None
+            if tensor_result != result:
+                permutation = tuple(map(tensor_result.index, result))
+            self.steps.append((inds, None, axes, permutation))
+
+    def __call__(self, *operands):
+        operands = list(operands)
+        for inds, einsum_str, axes, permutation in self.steps:
+            step_operands = [operands.pop(x) for x in inds]
+            if einsum_str is not None:
+                res = _fallback_einsum(einsum_str, *step_operands)
+            else:
+                res = libadcc.tensordot(*step_operands, axes)
+                if permutation is not None:
+                    res = res.transpose(permutation)
+            operands.append(res)
+        return operands[0]
+
+
+class ContractionPlanCache:
+    def __init__(self):
+        """
+        Cache of :py:class:`ContractionPlan` objects used by
+        :py:func:`adcc.einsum`, keyed by the subscripts, the shapes of the
+        operands and the path optimisation. Each contraction appearing
+        in the ADC matrix applies is thus compiled on the first apply and
+        replayed on all subsequent applies.
+
+        The attribute `enabled` toggles the use of the plans. If `check` is
+        True, the result of each newly compiled plan is compared against
+        a contraction done by opt_einsum and a RuntimeError is raised
+        if the deviation exceeds `tolerance`.
+        """
+        self.enabled = True
+        self.check = False
+        self.tolerance = 1e-12
+        self.plans = {}
+
+    def clear(self):
+        """Drop all compiled plans."""
+        self.plans.clear()
+
+    def __len__(self):
+        return len(self.plans)
+
+    def contract(self, subscripts, *operands, optimise="auto"):
+        """
+        Perform the contraction using a (possibly newly compiled) plan.
+        """
+        import opt_einsum
+
+        key_optimise = optimise
+        if isinstance(optimise, list):
+            key_optimise = tuple(tuple(step) for step in optimise)
+        try:
+            key = (subscripts, tuple(op.shape for op in operands),
+                   key_optimise)
+            plan = self.plans.get(key, None)
+        except (AttributeError, TypeError):
+            key = plan = None  # Non-tensor operands or unhashable optimise
+        if not self.enabled or key is None:
+            return opt_einsum.contract(subscripts, *operands,
+                                       optimize=optimise, backend="libadcc")
+        if plan is not None:
+            return plan(*operands)
+
+        plan = ContractionPlan(subscripts, key[1], optimise)
+        result = plan(*operands)
+        if self.check:
+            reference = opt_einsum.contract(subscripts, *operands,
+                                            optimize=optimise,
+                                            backend="libadcc")
+            deviation = result - reference
+            if isinstance(deviation, libadcc.Tensor):
+                deviation = libadcc.evaluate(deviation)
+                deviation = np.sqrt(deviation.dot(deviation))
+            if abs(deviation) > self.tolerance:
+                raise RuntimeError(f"Contraction plan for '{subscripts}' "
+                                   f"deviates by {abs(deviation)} from "
+                                   "opt_einsum.")
+        self.plans[key] = plan
+        return result
+
+
+contraction_plans = ContractionPlanCache()
@@ -24,16 +24,18 @@ import warnings
 import numpy as np
 import scipy.linalg as la
 
-from adcc import evaluate, lincomb
+from adcc import evaluate
 from adcc.timings import Timer
 from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
-from .orthogonaliser import GramSchmidtOrthogonaliser
+from .orthogonaliser import CholeskyQROrthogonaliser
 
 
 class LanczosIterator:
     def __init__(self, matrix, guesses, ritz_vectors=None, ritz_values=None,
-                 ritz_overlaps=None, explicit_symmetrisation=None):
+                 ritz_overlaps=None, explicit_symmetrisation=None,
+                 reorthogonalisation="full"):
         """
         Initialise an iterator generating :py:class:`LanczosSubspace` objects,
         which represent a growing Krylov subspace started from the `matrix`
@@ -44,9 +46,9 @@ class LanczosIterator:
         ----------
         matrix
             Matrix to build the Krylov subspace
-        guesses : list
+        guesses : list or AmplitudeVectorBlock
             Vectors to build the Krylov subspace
-        ritz_vectors : list or NoneType, optional
+        ritz_vectors : list or AmplitudeVectorBlock or NoneType, optional
             Ritz vectors for thick restarts
         ritz_values : numpy.ndarray or NoneType, optional
             Ritz values corresponding to the `ritz_vectors` for thick restarts
@@ -58,24 +60,40 @@ class LanczosIterator:
             Explicit symmetrisation to use after orthogonalising the
             subspace vectors. Allows to correct for loss of index or spin
             symmetries during orthogonalisation (type or instance).
+        reorthogonalisation : str, optional
+            Either "full" to orthogonalise each new block against the complete
+            subspace or "partial" to do so only once the loss of orthogonality
+            estimated by the block ω-recurrence (Simon, Math. Comp. 42, 115
+            (1984); Grimes, Lewis, Simon, SIAM J. Matrix Anal. Appl. 15, 228
+            (1994)) exceeds the square root of the machine epsilon.
+            In the latter case the new blocks are still orthogonalised
+            against the Ritz vectors of a thick restart in every step.
         """
+        if reorthogonalisation not in ("full", "partial"):
+            raise ValueError("reorthogonalisation needs to be 'full' or "
+                             "'partial'")
         n_problem = matrix.shape[1]   # Problem size
 
-        if not isinstance(guesses, list):
+        if isinstance(guesses, AmplitudeVector):
             guesses = [guesses]
-        for guess in guesses:
-            if not isinstance(guess, AmplitudeVector):
-                raise TypeError("One of the guesses is not an AmplitudeVector")
+        if not isinstance(guesses, AmplitudeVectorBlock):
+            for guess in guesses:
+                if not isinstance(guess, AmplitudeVector):
+                    raise TypeError("One of the guesses is not an "
+                                    "AmplitudeVector")
+            guesses = AmplitudeVectorBlock.from_vectors(guesses)
         n_block = len(guesses)  # Lanczos block size
 
         # For thick restarts, defaults to no restart
         if ritz_values is None:
             n_restart = 0
-            ritz_vectors = []  # Y
+            ritz_vectors = AmplitudeVectorBlock(guesses.template)  # Y
             ritz_overlaps = np.empty((0, n_block))  # Sigma
             ritz_values = np.empty((0, ))  # Theta
         else:
             n_restart = len(ritz_values)
+            if not isinstance(ritz_vectors, AmplitudeVectorBlock):
+                ritz_vectors = AmplitudeVectorBlock.from_vectors(ritz_vectors)
             if len(ritz_vectors) != n_restart or \
                ritz_overlaps.shape != (n_restart, n_block):
                 raise ValueError("Restart vector shape does not agree "
@@ -83,23 +101,169 @@ class LanczosIterator:
 
         self.matrix = matrix
         self.ritz_values = ritz_values
-        self.ritz_vectors = ritz_vectors
         self.ritz_overlaps = ritz_overlaps
         self.n_problem = n_problem
         self.n_block = n_block
         self.n_restart = n_restart
-        self.ortho = GramSchmidtOrthogonaliser(explicit_symmetrisation)
+        self.ortho = CholeskyQROrthogonaliser(explicit_symmetrisation)
         self.explicit_symmetrisation = explicit_symmetrisation
+        self.reorthogonalisation = reorthogonalisation
         self.timer = Timer()  # TODO More fine-grained timings
 
+        # Estimated orthogonality W_{k,j} = V_k^T V_j between the Lanczos
+        # blocks k and the two most recent blocks j (partial
+        # reorthogonalisation), the number of reorthogonalisations and
+        # whether the next block needs to be reorthogonalised as well
+        self.omega = []
+        self.omega_previous = []
+        self.n_reorthogonalisations = 0
+        self.orthogonality_estimate = 0.0
+        self.reorthogonalise_next = False
+
+        # Combined subspace, the Ritz vectors from the thick restart
+        # followed by the vectors of the Lanczos subspace.
+        self.subspace = ritz_vectors.copy()
+
         # To be initialised by first call to __next__
-        self.lanczos_subspace = []
         self.alphas = []  # Diagonal matrix block of subspace matrix
         self.betas = []   # Side-diagonal matrix blocks of subspace matrix
         self.residual = guesses
         self.n_iter = 0
         self.n_applies = 0
 
+    @classmethod
+    def from_checkpoint(cls, matrix, guesses, checkpoint,
+                        explicit_symmetrisation=None, reorthogonalisation="full"):
+        """
+        Construct a LanczosIterator from the data stored in a checkpoint file,
+        such that the Krylov subspace can be further extended without
+        recomputing any matrix-vector products.
+
+        Parameters
+        ----------
+        matrix
+            Matrix to build the Krylov subspace
+        guesses : list
+            Guess vectors of the original run, used only as a template
+            for the layout of the vectors.
+        checkpoint : SolverCheckpoint
+            Checkpoint written by :py:func:`lanczos_iterations`
+        explicit_symmetrisation : optional
+            Explicit symmetrisation to use after orthogonalising the
+            subspace vectors.
+        reorthogonalisation : str, optional
+            Reorthogonalisation strategy ("full" or "partial")
+        """
+        if checkpoint.algorithm != "lanczos":
+            raise ValueError(f"Checkpoint {checkpoint.filename} has not been "
+                             "written by the lanczos solver.")
+        if isinstance(guesses, AmplitudeVector):
+            guesses = [guesses]
+        data = checkpoint.load("iterator")
+        subspace = checkpoint.load_vectors("subspace_vectors", guesses[0])
+        residual = checkpoint.load_vectors("subspace_residual", guesses[0])
+
+        n_restart = len(data["ritz_values"])
+        ret = cls(matrix, residual, ritz_vectors=subspace[:n_restart],
+                  ritz_values=data["ritz_values"],
+                  ritz_overlaps=data["ritz_overlaps"],
+                  explicit_symmetrisation=explicit_symmetrisation,
+                  reorthogonalisation=reorthogonalisation)
+        ret.subspace = subspace
+        ret.alphas = list(data["alphas"])
+        ret.betas = list(data["betas"])
+        ret.n_iter = data["n_iter"]
+        ret.n_applies = data["n_applies"]
+
+        # The orthogonality estimate is not stored, so make sure the
+        # first blocks after the restart are reorthogonalised
+        psi = ret.local_orthogonality
+        ret.omega = [np.full((ret.n_block, ret.n_block), psi)
+                     for _ in range(len(ret.alphas))]
+        ret.omega_previous = ret.omega[:-1]
+        ret.reorthogonalise_next = True
+        return ret
+
+    def write_checkpoint(self, checkpoint, n_unchanged=0):
+        """
+        Write the current Krylov subspace to a checkpoint. Of the subspace
+        vectors only the ones past the first `n_unchanged` are written.
+        """
+        n_block = self.n_block
+        checkpoint.algorithm = "lanczos"
+        checkpoint.store_vectors("subspace_vectors", self.subspace, n_unchanged)
+        checkpoint.store_vectors("subspace_residual", self.residual)
+        checkpoint.store("iterator", {
+            "n_iter": self.n_iter,
+            "n_applies": self.n_applies,
+            "alphas": np.array(self.alphas).reshape(-1, n_block, n_block),
+            "betas": np.array(self.betas).reshape(-1, n_block, n_block),
+            "ritz_values": self.ritz_values,
+            "ritz_overlaps": self.ritz_overlaps,
+        })
+
+    @property
+    def ritz_vectors(self):
+        """The Ritz vectors used for the thick restart"""
+        return self.subspace[:self.n_restart]
+
+    @property
+    def lanczos_subspace(self):
+        """The vectors spanning the Krylov subspace"""
+        return self.subspace[self.n_restart:]
+
+    @property
+    def local_orthogonality(self):
+        """
+        Level of orthogonality between the vectors of a new block and the
+        subspace right after an orthogonalisation
+        """
+        return np.finfo(float).eps * np.sqrt(self.n_problem)
+
+    def update_orthogonality_estimate(self, beta):
+        """
+        Advance the block ω-recurrence to the new Lanczos block v, which
+        is related to the current residual by ``r = v * beta``, and return
+        the largest estimated overlap between v and the previous blocks.
+        """
+        eps = np.finfo(float).eps
+        alphas, betas = self.alphas, self.betas
+        j = len(alphas) - 1  # Index of the current (last) block
+        zero = np.zeros((self.n_block, self.n_block))
+        anorm = max(np.linalg.norm(alpha, 2) for alpha in alphas)
+        if betas:
+            anorm += 2 * max(np.linalg.norm(b, 2) for b in betas)
+
+        def W(row, k):
+            return row[k] if 0 <= k < len(row) else zero
+
+        def B(k):  # Beta linking block k - 1 to block k
+            return betas[k - 1] if 0 < k <= len(betas) else zero
+
+        # W_{k,j+1} B_{j+1} = B_k W_{k-1,j} + α_k W_{k,j} + B_{k+1}^T W_{k+1,j}
+        #                     - W_{k,j} α_j - W_{k,j-1} B_j^T
+        omega, omega_prev = self.omega, self.omega_previous
+        omega_new = []
+        for k in range(j):
+            rhs = (B(k) @ W(omega, k - 1) + alphas[k] @ W(omega, k)
+                   + B(k + 1).T @ W(omega, k + 1) - W(omega, k) @ alphas[j]
+                   - W(omega_prev, k) @ B(j).T)
+            rhs += eps * anorm * np.where(rhs < 0, -1.0, 1.0)
+            omega_new.append(la.solve_triangular(beta, rhs.T, trans="T").T)
+        psi = self.local_orthogonality
+        omega_new.append(np.full((self.n_block, self.n_block), psi))
+        omega_new.append(np.eye(self.n_block))
+        self.omega_previous, self.omega = omega, omega_new
+        if j == 0:
+            return psi
+        return max(np.max(np.abs(w)) for w in omega_new[:j])
+
+    def reset_orthogonality_estimate(self):
+        """Reset the estimate after the last block has been reorthogonalised"""
+        psi = self.local_orthogonality
+        for w in self.omega[:-1]:
+            w[:] = psi
+
     def __iter__(self):
         return self
 
@@ -108,60 +272,71 @@ class LanczosIterator:
         if self.n_iter == 0:
             # Initialise Lanczos subspace
             v = self.ortho.orthogonalise(self.residual)
-            self.lanczos_subspace = v
-            r = evaluate(self.matrix @ v)
-            alpha = np.empty((self.n_block, self.n_block))
-            for p in range(self.n_block):
-                alpha[p, :] = v[p] @ r
+            self.subspace.extend(v)
+            r = AmplitudeVectorBlock.from_vectors(
+                evaluate(self.matrix @ v.to_list()))
+            alpha = v.dot(r)
 
             # r = r - v * alpha - Y * Sigma
             Sigma, Y = self.ritz_overlaps, self.ritz_vectors
-            r = [lincomb(np.hstack(([1], -alpha[:, p], -Sigma[:, p])),
-                         [r[p]] + v + Y, evaluate=True)
-                 for p in range(self.n_block)]
+            r = r - v.lincomb(alpha.T) - Y.lincomb(Sigma.T)
 
             # r = r - Y * Y'r (Full reorthogonalisation)
-            for p in range(self.n_block):
-                r[p] = self.ortho.orthogonalise_against(r[p], self.ritz_vectors)
+            r = self.ortho.orthogonalise_against(r, Y)
 
             self.residual = r
             self.n_iter = 1
             self.n_applies = self.n_block
             self.alphas = [alpha]  # Diagonal matrix block of subspace matrix
             self.betas = []        # Side-diagonal matrix blocks
+            self.omega = [np.eye(self.n_block)]
+            self.omega_previous = []
             return LanczosSubspace(self)
 
         # Iteration 1 and onwards:
-        q = self.lanczos_subspace[-self.n_block:]
+        q = self.subspace[-self.n_block:]
         v, beta = self.ortho.qr(self.residual)
         if np.linalg.norm(beta) < np.finfo(float).eps * self.n_problem:
             # No point to go on ... new vectors will be decoupled from old ones
             raise StopIteration()
 
+        if self.reorthogonalisation == "partial":
+            # Reorthogonalise if the estimated loss of orthogonality is
+            # too large and (to keep the ω-recurrence valid) in the
+            # following step as well
+            self.orthogonality_estimate = self.update_orthogonality_estimate(
+                beta)
+            tolerance = np.sqrt(np.finfo(float).eps)
+            if self.orthogonality_estimate > tolerance or \
+                    self.reorthogonalise_next:
+                self.reorthogonalise_next = not self.reorthogonalise_next
+                self.n_reorthogonalisations += 1
+                r = self.ortho.orthogonalise_against(self.residual,
+                                                     self.subspace)
+                v, beta = self.ortho.qr(r)
+                self.reset_orthogonality_estimate()
+
         # r = A * v - q * beta^T
         self.n_applies += self.n_block
-        r = self.matrix @ v
-        r = [lincomb(np.hstack(([1], -(beta.T)[:, p])), [r[p]] + q, evaluate=True)
-             for p in range(self.n_block)]
+        r = AmplitudeVectorBlock.from_vectors(evaluate(self.matrix @ v.to_list()))
+        r = r - q.lincomb(beta)
 
         # alpha = v^T * r
-        alpha = np.empty((self.n_block, self.n_block))
-        for p in range(self.n_block):
-            alpha[p, :] = v[p] @ r
+        alpha = v.dot(r)
 
         # r = r - v * alpha
-        r = [lincomb(np.hstack(([1], -alpha[:, p])), [r[p]] + v, evaluate=True)
-             for p in range(self.n_block)]
+        r = r - v.lincomb(alpha.T)
 
-        # Full reorthogonalisation
-        for p in range(self.n_block):
-            r[p] = self.ortho.orthogonalise_against(
-                r[p], self.lanczos_subspace + self.ritz_vectors
-            )
+        if self.reorthogonalisation == "full":
+            r = self.ortho.orthogonalise_against(r, self.subspace)
+        elif self.n_restart > 0:
+            # Partial reorthogonalisation: Only the Ritz vectors of the
+            # thick restart are projected out in every step
+            r = self.ortho.orthogonalise_against(r, self.ritz_vectors)
 
         # Commit results
         self.n_iter += 1
-        self.lanczos_subspace.extend(v)
+        self.subspace.extend(v)
         self.residual = r
         self.alphas.append(alpha)
         self.betas.append(beta)
@@ -182,9 +357,12 @@ class LanczosSubspace:
         self.alphas = iterator.alphas        # Diagonal blocks
         self.betas = iterator.betas          # Side-diagonal blocks
         self.n_applies = iterator.n_applies  # Number of applies
+        # Number of reorthogonalisations and estimated loss of orthogonality
+        self.n_reorthogonalisations = iterator.n_reorthogonalisations
+        self.orthogonality_estimate = iterator.orthogonality_estimate
 
-        # Combined set of subspace vectors
-        self.subspace = iterator.ritz_vectors + iterator.lanczos_subspace
+        # Combined set of subspace vectors (AmplitudeVectorBlock)
+        self.subspace = iterator.subspace[:]
 
     @property
     def subspace_matrix(self):
@@ -193,9 +371,8 @@ class LanczosSubspace:
         """
         # TODO Use sparse representation
 
-        n_k = len(self.__iterator.lanczos_subspace)
         n_restart = self.n_restart
-        n_ss = n_k + n_restart
+        n_ss = len(self.subspace)
         ritz_values = self.__iterator.ritz_values
         ritz_overlaps = self.__iterator.ritz_overlaps
 
@@ -219,8 +396,7 @@ class LanczosSubspace:
 
     @property
     def rayleigh_extension(self):
-        n_k = len(self.__iterator.lanczos_subspace)
-        n_ss = n_k + self.n_restart
+        n_ss = len(self.subspace)
         b = np.zeros((n_ss, self.n_block))
         for i in range(self.n_block):
             b[n_ss - self.n_block + i, i] = 1
@@ -233,29 +409,14 @@ class LanczosSubspace:
         (using the Lanczos relation).
         """
         r, T = self.residual, self.subspace_matrix
-        # b = self.rayleigh_extension; V = self.subspace
+        b = self.rayleigh_extension
         # Form AV  = V * T + r * b'
-        AV = []
-        for i in range(len(self.subspace)):
-            # Compute AV[:, i]
-            coefficients = []
-            vectors = []
-            for (j, v) in enumerate(self.subspace):
-                if T[j, i] != 0:
-                    coefficients.append(T[j, i])
-                    vectors.append(v)
-            if i >= len(self.subspace) - self.n_block:
-                ires = i - (len(self.subspace) - self.n_block)
-                coefficients.append(1)
-                vectors.append(r[ires])
-            AV.append(lincomb(np.array(coefficients), vectors, evaluate=True))
-        return AV
+        return self.subspace.lincomb(T.T) + r.lincomb(b)
 
     def check_orthogonality(self, tolerance=None):
         if tolerance is None:
             tolerance = self.n_problem * np.finfo(float).eps
-        orth = np.array([[SSi @ SSj for SSi in self.subspace]
-                         for SSj in self.subspace])
+        orth = self.subspace.dot(self.subspace)
         orth -= np.eye(len(self.subspace))
         orth = np.max(np.abs(orth))
         if orth > tolerance:
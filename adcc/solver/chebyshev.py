@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import sys
+import warnings
+import numpy as np
+import scipy.linalg as la
+
+from adcc import evaluate
+from adcc.AdcMatrix import AdcMatrixlike
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+from .common import select_eigenpairs
+from .lobpcg import block_gram, block_lincomb, orthonormalise
+from .LanczosIterator import LanczosIterator
+from .SolverStateBase import EigenSolverStateBase
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+class ChebyshevState(EigenSolverStateBase):
+    def __init__(self, matrix, guesses):
+        super().__init__(matrix)
+        self.residuals = None  # Current residuals (AmplitudeVectorBlock)
+        self.n_locked = 0      # Number of locked (converged) Ritz pairs
+        self.n_block = len(guesses)  # Block size
+        self.spectral_bounds = None  # Lower and upper spectral bound
+        self.filter_bounds = None    # Interval damped by the filter
+        self.algorithm = "chebyshev"
+
+
+def default_print(state, identifier, file=sys.stdout):
+    """
+    A default print function for the chebyshev callback
+    """
+    from adcc.timings import strtime, strtime_short
+
+    if identifier == "start" and state.n_iter == 0:
+        print("Niter n_act  max_residual  time  Ritz values",
+              file=file)
+    elif identifier == "next_iter":
+        time_iter = state.timer.current("iteration")
+        fmt = "{n_iter:3d}  {n_act:4d}  {residual:12.5g}  {tstr:5s}"
+        print(fmt.format(n_iter=state.n_iter, tstr=strtime_short(time_iter),
+                         n_act=state.n_block - state.n_locked,
+                         residual=np.max(state.residual_norms)),
+              "", state.eigenvalues[:7], file=file)
+    elif identifier == "is_converged":
+        soltime = state.timer.total("iteration")
+        print("=== Converged ===", file=file)
+        print("    Number of matrix applies:   ", state.n_applies, file=file)
+        print("    Total solver time:          ", strtime(soltime), file=file)
+
+
+def apply_matrix(matrix, vectors):
+    """Apply the matrix to all vectors of an AmplitudeVectorBlock"""
+    return AmplitudeVectorBlock.from_vectors(evaluate(matrix @ vectors.to_list()))
+
+
+def estimate_spectral_bounds(matrix, guess, n_steps=10):
+    """
+    Estimate the smallest and largest eigenvalue of the matrix from `n_steps`
+    Lanczos iterations started from the `guess` vector. The upper bound is
+    made safe by adding the norm of the Lanczos residual.
+    Returns the lower estimate, the upper bound and the number of applies.
+    """
+    if n_steps < 1:
+        raise ValueError("n_steps needs to be at least 1")
+    iterator = LanczosIterator(matrix, [guess])
+    try:
+        subspace = next(iterator)
+    except (StopIteration, la.LinAlgError):
+        raise ValueError("Cannot estimate the spectral bounds, since the "
+                         "guess vector does not span a Lanczos subspace "
+                         "(e.g. it is zero).")
+    for _ in range(1, n_steps):
+        try:
+            subspace = next(iterator)
+        except StopIteration:
+            # Invariant subspace found, the estimates are exact
+            break
+    rvals = la.eigvalsh(subspace.subspace_matrix)
+    residual_norm = np.max(subspace.residual.norms())
+    return rvals[0], rvals[-1] + residual_norm, subspace.n_applies
+
+
+def chebyshev_filter(matrix, vectors, degree, cutoff, upper, lower):
+    """
+    Apply a Chebyshev polynomial of the passed `degree`, which damps the
+    spectral interval ``[cutoff, upper]`` and amplifies the part of the
+    spectrum below `cutoff`, to a block of vectors. The polynomial is scaled
+    such that its value at the estimate `lower` of the lowest eigenvalue is
+    one, which avoids overflow for high degrees (Zhou, Saad, Tiago,
+    Chelikowsky, J. Comput. Phys. 219, 172 (2006)).
+    """
+    half_width = (upper - cutoff) / 2
+    centre = (upper + cutoff) / 2
+    sigma = half_width / (lower - centre)
+    tau = 2 / sigma
+
+    previous = vectors
+    current = (apply_matrix(matrix, vectors) - vectors * centre) \
+        * (sigma / half_width)
+    for _ in range(1, degree):
+        sigma_new = 1 / (tau - sigma)
+        new = (apply_matrix(matrix, current) - current * centre) \
+            * (2 * sigma_new / half_width) - previous * (sigma * sigma_new)
+        previous, current = current, new
+        sigma = sigma_new
+    return current
+
+
+def chebyshev_iterations(matrix, state, X, max_iter, n_ep, is_converged,
+                         callback=None, degree=8, n_lanczos=10,
+                         explicit_symmetrisation=None, lock_tol=None):
+    """Drive the Chebyshev-filtered subspace iterations
+
+    Parameters
+    ----------
+    matrix
+        Matrix to diagonalise
+    state
+        ChebyshevState to update
+    X : AmplitudeVectorBlock
+        Guess vectors
+    max_iter : int
+        Maximal number of filter and Rayleigh-Ritz cycles
+    n_ep : int
+        Number of eigenpairs to be computed
+    is_converged
+        Function to test for convergence
+    callback : callable, optional
+        Callback to run after each iteration
+    degree : int, optional
+        Degree of the Chebyshev filter polynomial
+    n_lanczos : int, optional
+        Number of Lanczos steps to estimate the spectral bounds
+    explicit_symmetrisation : optional
+        Explicit symmetrisation instance to apply to the filtered vectors
+    lock_tol : float or NoneType, optional
+        Tolerance on the l2 norm squared of the residual below which a Ritz
+        pair is locked, i.e. not filtered any more. Locked vectors still
+        take part in the Rayleigh-Ritz procedure.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    n_block = state.n_block
+    tolerance = 10 * n_block * np.finfo(float).eps
+
+    callback(state, "start")
+    state.timer.restart("iteration")
+
+    with state.timer.record("rayleigh_ritz"):
+        X = orthonormalise(X, tolerance)
+        if len(X) < n_block:
+            raise ValueError("The guess vectors are linearly dependent.")
+
+    with state.timer.record("spectral_bounds"):
+        # Started from an orthonormalised guess, which cannot be zero
+        lower, upper, n_applies = estimate_spectral_bounds(matrix, X[0],
+                                                           n_lanczos)
+        state.n_applies += n_applies
+        state.spectral_bounds = (lower, upper)
+
+    with state.timer.record("rayleigh_ritz"):
+        AX = apply_matrix(matrix, X)
+        state.n_applies += n_block
+        rvals, rvecs = la.eigh(X.dot(AX))
+        X, AX = X.lincomb(rvecs.T), AX.lincomb(rvecs.T)
+
+    locked = np.zeros(n_block, dtype=bool)
+    while state.n_iter < max_iter:
+        state.n_iter += 1
+
+        with state.timer.record("residuals"):
+            residuals = AX - X * rvals
+            residual_norms = residuals.rowwise_dot(residuals)
+            if lock_tol is not None:
+                locked = residual_norms < lock_tol
+                state.n_locked = np.count_nonzero(locked)
+
+            epair_mask = select_eigenpairs(rvals, n_ep, "SA")
+            state.eigenvalues = rvals[epair_mask]
+            state.residuals = residuals[epair_mask]
+            state.residual_norms = residual_norms[epair_mask]
+
+        callback(state, "next_iter")
+        state.timer.restart("iteration")
+        if is_converged(state):
+            state.eigenvectors = X[epair_mask].to_list()
+            state.converged = True
+            callback(state, "is_converged")
+            state.timer.stop("iteration")
+            return state
+
+        if state.n_iter == max_iter:
+            break
+
+        # Filter the unconverged vectors, damping the part of the spectrum
+        # above the largest Ritz value of the block
+        with state.timer.record("filter"):
+            active = np.nonzero(~locked)[0]
+            lower = min(lower, rvals[0])
+            cutoff = rvals[-1]
+            if cutoff >= upper:
+                cutoff = (rvals[-1] + upper) / 2
+            state.filter_bounds = (cutoff, upper)
+            Y = chebyshev_filter(matrix, X[active], degree, cutoff, upper,
+                                 lower)
+            state.n_applies += degree * len(active)
+            if explicit_symmetrisation:
+                explicit_symmetrisation.symmetrise(Y)
+
+        # Orthonormalise the filtered vectors against the locked ones
+        # and among each other
+        with state.timer.record("orthogonalisation"):
+            Xl, AXl = X[locked], AX[locked]
+            for _ in range(2):
+                Y = Y - Xl.lincomb(np.transpose(Xl.dot(Y)))
+            Y = orthonormalise(Y, tolerance)
+            if len(Y) < len(active):
+                warnings.warn(la.LinAlgWarning(
+                    "Chebyshev filter produced linearly dependent vectors. "
+                    "Try a lower filter degree."))
+
+        # Rayleigh-Ritz in the span of the locked and the filtered vectors
+        with state.timer.record("rayleigh_ritz"):
+            AY = apply_matrix(matrix, Y)
+            state.n_applies += len(Y)
+            Ass = block_gram([Xl, Y], [AXl, AY])
+            Ass = (Ass + Ass.T) / 2
+            rvals, rvecs = la.eigh(Ass)
+            rvals, rvecs = rvals[:n_block], rvecs[:, :n_block]
+            X = block_lincomb([Xl, Y], rvecs)
+            AX = block_lincomb([AXl, AY], rvecs)
+            locked = np.zeros(len(rvals), dtype=bool)
+
+    warnings.warn(la.LinAlgWarning(
+        f"Maximum number of iterations (== {max_iter}) "
+        "reached in chebyshev procedure."))
+    state.eigenvectors = X[epair_mask].to_list()
+    state.timer.stop("iteration")
+    state.converged = False
+    return state
+
+
+def chebyshev(matrix, guesses, n_ep=None, conv_tol=1e-9, which="SA",
+              max_iter=100, callback=None, degree=8, n_lanczos=10,
+              explicit_symmetrisation=IndexSymmetrisation,
+              lock_converged=False):
+    """Chebyshev-filtered subspace iteration for the lowest eigenpairs
+    of ADC problems
+
+    In each cycle the block of vectors is multiplied by a Chebyshev polynomial
+    of the matrix, which amplifies the wanted part of the spectrum, followed
+    by a single orthonormalisation and Rayleigh-Ritz procedure. Compared to
+    Davidson no growing subspace needs to be stored and orthogonalised and
+    the matrix is applied to the complete block at once.
+
+    Parameters
+    ----------
+    matrix
+        ADC matrix instance
+    guesses : list
+        Guess vectors (fixes also the block size, which should be somewhat
+        larger than `n_ep`)
+    n_ep : int or NoneType, optional
+        Number of eigenpairs to be computed
+    conv_tol : float, optional
+        Convergence tolerance on the l2 norm squared of residuals to consider
+        them converged
+    which : str, optional
+        Which eigenvectors to converge to. Only "SA" is supported.
+    max_iter : int, optional
+        Maximal number of filter cycles
+    callback : callable, optional
+        Callback to run after each iteration
+    degree : int, optional
+        Degree of the filter polynomial, i.e. number of matrix applies
+        per vector and cycle
+    n_lanczos : int, optional
+        Number of Lanczos steps used to estimate the spectral bounds
+    explicit_symmetrisation
+        Explicit symmetrisation to apply to the filtered vectors.
+        Allows to correct for loss of index or spin symmetries
+        (type or instance)
+    lock_converged : bool, optional
+        Lock eigenpairs as soon as they are converged, i.e. stop filtering
+        their vectors. Disabled by default.
+    """
+    if not isinstance(matrix, AdcMatrixlike):
+        raise TypeError("matrix is not of type AdcMatrixlike")
+    for guess in guesses:
+        if not isinstance(guess, AmplitudeVector):
+            raise TypeError("One of the guesses is not of type AmplitudeVector")
+    if which != "SA":
+        raise ValueError("The chebyshev solver only supports which='SA'")
+    if degree < 1:
+        raise ValueError("degree needs to be at least 1")
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    if n_ep is None:
+        n_ep = len(guesses)
+    elif n_ep > len(guesses):
+        raise ValueError("n_ep cannot exceed the number of guess vectors.")
+
+    def convergence_test(state):
+        state.residuals_converged = state.residual_norms < conv_tol
+        state.converged = np.all(state.residuals_converged)
+        return state.converged
+
+    if conv_tol < matrix.shape[1] * np.finfo(float).eps:
+        warnings.warn(la.LinAlgWarning(
+            "Convergence tolerance (== {:5.2g}) lower than "
+            "estimated maximal numerical accuracy (== {:5.2g}). "
+            "Convergence might be hard to achieve."
+            "".format(conv_tol, matrix.shape[1] * np.finfo(float).eps)
+        ))
+
+    state = ChebyshevState(matrix, guesses)
+    chebyshev_iterations(matrix, state,
+                         AmplitudeVectorBlock.from_vectors(guesses), max_iter,
+                         n_ep=n_ep, is_converged=convergence_test,
+                         callback=callback, degree=degree, n_lanczos=n_lanczos,
+                         explicit_symmetrisation=explicit_symmetrisation,
+                         lock_tol=conv_tol if lock_converged else None)
+    return state
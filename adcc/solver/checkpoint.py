@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import h5py
+import numpy as np
+
+from adcc.hdf5io import emplace_dict, extract_group
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+__all__ = ["SolverCheckpoint"]
+
+# Names of the groups containing the committed state, the state being
+# written and the previously committed state while swapping them
+COMMITTED = "committed"
+STAGING = "staging"
+PREVIOUS = "previous"
+
+
+class SolverCheckpoint:
+    def __init__(self, filename, mode="a"):
+        """
+        Checkpoint file for the state of an iterative solver.
+
+        Sets of subspace vectors are stored as one resizable HDF5 dataset per
+        block (one vector per row), such that vectors added in an iteration
+        can be appended without rewriting the data already on disk. Small
+        quantities (iteration counters, eigenvalues, projected matrices, ...)
+        are stored in groups.
+
+        All data stored by :py:meth:`store` and :py:meth:`store_vectors`
+        only becomes visible to :py:meth:`load` and :py:meth:`load_vectors`
+        once :py:meth:`flush` is called. The data is staged in a separate
+        group, which replaces the previously committed group by renaming
+        it. Each set of vectors is written into two alternating slots, such
+        that vectors referenced by the committed state are never
+        overwritten. A job killed at any point thus leaves the last
+        consistent state behind.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the HDF5 file
+        mode : str, optional
+            Mode used to open the file ("a" to create or append,
+            "r" to read an existing checkpoint)
+        """
+        self.filename = filename
+        self.h5f = h5py.File(filename, mode)
+        self.__staging = None
+        if mode != "r":
+            self.__recover()
+
+    def __recover(self):
+        """Restore a consistent layout after a job was killed during flush"""
+        h5f = self.h5f
+        if COMMITTED not in h5f:
+            if STAGING in h5f \
+                    and h5f[STAGING].attrs.get("complete", False):
+                h5f.move(STAGING, COMMITTED)
+            elif PREVIOUS in h5f:
+                h5f.move(PREVIOUS, COMMITTED)
+        for name in (STAGING, PREVIOUS):
+            if name in h5f:
+                del h5f[name]
+        h5f.flush()
+
+    @property
+    def __committed(self):
+        """The group containing the committed state"""
+        h5f = self.h5f
+        if COMMITTED in h5f:
+            return h5f[COMMITTED]
+        # A read-only checkpoint of a job killed during flush
+        if STAGING in h5f \
+                and h5f[STAGING].attrs.get("complete", False):
+            return h5f[STAGING]
+        if PREVIOUS in h5f:
+            return h5f[PREVIOUS]
+        raise KeyError(f"Checkpoint {self.filename} contains no state.")
+
+    def __committed_vectors(self, name):
+        """Return the slot and number of committed vectors stored as `name`"""
+        try:
+            attrs = self.__committed["vectors"][name].attrs
+            return attrs["slot"], attrs["n_vectors"]
+        except KeyError:
+            return None, 0
+
+    @property
+    def staging(self):
+        """The group to which the data of the current iteration is written"""
+        if self.__staging is None:
+            if STAGING in self.h5f:
+                del self.h5f[STAGING]
+            self.__staging = self.h5f.create_group(STAGING)
+            self.__staging.create_group("vectors")
+        return self.__staging
+
+    @property
+    def algorithm(self):
+        """The algorithm which has written this checkpoint"""
+        return self.h5f.attrs.get("algorithm", None)
+
+    @algorithm.setter
+    def algorithm(self, algorithm):
+        self.h5f.attrs["algorithm"] = algorithm
+
+    def store_vectors(self, name, block, n_unchanged=0):
+        """
+        Store the vectors of an AmplitudeVectorBlock.
+
+        Parameters
+        ----------
+        name : str
+            Name under which the vectors are stored
+        block : AmplitudeVectorBlock
+            Vectors to store
+        n_unchanged : int, optional
+            Number of leading vectors of the block, which have been stored
+            by a previous call and have not changed since. Only the remaining
+            vectors are written to disk, if this does not overwrite vectors
+            of the committed state. Otherwise all vectors are written
+            to the other slot.
+        """
+        slot, n_committed = self.__committed_vectors(name)
+        if slot is not None and any(
+            self.h5f[name][str(slot)][b].dtype != arr.dtype
+            for b, arr in block.data.items()
+        ):
+            n_unchanged = 0  # Precision changed, so all vectors are new
+        if slot is None or n_unchanged < n_committed:
+            # Fresh slot, which is not referenced by the committed state
+            slot = 0 if slot is None else 1 - slot
+            n_unchanged = 0
+        else:
+            n_unchanged = n_committed
+
+        group = self.h5f.require_group(name).require_group(str(slot))
+        for b, arr in block.data.items():
+            if b in group and group[b].dtype != arr.dtype:
+                del group[b]  # h5py would silently cast to the old dtype
+            if b not in group:
+                group.create_dataset(b, shape=arr.shape, dtype=arr.dtype,
+                                     maxshape=(None, arr.shape[1]),
+                                     chunks=(1, arr.shape[1]))
+            dset = group[b]
+            if dset.shape[0] < arr.shape[0]:
+                dset.resize(arr.shape[0], axis=0)
+            if arr.shape[0] > n_unchanged:
+                dset[n_unchanged:arr.shape[0]] = arr[n_unchanged:]
+        vectors = self.staging["vectors"]
+        if name in vectors:
+            del vectors[name]
+        index = vectors.create_group(name)
+        index.attrs["slot"] = slot
+        index.attrs["n_vectors"] = len(block)
+
+    def load_vectors(self, name, template):
+        """
+        Load vectors stored with :py:meth:`store_vectors` into an
+        AmplitudeVectorBlock using the passed AmplitudeVector `template`.
+        """
+        slot, n_vectors = self.__committed_vectors(name)
+        if slot is None:
+            raise KeyError(f"No vectors stored under '{name}' in the "
+                           f"checkpoint {self.filename}.")
+        group = self.h5f[name][str(slot)]
+        if sorted(group.keys()) != sorted(template.blocks_ph):
+            raise ValueError(f"Blocks of the vectors stored under '{name}' in "
+                             f"the checkpoint {self.filename} do not agree "
+                             "with the blocks of the problem.")
+        data = {}
+        row_sizes = AmplitudeVectorBlock(template).row_sizes
+        for b in template.blocks_ph:
+            dset = group[b]
+            if dset.shape[1] != row_sizes[b]:
+                raise ValueError(f"Size of block {b} stored under '{name}' "
+                                 f"in the checkpoint {self.filename} does not "
+                                 "agree with the size of the problem.")
+            data[b] = np.empty((n_vectors, dset.shape[1]), dtype=dset.dtype)
+            dset.read_direct(data[b], np.s_[:n_vectors])
+        return AmplitudeVectorBlock.from_data(template, data)
+
+    def store(self, name, dictionary):
+        """Store (and replace) a dictionary of small quantities"""
+        staging = self.staging
+        if name in staging:
+            del staging[name]
+        emplace_dict(dictionary, staging.create_group(name))
+
+    def load(self, name):
+        """Load a dictionary stored with :py:meth:`store`"""
+        return extract_group(self.__committed[name])
+
+    def flush(self):
+        """
+        Commit the data stored since the last call, such that it replaces
+        the previously committed state, and flush the file to disk.
+        """
+        if self.__staging is None:
+            self.h5f.flush()
+            return
+        h5f = self.h5f
+        staging = self.__staging
+
+        # Link the data not updated since the last commit into the staging
+        # group, such that the new committed state is complete
+        if COMMITTED in h5f:
+            committed = h5f[COMMITTED]
+            for key in committed:
+                if key not in staging:
+                    staging[key] = committed[key]
+            for key in committed["vectors"]:
+                if key not in staging["vectors"]:
+                    staging["vectors"][key] = committed["vectors"][key]
+        staging.attrs["complete"] = True
+        h5f.flush()
+
+        # Swap the staging group in
+        if COMMITTED in h5f:
+            h5f.move(COMMITTED, PREVIOUS)
+        h5f.move(STAGING, COMMITTED)
+        if PREVIOUS in h5f:
+            del h5f[PREVIOUS]
+        h5f.flush()
+        self.__staging = None
+
+    def close(self):
+        self.h5f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
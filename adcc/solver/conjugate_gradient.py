@@ -4,8 +4,11 @@ import numpy as np
 import scipy.linalg as la
 
 from adcc import copy, evaluate
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
 from ..functions import dot
+from .lobpcg import orthonormalise, svqb_coefficients
 from .preconditioner import PreconditionerIdentity
 from .explicit_symmetrisation import IndexSymmetrisation
 
@@ -27,7 +30,8 @@ def guess_from_rhs(matrix, rhs, previous_cgstate):
 
 
 class IterativeInverse:
-    def __init__(self, matrix, construct_guess=guess_from_rhs, **kwargs):
+    def __init__(self, matrix, construct_guess=guess_from_rhs, block=False,
+                 **kwargs):
         """Initialise an iterative inverse
 
         This object mimics to be the inverse of a passed matrix
@@ -38,9 +42,24 @@ class IterativeInverse:
         ----------
         matrix
             Matrix object
+        construct_guess : callable, optional
+            Function constructing the initial guess from the matrix,
+            the right-hand side and the state of the previous solve
+        block : bool, optional
+            Solve for a list of right-hand sides at once using
+            :py:func:`block_conjugate_gradient` instead of solving for
+            them one by one. The options `cg_type` and `deflation` are not
+            supported in this case.
+        **kwargs
+            Further arguments passed to the conjugate gradient solver
         """
+        if block:
+            for key in ("cg_type", "deflation"):
+                if kwargs.get(key) is not None:
+                    raise ValueError(f"{key} is not supported if block=True.")
         self.matrix = matrix
         self.kwargs = kwargs
+        self.block = block
         self.construct_guess = construct_guess
         self.cgstate = None
 
@@ -49,7 +68,15 @@ class IterativeInverse:
         return self.matrix.shape  # Inversion does not change the shape
 
     def __matmul__(self, x):
-        if isinstance(x, list):
+        if isinstance(x, list) and self.block:
+            # Solve for all right-hand sides at once using block CG
+            guess = self.construct_guess(self.matrix, x, self.cgstate)
+            if not isinstance(guess, list) or len(guess) != len(x):
+                guess = x
+            self.cgstate = block_conjugate_gradient(self.matrix, x, guess,
+                                                    **self.kwargs)
+            return self.cgstate.solution
+        elif isinstance(x, list):
             return [self.__matmul__(xi) for xi in x]
         else:
             guess = self.construct_guess(self.matrix,  x, self.cgstate)
@@ -58,6 +85,78 @@ class IterativeInverse:
             return self.cgstate.solution
 
 
+class DeflationSpace:
+    def __init__(self, matrix, vectors, matrix_products=None):
+        """Initialise a deflation space for deflated conjugate gradient
+
+        The deflation space is spanned by a small number of (approximate)
+        eigenvectors of the matrix, typically the excitation vectors from a
+        preceding eigenvalue calculation. These are exactly the directions
+        which slow down CG if the system is close to a resonance. Projecting
+        them out of the search directions (Saad, Yeung, Erhel, Guyomarc'h,
+        SIAM J. Sci. Comput. 21, 1909 (2000)) removes them from the problem.
+        The matrix is applied to the deflation vectors only once, such that
+        a deflation space can be recycled for a sequence of linear solves.
+
+        Parameters
+        ----------
+        matrix
+            Matrix object. Should be an ADC matrix.
+        vectors : list or AmplitudeVectorBlock or ExcitedStates
+            Vectors spanning the deflation space. If an object with an
+            `excitation_vector` attribute (e.g. :py:class:`ExcitedStates`)
+            is passed, its excitation vectors are used.
+        matrix_products : AmplitudeVectorBlock, optional
+            The products of the matrix with the `vectors` if already known.
+            In this case the `vectors` need to be orthonormal.
+        """
+        if hasattr(vectors, "excitation_vector"):
+            vectors = vectors.excitation_vector
+        if not isinstance(vectors, AmplitudeVectorBlock):
+            vectors = AmplitudeVectorBlock.from_vectors(vectors)
+        if matrix_products is None:
+            tolerance = 10 * len(vectors) * np.finfo(float).eps
+            vectors = orthonormalise(vectors, tolerance)
+            matrix_products = AmplitudeVectorBlock.from_vectors(
+                evaluate(matrix @ vectors.to_list()))
+        self.vectors = vectors                  # W (orthonormal)
+        self.matrix_products = matrix_products  # AW
+        self.n_applies = len(vectors)           # Matrix applies for AW
+
+        # E = W^T A W (symmetrised)
+        projected = vectors.dot(matrix_products)
+        self.projected_matrix = (projected + projected.T) / 2
+        self._lu = la.lu_factor(self.projected_matrix)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def shifted(self, shift):
+        """
+        Return the deflation space for the matrix shifted by ``shift``
+        (i.e. for ``matrix + shift * I``) without any additional applies
+        of the matrix.
+        """
+        ret = DeflationSpace(None, self.vectors,
+                             self.matrix_products + self.vectors * float(shift))
+        ret.n_applies = 0
+        return ret
+
+    def coarse_correction(self, residual):
+        """Return ``W E^{-1} W^T residual`` and its product with the matrix"""
+        coefficients = la.lu_solve(self._lu, self.vectors.dot(residual))
+        return (self.vectors.lincomb(coefficients),
+                self.matrix_products.lincomb(coefficients))
+
+    def project(self, vector):
+        """
+        Make a vector A-orthogonal to the deflation space, i.e. return
+        ``vector - W E^{-1} (AW)^T vector``.
+        """
+        coefficients = la.lu_solve(self._lu, self.matrix_products.dot(vector))
+        return evaluate(vector - self.vectors.lincomb(coefficients))
+
+
 class State:
     def __init__(self):
         self.solution = None       # Current approximation to the solution
@@ -68,6 +167,13 @@ class State:
         self.n_applies = 0         # Number of applies
 
 
+class BlockState(State):
+    def __init__(self):
+        super().__init__()
+        self.n_active = 0          # Number of unconverged right-hand sides
+        self.n_directions = 0      # Number of search directions (rank)
+
+
 def default_print(state, identifier, file=sys.stdout):
     if identifier == "start" and state.n_iter == 0:
         print("Niter residual_norm", file=file)
@@ -82,7 +188,8 @@ def default_print(state, identifier, file=sys.stdout):
 
 def conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
                        callback=None, Pinv=None, cg_type="polak_ribiere",
-                       explicit_symmetrisation=IndexSymmetrisation):
+                       explicit_symmetrisation=IndexSymmetrisation,
+                       raise_on_max_iter=True, deflation=None):
     """An implementation of the conjugate gradient algorithm.
 
     This algorithm implements the "flexible" conjugate gradient using the
@@ -113,6 +220,15 @@ def conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
     explicit_symmetrisation
         Explicit symmetrisation to perform during iteration to ensure
         obtaining an eigenvector with matching symmetry criteria.
+    raise_on_max_iter : bool
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead, which is useful
+        if only a fixed number of iterations should be performed (e.g.
+        for approximately solving correction equations).
+    deflation : DeflationSpace or list or ExcitedStates, optional
+        Approximate eigenvectors of the matrix to project out of the
+        search directions (deflated conjugate gradient). Pass a
+        :py:class:`DeflationSpace` to recycle it across several solves.
     """
     if callback is None:
         def callback(state, identifier):
@@ -138,17 +254,28 @@ def conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
         return state.converged
 
     state = State()
+    if deflation is not None and not isinstance(deflation, DeflationSpace):
+        deflation = DeflationSpace(matrix, deflation)
+        state.n_applies += deflation.n_applies
 
     # Initialise iterates
     state.solution = x0
     state.residual = evaluate(rhs - matrix @ state.solution)
     state.n_applies += 1
+    if deflation is not None:
+        # Solve exactly within the deflation space
+        correction, matrix_correction = \
+            deflation.coarse_correction(state.residual)
+        state.solution = evaluate(state.solution + correction)
+        state.residual = evaluate(state.residual - matrix_correction)
     state.residual_norm = np.sqrt(state.residual @ state.residual)
     pk = zk = Pinv @ state.residual
 
     if explicit_symmetrisation:
         # TODO Not sure this is the right spot ... also this syntax is ugly
         pk = explicit_symmetrisation.symmetrise(pk)
+    if deflation is not None:
+        pk = deflation.project(pk)
 
     callback(state, "start")
     while state.n_iter < max_iter:
@@ -175,6 +302,8 @@ def conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
             return state
 
         if state.n_iter == max_iter:
+            if not raise_on_max_iter:
+                return state
             raise la.LinAlgError("Maximum number of iterations (== "
                                  + str(max_iter) + " reached in conjugate "
                                  "gradient procedure.")
@@ -189,4 +318,159 @@ def conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
             bk = float(dot(zk, state.residual) / res_dot_zk)
         elif cg_type == "polak_ribiere":
             bk = float(dot(zk, (state.residual - residual_old)) / res_dot_zk)
-        pk = zk + bk * pk
+        if deflation is not None:
+            pk = deflation.project(zk) + bk * pk
+        else:
+            pk = zk + bk * pk
+
+
+def block_conjugate_gradient(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100,
+                             callback=None, Pinv=None,
+                             explicit_symmetrisation=IndexSymmetrisation,
+                             raise_on_max_iter=True, rank_tol=None):
+    """Block conjugate gradient algorithm for multiple right-hand sides.
+
+    Solves `matrix @ x = rhs` for all passed right-hand sides simultaneously,
+    such that the Krylov subspaces generated from all of them are shared
+    and the matrix is applied to the complete block of search directions
+    at once. The search directions are kept A-orthonormal, such that
+    directions becoming linearly dependent (e.g. since the right-hand sides
+    are related by symmetry) are dropped instead of causing a breakdown
+    (Dubrulle, Electron. Trans. Numer. Anal. 12, 216 (2001)). Right-hand
+    sides are removed from the block once they are converged.
+
+    Parameters
+    ----------
+    matrix
+        Matrix object. Should be an ADC matrix (symmetric positive definite).
+    rhs : list or AmplitudeVectorBlock
+        Right-hand sides
+    x0 : list or AmplitudeVectorBlock, optional
+        Initial guesses, one for each right-hand side. Defaults to zero
+        vectors.
+    conv_tol : float
+        Convergence tolerance on the l2 norm of residuals to consider
+        them converged.
+    max_iter : int
+        Maximum number of iterations
+    callback
+        Callback to call after each iteration
+    Pinv
+        Preconditioner to A, typically an estimate for A^{-1}
+    explicit_symmetrisation
+        Explicit symmetrisation to perform during iteration to ensure
+        obtaining solutions with matching symmetry criteria.
+    raise_on_max_iter : bool
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead.
+    rank_tol : float or NoneType
+        Relative tolerance below which search directions are considered
+        linearly dependent and dropped. Defaults to a small multiple
+        of the machine epsilon.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    if isinstance(rhs, AmplitudeVector):
+        rhs = [rhs]
+    if not isinstance(rhs, AmplitudeVectorBlock):
+        rhs = AmplitudeVectorBlock.from_vectors(rhs)
+    if x0 is None:
+        x0 = rhs * 0.0
+    if isinstance(x0, AmplitudeVector):
+        x0 = [x0]
+    if isinstance(x0, AmplitudeVectorBlock):
+        x0 = x0.copy()
+    else:
+        x0 = AmplitudeVectorBlock.from_vectors(x0)
+    if len(x0) != len(rhs):
+        raise ValueError("Number of guesses and right-hand sides need "
+                         "to agree.")
+    if rank_tol is None:
+        rank_tol = 10 * len(rhs) * np.finfo(float).eps
+
+    if Pinv is None:
+        Pinv = PreconditionerIdentity()
+    if Pinv is not None and isinstance(Pinv, type):
+        Pinv = Pinv(matrix)
+
+    def apply_matrix(vectors):
+        return AmplitudeVectorBlock.from_vectors(
+            evaluate(matrix @ vectors.to_list()))
+
+    def precondition(residuals):
+        ret = Pinv @ residuals
+        if isinstance(ret, list):
+            ret = AmplitudeVectorBlock.from_vectors(ret)
+        if explicit_symmetrisation:
+            ret = explicit_symmetrisation.symmetrise(ret)
+        return ret
+
+    def apply_matrix_to_directions(P):
+        # Drop linearly dependent directions before applying the matrix
+        P = P.lincomb(np.transpose(svqb_coefficients(P.dot(P), rank_tol)))
+        state.n_applies += len(P)
+        return P, apply_matrix(P)
+
+    def finalise(state, X, R):
+        state.solution = X.to_list()
+        state.residual = R.to_list()
+        return state
+
+    state = BlockState()
+
+    # Initialise iterates
+    X = x0
+    R = rhs - apply_matrix(X)
+    state.n_applies += len(X)
+    state.residual_norm = R.norms()
+    active = np.flatnonzero(state.residual_norm >= conv_tol)
+    state.n_active = len(active)
+
+    callback(state, "start")
+    if len(active) == 0:
+        state.converged = True
+        callback(state, "is_converged")
+        return finalise(state, X, R)
+
+    P, AP = apply_matrix_to_directions(precondition(R[active]))
+    while state.n_iter < max_iter:
+        state.n_iter += 1
+
+        # Make the search directions A-orthonormal, dropping linearly
+        # dependent directions (rank deflation)
+        coefficients = np.transpose(svqb_coefficients(P.dot(AP), rank_tol))
+        P = P.lincomb(coefficients)
+        AP = AP.lincomb(coefficients)
+        state.n_directions = len(P)
+
+        # Update solution and residual of the active systems
+        alpha = P.dot(R[active])
+        X[active] = X[active] + P.lincomb(alpha.T)
+        R[active] = R[active] - AP.lincomb(alpha.T)
+        state.residual_norm[active] = R[active].norms()
+
+        callback(state, "next_iter")
+        active = np.flatnonzero(state.residual_norm >= conv_tol)
+        state.n_active = len(active)
+        if len(active) == 0:
+            state.converged = True
+            callback(state, "is_converged")
+            return finalise(state, X, R)
+
+        if state.n_iter == max_iter:
+            if not raise_on_max_iter:
+                return finalise(state, X, R)
+            raise la.LinAlgError("Maximum number of iterations (== "
+                                 + str(max_iter) + " reached in block "
+                                 "conjugate gradient procedure.")
+
+        # New search directions, A-orthogonal to the previous ones
+        Z = precondition(R[active])
+        P, AP = apply_matrix_to_directions(
+            Z - P.lincomb(np.transpose(AP.dot(Z))))
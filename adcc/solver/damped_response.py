@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import sys
+import numpy as np
+import scipy.linalg as la
+
+from scipy import constants
+
+from adcc import evaluate
+from adcc.AdcMatrix import AdcMatrixlike
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+from .orthogonaliser import CholeskyQROrthogonaliser
+from .preconditioner import JacobiPreconditioner
+from .spectral_function import default_transition_moments
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+class DampedResponseState:
+    def __init__(self, frequencies, damping, n_components):
+        """Initialise a DampedResponseState.
+
+        Parameters
+        ----------
+        frequencies : numpy.ndarray
+            Frequencies (in atomic units) at which the response is computed
+        damping : float
+            Damping parameter γ (in atomic units)
+        n_components : int
+            Number of transition moment components
+        """
+        n_freq = len(frequencies)
+        self.frequencies = frequencies    # Frequencies of the response
+        self.damping = damping            # Damping parameter
+        self.polarisability = np.zeros((n_freq, n_components, n_components),
+                                       dtype=complex)
+        self.residual_norm = np.full(n_freq, np.inf)  # Max. residual norms
+        self.converged_frequencies = np.zeros(n_freq, dtype=bool)
+        self.converged = False            # Flag whether iteration is converged
+        self.n_iter = 0                   # Number of iterations
+        self.n_applies = 0                # Number of applies
+        self.subspace_size = 0            # Size of the shared subspace
+        self.n_restarts = 0               # Number of subspace collapses
+        self.algorithm = "damped_response"
+
+    @property
+    def isotropic_polarisability(self):
+        """Isotropic average of the complex polarisability"""
+        return np.trace(self.polarisability, axis1=1, axis2=2) \
+            / self.polarisability.shape[1]
+
+    @property
+    def cross_section(self):
+        """
+        One-photon absorption cross section (in atomic units) obtained
+        from the imaginary part of the isotropic polarisability
+        """
+        speed_of_light_au = 1 / constants.fine_structure
+        return 4 * np.pi * self.frequencies / speed_of_light_au \
+            * self.isotropic_polarisability.imag
+
+    def to_spectrum(self):
+        """
+        Return the absorption cross section as an
+        :class:`adcc.visualisation.Spectrum` (in atomic units).
+        """
+        from adcc.visualisation.Spectrum import Spectrum
+
+        sp = Spectrum(self.frequencies, self.cross_section)
+        sp.xlabel = "Energy (au)"
+        sp.ylabel = "Cross section (au)"
+        return sp
+
+
+def default_print(state, identifier, file=sys.stdout):
+    """
+    A default print function for the damped_response callback
+    """
+    if identifier == "start" and state.n_iter == 0:
+        print("Niter n_conv  n_ss  max_residual", file=file)
+    elif identifier == "next_iter":
+        active = ~state.converged_frequencies
+        residual = np.max(state.residual_norm[active]) if np.any(active) else 0
+        fmt = "{n_iter:3d}  {n_conv:5d}  {n_ss:4d}  {residual:12.5g}"
+        print(fmt.format(n_iter=state.n_iter,
+                         n_conv=np.sum(state.converged_frequencies),
+                         n_ss=state.subspace_size, residual=residual),
+              file=file)
+    elif identifier == "restart":
+        print("=== Restart ===", file=file)
+    elif identifier == "is_converged":
+        print("=== Converged ===", file=file)
+        print("    Number of matrix applies:   ", state.n_applies, file=file)
+
+
+def precondition_complex(residuals_real, residuals_imag, diagonal, shifts):
+    """
+    Apply the complex Jacobi preconditioner ``(D - z)^{-1}`` to the residuals
+    ``r = r_real + i r_imag``, where the (complex) shift `z` is different for
+    each residual. Returns the real and imaginary parts of the result.
+
+    Parameters
+    ----------
+    residuals_real : AmplitudeVectorBlock
+        Real parts of the residuals
+    residuals_imag : AmplitudeVectorBlock
+        Imaginary parts of the residuals
+    diagonal : dict
+        The diagonal of the matrix as a dictionary of flat arrays
+        (see :py:attr:`JacobiPreconditioner.dense_diagonal`).
+    shifts : numpy.ndarray
+        Complex shifts, one per residual
+    """
+    data_real, data_imag = {}, {}
+    for b in residuals_real.data:
+        rr, ri = residuals_real.data[b], residuals_imag.data[b]
+        a = diagonal[b] - shifts.real[:, None]
+        zi = shifts.imag[:, None]
+        denominator = a * a + zi * zi
+        # 1 / (a - i zi) = (a + i zi) / (a^2 + zi^2)
+        data_real[b] = (a * rr - zi * ri) / denominator
+        data_imag[b] = (a * ri + zi * rr) / denominator
+    return (AmplitudeVectorBlock.from_data(residuals_real.template, data_real),
+            AmplitudeVectorBlock.from_data(residuals_imag.template, data_imag))
+
+
+def orthonormal_columns(vectors):
+    """
+    Return an orthonormal basis for the span of the columns of the passed
+    2D array. The basis vectors are ordered by decreasing singular value
+    and numerically linearly dependent directions are dropped.
+    """
+    if vectors.shape[1] == 0:
+        return vectors
+    U, sigma, _ = la.svd(vectors, full_matrices=False)
+    cutoff = max(vectors.shape) * np.finfo(float).eps * sigma[0]
+    return U[:, sigma > cutoff]
+
+
+def damped_response(matrix, frequencies, damping=0.005,
+                    transition_moments=None, conv_tol=1e-4, max_iter=100,
+                    batch_size=10, max_subspace=None, callback=None,
+                    explicit_symmetrisation=IndexSymmetrisation,
+                    residual_min_norm=1e-6, raise_on_max_iter=True):
+    """Compute the complex polarisability (complex polarisation propagator)
+    at a set of frequencies by solving the damped response equations
+
+    .. math::
+
+        (M - z) x = μ, \\quad z = ±(ω + i γ)
+
+    for all transition moment components μ. Splitting ``x = x_R + i x_I``
+    yields the real 2×2 block system
+
+    .. math::
+
+        \\begin{pmatrix} M - ω & γ \\\\ -γ & M - ω \\end{pmatrix}
+        \\begin{pmatrix} x_R \\\\ x_I \\end{pmatrix}
+        = \\begin{pmatrix} μ \\\\ 0 \\end{pmatrix},
+
+    which only requires the application of the real ADC matrix to real
+    vectors. Real and imaginary parts of the solutions are expanded in a
+    single real subspace, which is shared by all frequencies and both
+    signs of z, such that the projected 2×2 problem reduces to a small
+    complex linear system for each frequency. The subspace is grown by the
+    real and imaginary parts of the preconditioned residuals. Frequencies
+    are treated in batches of `batch_size` consecutive frequencies, where
+    each batch starts from the subspace built by the previous batches.
+    The cost therefore scales with the number of frequencies and not with
+    the number of excited states below them.
+
+    The returned polarisability is
+    ``α_cd(ω) = μ_c^T (M - ω - iγ)^{-1} μ_d + μ_c^T (M + ω + iγ)^{-1} μ_d``,
+    whose imaginary part is the Lorentzian-broadened (half width at half
+    maximum γ) absorption spectrum.
+
+    Parameters
+    ----------
+    matrix
+        ADC matrix instance
+    frequencies : list or numpy.ndarray
+        Frequencies ω (in atomic units)
+    damping : float, optional
+        Damping parameter γ (in atomic units)
+    transition_moments : list, optional
+        Transition moment vectors μ. By default the modified transition
+        moments of the electric dipole operator are computed for the method
+        of the matrix (ADC(2) for ADC(3)).
+    conv_tol : float, optional
+        Convergence tolerance on the l2 norm of the complex residuals
+    max_iter : int, optional
+        Maximal number of iterations (summed over all batches)
+    batch_size : int, optional
+        Number of frequencies treated simultaneously
+    max_subspace : int or NoneType, optional
+        Maximal subspace size. If the subspace would grow beyond this size,
+        it is collapsed to the span of the transition moments and the
+        current solutions of the unconverged frequencies of the batch.
+        If this span is too large, only its dominant directions are kept,
+        such that at most half of the subspace is occupied after the
+        restart. Since each iteration adds up to ``4 * batch_size`` vectors
+        per transition moment, `max_subspace` should be a few times larger.
+        ``None`` disables the restart.
+    callback : callable, optional
+        Callback to run after each iteration
+    explicit_symmetrisation : optional
+        Explicit symmetrisation to apply to the new subspace vectors
+        (type or instance).
+    residual_min_norm : float, optional
+        Minimal norm of the part of a normalised preconditioned residual
+        orthogonal to the subspace for it to be added to the subspace
+    raise_on_max_iter : bool, optional
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead.
+    """
+    if not isinstance(matrix, AdcMatrixlike):
+        raise TypeError("matrix is not of type AdcMatrixlike")
+    if callback is None:
+        def callback(state, identifier):
+            pass
+    if damping <= 0:
+        raise ValueError("damping needs to be positive")
+    if transition_moments is None:
+        transition_moments = default_transition_moments(matrix)
+    if isinstance(transition_moments, AmplitudeVector):
+        transition_moments = [transition_moments]
+    for moment in transition_moments:
+        if not isinstance(moment, AmplitudeVector):
+            raise TypeError("One of the transition moments is not of type "
+                            "AmplitudeVector")
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+    ortho = CholeskyQROrthogonaliser(explicit_symmetrisation)
+    diagonal = JacobiPreconditioner(matrix).dense_diagonal
+
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    n_comp = len(transition_moments)
+    state = DampedResponseState(frequencies, damping, n_comp)
+
+    # The transition moments span the initial subspace
+    moments = AmplitudeVectorBlock.from_vectors(transition_moments)
+    SS = ortho.orthonormalise_against(moments, moments[:0], min_norm=0.0)
+    if len(SS) == 0:
+        raise ValueError("All transition moments are zero.")
+    Ax = AmplitudeVectorBlock.from_vectors(evaluate(matrix @ SS.to_list()))
+    state.n_applies += len(SS)
+    if max_subspace is not None and max_subspace < 2 * len(SS):
+        raise ValueError("max_subspace needs to be at least twice the number "
+                         "of linearly independent transition moments.")
+
+    # Projections of the matrix and the transition moments into the
+    # subspace, which are extended as the subspace grows
+    subspace_matrix = SS.dot(Ax)
+    subspace_matrix = (subspace_matrix + subspace_matrix.T) / 2
+    moments_ss = SS.dot(moments)
+
+    callback(state, "start")
+    for start in range(0, len(frequencies), batch_size):
+        batch = np.arange(start, min(start + batch_size, len(frequencies)))
+        while True:
+            # Projected problem, solved for all shifts through the
+            # eigendecomposition of the subspace matrix
+            rvals, rvecs = np.linalg.eigh(subspace_matrix)
+            moments_eig = rvecs.T @ moments_ss
+
+            active = batch[~state.converged_frequencies[batch]]
+            zs = frequencies[active] + 1j * damping
+            shifts = np.concatenate([zs, -zs])
+            coefficients = np.concatenate([
+                rvecs @ (moments_eig / (rvals[:, None] - z)) for z in shifts
+            ], axis=1)  # (n_ss, 2 * len(active) * n_comp)
+            shifts = np.repeat(shifts, n_comp)
+
+            # Polarisability from both signs of z
+            alphas = (moments_ss.T @ coefficients).reshape(n_comp, 2, -1,
+                                                           n_comp)
+            state.polarisability[active] = \
+                np.sum(alphas, axis=1).transpose(1, 0, 2)
+
+            # Residual (M - z) SS c - μ = Ax c - SS (z c + moments_ss)
+            rhs = np.tile(moments_ss, len(shifts) // n_comp)
+            sc = shifts[None, :] * coefficients + rhs
+            residuals_real = (Ax.lincomb(coefficients.real.T)
+                              - SS.lincomb(sc.real.T))
+            residuals_imag = (Ax.lincomb(coefficients.imag.T)
+                              - SS.lincomb(sc.imag.T))
+            residual_norms = np.sqrt(residuals_real.norms()**2
+                                     + residuals_imag.norms()**2)
+            per_frequency = residual_norms.reshape(2, len(active), n_comp)
+            state.residual_norm[active] = np.max(per_frequency, axis=(0, 2))
+            state.converged_frequencies[active] = \
+                state.residual_norm[active] < conv_tol
+            state.subspace_size = len(SS)
+
+            state.n_iter += 1
+            callback(state, "next_iter")
+            if np.all(state.converged_frequencies[batch]):
+                break
+            if state.n_iter >= max_iter:
+                if not raise_on_max_iter:
+                    return state
+                raise la.LinAlgError("Maximum number of iterations (== "
+                                     + str(max_iter) + " reached in damped "
+                                     "response procedure.")
+
+            # Extend the subspace by the preconditioned residuals
+            # of the unconverged frequencies
+            unconverged = ~np.tile(np.repeat(
+                state.converged_frequencies[active], n_comp), 2)
+            unconverged &= residual_norms >= conv_tol
+            preconds = precondition_complex(residuals_real[unconverged],
+                                            residuals_imag[unconverged],
+                                            diagonal, shifts[unconverged])
+            norms = np.concatenate([preconds[0].norms(), preconds[1].norms()])
+            norms[norms == 0] = 1
+            preconds = AmplitudeVectorBlock.from_data(SS.template, {
+                b: np.vstack([preconds[0].data[b], preconds[1].data[b]])
+                / norms[:, None] for b in SS.data
+            })
+            preconds = ortho.orthonormalise_against(preconds, SS,
+                                                    residual_min_norm)
+            if len(preconds) == 0:
+                raise la.LinAlgError("Damped response subspace cannot be "
+                                     "extended any further. Try lowering "
+                                     "residual_min_norm or conv_tol.")
+
+            if max_subspace is not None and \
+                    len(SS) + len(preconds) > max_subspace:
+                # Collapse the subspace to the span of the transition moments
+                # and the dominant directions of the current solutions. The
+                # new basis is orthonormal, since it is formed from
+                # orthonormal coefficient vectors. The preconditioned
+                # residuals are orthogonal to the old and hence also to the
+                # new subspace.
+                basis = orthonormal_columns(moments_ss)
+                still_unconverged = np.tile(np.repeat(
+                    ~state.converged_frequencies[active], n_comp), 2)
+                solutions = coefficients[:, still_unconverged]
+                solutions = np.hstack([solutions.real, solutions.imag])
+                solutions -= basis @ (basis.T @ solutions)
+                n_solution = max_subspace // 2 - basis.shape[1]
+                basis = np.hstack([
+                    basis, orthonormal_columns(solutions)[:, :n_solution]
+                ])
+
+                SS = SS.lincomb(basis.T)
+                Ax = Ax.lincomb(basis.T)
+                subspace_matrix = basis.T @ subspace_matrix @ basis
+                subspace_matrix = (subspace_matrix + subspace_matrix.T) / 2
+                moments_ss = basis.T @ moments_ss
+                SS.reserve(max_subspace)
+                Ax.reserve(max_subspace)
+                state.n_restarts += 1
+                callback(state, "restart")
+                preconds = preconds[:max_subspace - len(SS)]
+
+            Apreconds = AmplitudeVectorBlock.from_vectors(
+                evaluate(matrix @ preconds.to_list()))
+            state.n_applies += len(preconds)
+
+            # Extend the projections by the new subspace vectors
+            SS.extend(preconds)
+            Ax.extend(Apreconds)
+            n_new = len(preconds)
+            new_columns = SS.dot(Apreconds)
+            subspace_matrix = np.block([
+                [subspace_matrix, new_columns[:-n_new]],
+                [new_columns[:-n_new].T, np.zeros((n_new, n_new))]
+            ])
+            subspace_matrix[-n_new:, -n_new:] = \
+                (new_columns[-n_new:] + new_columns[-n_new:].T) / 2
+            moments_ss = np.vstack([moments_ss, preconds.dot(moments)])
+
+    state.converged = True
+    callback(state, "is_converged")
+    return state
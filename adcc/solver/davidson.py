@@ -21,16 +21,21 @@
 ##
 ## ---------------------------------------------------------------------
 import sys
+import tempfile
 import warnings
 import numpy as np
 import scipy.linalg as la
 import scipy.sparse.linalg as sla
 
-from adcc import evaluate, lincomb
+from adcc import evaluate
 from adcc.AdcMatrix import AdcMatrixlike
 from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
 from .common import select_eigenpairs
+from .checkpoint import SolverCheckpoint
+from .minres import minres
+from .orthogonaliser import CholeskyQROrthogonaliser
 from .preconditioner import JacobiPreconditioner
 from .SolverStateBase import EigenSolverStateBase
 from .explicit_symmetrisation import IndexSymmetrisation
@@ -39,10 +44,84 @@ from .explicit_symmetrisation import IndexSymmetrisation
 class DavidsonState(EigenSolverStateBase):
     def __init__(self, matrix, guesses):
         super().__init__(matrix)
-        self.residuals = None                   # Current residuals
-        self.subspace_vectors = guesses.copy()  # Current subspace vectors
+        self.residuals = None  # Current residuals (AmplitudeVectorBlock)
+        self.n_locked = 0      # Number of locked (converged) Ritz pairs
+        self.n_block = len(guesses)  # Davidson block size
+        self.restart_statistics = []  # Statistics for each subspace collapse
+        self.precision_switch_iter = None  # Iteration of switch to float64
+        # Current subspace vectors
+        self.subspace_vectors = AmplitudeVectorBlock.from_vectors(guesses)
+        # Matrix applied to the subspace vectors and the valid part of the
+        # projected matrix, only set when resuming from a checkpoint
+        self.subspace_products = None
+        self.subspace_matrix = None
+        self.previous_ritz_coefficients = None
+        self.retired = None  # Extra Ritz pairs no longer expanded
         self.algorithm = "davidson"
 
+    @classmethod
+    def from_checkpoint(cls, matrix, guesses, checkpoint):
+        """
+        Construct a DavidsonState from the data stored in a checkpoint
+        file, such that the iterations can be resumed without recomputing
+        any matrix-vector products.
+
+        Parameters
+        ----------
+        matrix
+            Matrix to diagonalise
+        guesses : list
+            Guess vectors of the original run, used only as a template
+            for the layout of the vectors.
+        checkpoint : SolverCheckpoint
+            Checkpoint written by :py:func:`davidson_iterations`
+        """
+        if checkpoint.algorithm != "davidson":
+            raise ValueError(f"Checkpoint {checkpoint.filename} has not been "
+                             "written by the davidson solver.")
+        data = checkpoint.load("state")
+        ret = cls(matrix, guesses[:1])
+        ret.n_iter = data["n_iter"]
+        ret.n_applies = data["n_applies"]
+        ret.n_block = data["n_block"]
+        ret.eigenvalues = data["eigenvalues"]
+        ret.subspace_matrix = data["subspace_matrix"]
+        ret.previous_ritz_coefficients = data.get("ritz_coefficients", None)
+        ret.retired = data.get("retired", None)
+        ret.precision_switch_iter = data.get("precision_switch_iter", None)
+        ret.subspace_vectors = checkpoint.load_vectors("subspace_vectors",
+                                                       guesses[0])
+        ret.subspace_products = checkpoint.load_vectors("subspace_products",
+                                                        guesses[0])
+        return ret
+
+
+def write_checkpoint(checkpoint, state, SS, Ax, Ass, n_unchanged=0,
+                     rvecs=None, retired=None):
+    """
+    Write the current Davidson subspace and the associated products and
+    counters to a checkpoint. Of the subspace vectors and the matrix-vector
+    products only the ones past the first `n_unchanged` are written.
+    `rvecs` are the coefficients of the current Ritz vectors and `retired`
+    the mask of the extra Ritz pairs, which are no longer expanded. Locked
+    pairs are not stored, since they are locked again after resuming
+    once their recomputed residuals are still converged.
+    """
+    checkpoint.algorithm = "davidson"
+    checkpoint.store_vectors("subspace_vectors", SS, n_unchanged)
+    checkpoint.store_vectors("subspace_products", Ax, n_unchanged)
+    checkpoint.store("state", {
+        "n_iter": state.n_iter,
+        "n_applies": state.n_applies,
+        "n_block": state.n_block,
+        "eigenvalues": state.eigenvalues,
+        "subspace_matrix": np.array(Ass),
+        "ritz_coefficients": rvecs,
+        "retired": retired,
+        "precision_switch_iter": state.precision_switch_iter,
+    })
+    checkpoint.flush()
+
 
 def default_print(state, identifier, file=sys.stdout):
     """
@@ -62,6 +141,8 @@ def default_print(state, identifier, file=sys.stdout):
                          ss_size=len(state.subspace_vectors),
                          residual=np.max(state.residual_norms)),
               "", state.eigenvalues[:7], file=file)
+        if state.n_locked > 0:
+            print(33 * " " + "locked: {:d}".format(state.n_locked), file=file)
         if hasattr(state, "subspace_orthogonality"):
             print(33 * " " + "nonorth: {:5.3g}"
                   "".format(state.subspace_orthogonality))
@@ -70,15 +151,210 @@ def default_print(state, identifier, file=sys.stdout):
         print("=== Converged ===", file=file)
         print("    Number of matrix applies:   ", state.n_applies, file=file)
         print("    Total solver time:          ", strtime(soltime), file=file)
+    elif identifier == "precision_switch":
+        print("=== Switching to double precision ===", file=file)
     elif identifier == "restart":
-        print("=== Restart ===", file=file)
+        stats = state.restart_statistics[-1]
+        print("=== Restart ===  n_ss {:d} -> {:d}  (Ritz: {:d}, previous: {:d})"
+              "".format(stats["subspace_size_before"],
+                        stats["subspace_size_after"], stats["n_ritz"],
+                        stats["n_previous"]), file=file)
+
+
+def harmonic_ritz_pairs(Ass, AxAx, target, n_pairs):
+    """
+    Harmonic Ritz extraction for the `n_pairs` eigenpairs closest to the
+    `target` from an orthonormal subspace ``V``. `Ass` is ``V^T A V`` and
+    `AxAx` is ``(A V)^T (A V)``. The harmonic Ritz vectors ``y`` are the
+    solutions of ``V^T (A - σ)^2 V y = ν V^T (A - σ) V y`` with the smallest
+    ``|ν|``, which (unlike the standard Ritz vectors) do not suffer from
+    spurious Ritz values close to an interior target ``σ``. Returns the
+    Rayleigh quotients and the normalised harmonic Ritz vectors ordered from
+    the closest to the farthest from the target.
+    """
+    n_ss = len(Ass)
+    shifted = Ass - target * np.eye(n_ss)
+    squared = AxAx - 2 * target * Ass + target**2 * np.eye(n_ss)
+
+    # Solve for μ = 1 / ν, since the squared matrix is positive definite
+    mu, hvecs = la.eigh(shifted, squared)
+    closest = np.argsort(-np.abs(mu), kind="stable")[:n_pairs]
+    hvecs = hvecs[:, closest] / np.linalg.norm(hvecs[:, closest], axis=0)
+    rvals = np.einsum("ij,ik,kj->j", hvecs, Ass, hvecs)
+    return rvals, hvecs
+
+
+def restart_coefficients(Ass, rvecs, rvecs_prev, n_ritz, n_previous, which,
+                         tolerance=np.sqrt(np.finfo(float).eps), AxAx=None,
+                         target=None):
+    """
+    Return the coefficients (in the current subspace basis) of an orthonormal
+    set of vectors to keep when collapsing the Davidson subspace. The first
+    columns span the current Ritz vectors `rvecs`, followed by further Ritz
+    vectors up to a total of `n_ritz` (thick restart) and the components
+    of up to `n_previous` Ritz vectors of the previous iteration `rvecs_prev`
+    not contained in the current Ritz vectors (GD+k restart). If a `target`
+    is given, the further Ritz vectors are harmonic Ritz vectors, see
+    :py:func:`harmonic_ritz_pairs`.
+    Returns the coefficients and the number of kept previous directions.
+    """
+    n_ss, n_block = rvecs.shape
+    candidates = [rvecs]
+    if n_ritz > n_block and target is not None:
+        _, fvecs = harmonic_ritz_pairs(Ass, AxAx, target, n_ritz)
+        candidates.append(fvecs[:, n_block:])
+    elif n_ritz > n_block:
+        # Additional Ritz vectors beyond the ones in rvecs
+        fvals, fvecs = la.eigh(Ass)
+        extra = np.setdiff1d(select_eigenpairs(fvals, n_ritz, which),
+                             select_eigenpairs(fvals, n_block, which))
+        candidates.append(fvecs[:, extra])
+    n_prev_cand = 0
+    if n_previous > 0 and rvecs_prev is not None:
+        n_prev_cand = min(n_previous, rvecs_prev.shape[1])
+        prev = np.zeros((n_ss, n_prev_cand))
+        prev[:rvecs_prev.shape[0]] = rvecs_prev[:, :n_prev_cand]
+        candidates.append(prev)
+    candidates = np.hstack(candidates)[:, :n_ss]
+    if candidates.shape[1] == n_block and target is None:
+        return rvecs, 0
+
+    # Orthonormalise the candidates keeping the Ritz vectors first
+    # and drop the linearly dependent ones
+    Q, R = np.linalg.qr(candidates)
+    diagR = np.diag(R)
+    keep = np.abs(diagR) > tolerance
+    keep[:n_block] = True
+    # Make sure Q[:, :n_block] = rvecs for orthonormal Ritz vectors
+    Q = Q * np.where(diagR < 0, -1.0, 1.0)
+    n_prev_kept = 0
+    if n_prev_cand > 0:
+        n_prev_kept = int(np.count_nonzero(keep[-n_prev_cand:]))
+    return Q[:, keep], n_prev_kept
+
+
+def select_expansion(active, epair_mask, residual_norms, retired,
+                     max_expansion=None):
+    """
+    Select the Ritz pairs, which contribute a new subspace vector in this
+    iteration. Of the `active` (i.e. unlocked) pairs the wanted ones (in
+    `epair_mask`) are taken first, ordered from the worst- to the best-
+    converged, followed by the extra pairs beyond the wanted ones, which
+    are not yet `retired`. At most `max_expansion` pairs are selected.
+    Extra pairs, which are not selected, should be retired by the caller,
+    since they stopped contributing to the subspace.
+    """
+    if max_expansion is None:
+        return active
+    is_wanted = np.isin(active, epair_mask)
+    wanted = active[is_wanted]
+    extra = active[~is_wanted & ~retired[active]]
+    wanted = wanted[np.argsort(-residual_norms[wanted], kind="stable")]
+    extra = extra[np.argsort(-residual_norms[extra], kind="stable")]
+    return np.concatenate((wanted, extra))[:max(1, max_expansion)]
+
+
+class ProjectedShiftedMatrix:
+    def __init__(self, matrix, vector, shift):
+        """
+        Matrix ``(1 - u u^T) (A - σ) (1 - u u^T)`` of the Jacobi-Davidson
+        correction equation, where ``A`` is the passed matrix, ``σ`` the
+        shift and ``u`` a normalised vector.
+        """
+        self.matrix = matrix
+        self.vector = vector
+        self.shift = shift
+        self.shape = matrix.shape
+
+    def project(self, x):
+        return x - (self.vector @ x) * self.vector
+
+    def __matmul__(self, x):
+        x = evaluate(self.project(x))
+        return evaluate(self.project(self.matrix @ x - self.shift * x))
+
+
+class ProjectedPreconditioner:
+    def __init__(self, preconditioner, vector):
+        """
+        Inverse of the projected preconditioner ``(1 - u u^T) M (1 - u u^T)``
+        restricted to the space orthogonal to the normalised vector ``u``,
+        i.e. ``M^{-1} - M^{-1} u (u^T M^{-1} u)^{-1} u^T M^{-1}``.
+        """
+        self.preconditioner = preconditioner
+        self.vector = vector
+        self.Pu = evaluate(preconditioner @ vector)
+        self.uPu = vector @ self.Pu
+
+    def __matmul__(self, x):
+        Px = evaluate(self.preconditioner @ x)
+        return evaluate(Px - (self.vector @ Px) / self.uPu * self.Pu)
+
+
+def olsen_correction(preconditioner, residuals, ritz_vectors):
+    """
+    Form the Olsen corrections ``M^{-1} r - ε M^{-1} u`` for a block of
+    residuals ``r`` and Ritz vectors ``u``, where ``ε`` is chosen such that
+    the correction is orthogonal to the Ritz vector and ``M^{-1}`` is
+    the preconditioner.
+    """
+    Pr = preconditioner @ residuals
+    Pu = preconditioner @ ritz_vectors
+    epsilon = Pr.rowwise_dot(ritz_vectors) / Pu.rowwise_dot(ritz_vectors)
+    return Pr - Pu * epsilon
+
+
+def jacobi_davidson_correction(matrix, preconditioner, residuals, ritz_vectors,
+                               ritz_values, max_iter,
+                               explicit_symmetrisation=None):
+    """
+    Approximately solve the Jacobi-Davidson correction equation
+    ``(1 - u u^T) (A - θ) (1 - u u^T) t = -r`` with ``t`` orthogonal to ``u``
+    for each residual ``r`` and Ritz pair ``(θ, u)`` using `max_iter`
+    iterations of preconditioned MINRES, started from the Olsen correction.
+    Since ``θ`` lies inside the spectrum of ``A`` for all but the lowest
+    Ritz pair, the projected matrix is indefinite and conjugate gradient
+    is not applicable. MINRES requires a positive-definite preconditioner,
+    such that a Jacobi-type preconditioner is applied with the absolute
+    values of the shifted diagonal. Returns the corrections and the number
+    of matrix applies.
+    """
+    absolute = getattr(preconditioner, "absolute", None)
+    if absolute is not None:
+        preconditioner.absolute = True
+
+    corrections = []
+    n_applies = 0
+    try:
+        for i, rval in enumerate(ritz_values):
+            u = ritz_vectors[i]
+            if hasattr(preconditioner, "update_shifts"):
+                preconditioner.update_shifts(float(rval))
+            Pinv = ProjectedPreconditioner(preconditioner, u)
+            rhs = -1.0 * residuals[i]
+            mrstate = minres(
+                ProjectedShiftedMatrix(matrix, u, rval), rhs, x0=Pinv @ rhs,
+                conv_tol=0.1 * np.sqrt(rhs @ rhs), max_iter=max_iter,
+                Pinv=Pinv, explicit_symmetrisation=explicit_symmetrisation,
+                raise_on_max_iter=False
+            )
+            corrections.append(mrstate.solution)
+            n_applies += mrstate.n_applies
+    finally:
+        if absolute is not None:
+            preconditioner.absolute = absolute
+    return AmplitudeVectorBlock.from_vectors(corrections), n_applies
 
 
 # TODO This function should be merged with eigsh
 def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
                         is_converged, which, callback=None, preconditioner=None,
                         preconditioning_method="Davidson", debug_checks=False,
-                        residual_min_norm=None, explicit_symmetrisation=None):
+                        residual_min_norm=None, explicit_symmetrisation=None,
+                        correction_max_iter=3, lock_tol=None, checkpoint=None,
+                        max_memory=None, scratch_dir=None, n_restart_ritz=None,
+                        n_restart_previous=0, max_expansion=None,
+                        mixed_precision_tol=None, target=None):
     """Drive the davidson iterations
 
     Parameters
@@ -103,8 +379,10 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
     preconditioner
         Preconditioner (type or instance)
     preconditioning_method : str, optional
-        Precondititoning method. Valid values are "Davidson"
-        or "Sleijpen-van-der-Vorst"
+        Precondititoning method. Valid values are "Davidson" (preconditioned
+        residuals), "Olsen" (Olsen correction) or "Jacobi-Davidson"
+        (also "Sleijpen-van-der-Vorst", approximate solution of the
+        Jacobi-Davidson correction equation)
     debug_checks : bool, optional
         Enable some potentially costly debug checks
         (Loss of orthogonality etc.)
@@ -116,13 +394,67 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
         Explicit symmetrisation to apply to new subspace vectors before
         adding them to the subspace. Allows to correct for loss of index
         or spin symmetries (type or instance)
+    correction_max_iter : int, optional
+        Number of MINRES iterations used to solve the
+        Jacobi-Davidson correction equation for each Ritz pair
+    lock_tol : float or NoneType, optional
+        Tolerance on the l2 norm squared of the residual below which a Ritz
+        pair is locked. The residuals of locked Ritz pairs are no longer
+        recomputed and they no longer contribute new subspace vectors, such
+        that the block effectively shrinks to the unconverged Ritz pairs.
+        A locked pair is released again if its Ritz value moves by more
+        than the residual norm at locking, which indicates that the root
+        it tracked has changed. ``None`` disables locking.
+    checkpoint : SolverCheckpoint or NoneType, optional
+        Checkpoint to which the subspace, the matrix-vector products and the
+        projected matrix are written after each iteration. Only the vectors
+        added in an iteration are appended to the file.
+    max_memory : int or NoneType, optional
+        Memory budget (in bytes) for the subspace vectors and the matrix-vector
+        products. If both do not fit into the budget at the maximal subspace
+        size, they are stored in memory-mapped scratch files and streamed in
+        chunks for projections and collapses. ``None`` keeps all in memory.
+    scratch_dir : str or NoneType, optional
+        Directory for the scratch files (defaults to the system's temporary
+        directory)
+    n_restart_ritz : int or NoneType, optional
+        Number of Ritz vectors kept when the subspace is collapsed (thick
+        restart). Defaults to the block size.
+    n_restart_previous : int, optional
+        Number of Ritz vectors of the previous iteration, which are kept in
+        addition when the subspace is collapsed (GD+k restart). These preserve
+        the curvature information of the discarded subspace. Defaults to 0,
+        i.e. the GD+k restart is disabled. The number is reduced if it
+        does not leave space for a block of new vectors after the restart.
+    max_expansion : int or NoneType, optional
+        Maximal number of new subspace vectors per iteration, i.e. the budget
+        of matrix applies per iteration. See :py:func:`select_expansion` for
+        how the contributing Ritz pairs are selected. ``None`` lets all
+        unlocked Ritz pairs contribute.
+    mixed_precision_tol : float or NoneType, optional
+        If not None, the subspace vectors and matrix-vector products are
+        stored in single precision (and projections, linear combinations and
+        orthogonalisations are done in single precision) until the maximal
+        residual norm (squared) of the wanted eigenpairs drops below this
+        value. The solver then restarts in double precision from the
+        current Ritz vectors and recomputes the Ritz pairs and residuals
+        within the same iteration. ``None`` uses double precision throughout.
+    target : float or NoneType, optional
+        If not None, the eigenpairs closest to this value are computed
+        using a harmonic Ritz extraction (see :py:func:`harmonic_ritz_pairs`)
+        instead of the ones selected by `which`.
     """
-    if preconditioning_method not in ["Davidson", "Sleijpen-van-der-Vorst"]:
-        raise ValueError("Only 'Davidson' and 'Sleijpen-van-der-Vorst' "
-                         "are valid preconditioner methods")
     if preconditioning_method == "Sleijpen-van-der-Vorst":
-        raise NotImplementedError("Sleijpen-van-der-Vorst preconditioning "
-                                  "not yet implemented.")
+        preconditioning_method = "Jacobi-Davidson"
+    if preconditioning_method not in ["Davidson", "Olsen", "Jacobi-Davidson"]:
+        raise ValueError("Only 'Davidson', 'Olsen', 'Jacobi-Davidson' and "
+                         "'Sleijpen-van-der-Vorst' are valid preconditioner "
+                         "methods")
+    if preconditioning_method != "Davidson" and not preconditioner:
+        raise ValueError(f"Preconditioning method {preconditioning_method} "
+                         "requires a preconditioner.")
+    if preconditioning_method == "Jacobi-Davidson" and correction_max_iter < 1:
+        raise ValueError("correction_max_iter needs to be at least 1")
 
     if callback is None:
         def callback(state, identifier):
@@ -131,31 +463,111 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
     # The problem size
     n_problem = matrix.shape[1]
 
+    # The current subspace, stored block-contiguously such that projections
+    # and linear combinations are matrix-matrix products
+    SS = state.subspace_vectors
+    if not isinstance(SS, AmplitudeVectorBlock):
+        SS = AmplitudeVectorBlock.from_vectors(SS)
+
+    # Storage for the subspace vectors and the matrix-vector products.
+    # If they exceed the memory budget they are spilled to scratch files
+    # and streamed in chunks using at most a quarter of the budget.
+    storage = {"capacity": max_subspace}
+    vector_bytes = SS.nbytes // len(SS)
+    if max_memory is not None and 2 * max_subspace * vector_bytes > max_memory:
+        storage["scratch_dir"] = scratch_dir or tempfile.gettempdir()
+        storage["chunk_size"] = max(1, max_memory // (4 * vector_bytes))
+
+    # Use single-precision subspace vectors in the early iterations
+    if mixed_precision_tol is not None and state.precision_switch_iter is None:
+        storage["dtype"] = np.float32
+
+    def allocate_subspace(vectors):
+        ret = AmplitudeVectorBlock(SS.template, **storage)
+        ret.extend(vectors)
+        return ret
+
+    SS = allocate_subspace(SS)
+    state.subspace_vectors = SS
+
     # The block size
-    n_block = len(state.subspace_vectors)
+    n_block = state.n_block
 
     # The current subspace size
-    n_ss_vec = n_block
-
-    # The current subspace
-    SS = state.subspace_vectors
+    n_ss_vec = len(SS)
+    if n_ss_vec > max_subspace:
+        raise ValueError(f"Subspace size (== {n_ss_vec}) exceeds max_subspace "
+                         f"(== {max_subspace}).")
 
     # The matrix A projected into the subspace
     # as a continuous array. Only the view
     # Ass[:n_ss_vec, :n_ss_vec] contains valid data.
     Ass_cont = np.empty((max_subspace, max_subspace))
 
+    # For the harmonic Ritz extraction additionally the Gram matrix
+    # of the matrix-vector products Ax^T Ax (valid in the same view)
+    if target is not None:
+        AxAx_cont = np.empty((max_subspace, max_subspace))
+
     eps = np.finfo(float).eps
     if residual_min_norm is None:
         residual_min_norm = 2 * n_problem * eps
+    ortho = CholeskyQROrthogonaliser(explicit_symmetrisation)
 
     callback(state, "start")
     state.timer.restart("iteration")
 
-    with state.timer.record("projection"):
-        # Initial application of A to the subspace
-        Ax = evaluate(matrix @ SS)
-        state.n_applies += n_ss_vec
+    if state.subspace_products is not None:
+        # Resume from a checkpoint, i.e. the matrix-vector products and
+        # (part of) the projected matrix are already known
+        Ax = allocate_subspace(state.subspace_products)
+        n_ss_valid = len(state.subspace_matrix)
+        Ass_cont[:n_ss_valid, :n_ss_valid] = state.subspace_matrix
+        state.subspace_products = state.subspace_matrix = None
+        if target is not None:
+            AxAx_cont[:n_ss_valid, :n_ss_valid] = \
+                Ax[:n_ss_valid].dot(Ax[:n_ss_valid])
+    else:
+        with state.timer.record("projection"):
+            # Initial application of A to the subspace
+            Ax = allocate_subspace(evaluate(matrix @ SS.to_list()))
+            state.n_applies += n_ss_vec
+        n_ss_valid = 0
+        if checkpoint:
+            write_checkpoint(checkpoint, state, SS, Ax, Ass_cont[:0, :0])
+
+    # Number of subspace vectors, for which the projection
+    # of A into the subspace is not yet known
+    n_ss_new = n_ss_vec - n_ss_valid
+
+    # Number of subspace vectors, which are unchanged since the last checkpoint
+    n_ss_stored = 0
+
+    # Number of vectors kept on a restart, which need to leave space
+    # for at least one block of new vectors
+    n_max_keep = max(n_block, max_subspace - n_block)
+    n_restart_ritz = min(max(n_block, n_restart_ritz or n_block), n_max_keep)
+    if n_restart_previous < 0:
+        raise ValueError("n_restart_previous needs to be non-negative")
+    n_restart_previous = min(n_restart_previous, n_max_keep - n_restart_ritz)
+
+    # Ritz vectors of the previous iteration (in the subspace basis)
+    rvecs_prev = state.previous_ritz_coefficients
+    state.previous_ritz_coefficients = None
+
+    # Locking status, residuals and residual norms of all Ritz pairs.
+    # For locked pairs these are the values at the time of locking.
+    locked = np.zeros(n_block, dtype=bool)
+    locked_rvals = np.zeros(n_block)
+    retired = np.zeros(n_block, dtype=bool)  # Extra roots not expanded any more
+    residuals = None
+    residual_norms = np.zeros(n_block)
+    if state.retired is not None:
+        # Resume with the extra pairs retired in the checkpoint. Pairs
+        # locked before are locked again in the first iteration, once their
+        # residuals have been recomputed and found to be still converged.
+        retired[:] = state.retired
+        state.retired = None
 
     while state.n_iter < max_iter:
         state.n_iter += 1
@@ -164,55 +576,132 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
         assert len(SS) <= max_subspace
 
         # Project A onto the subspace, keeping in mind
-        # that the values Ass[:-n_block, :-n_block] are already valid,
+        # that the values Ass[:-n_ss_new, :-n_ss_new] are already valid,
         # since they have been computed in the previous iterations already.
         with state.timer.record("projection"):
             Ass = Ass_cont[:n_ss_vec, :n_ss_vec]  # Increase the work view size
-            for i in range(n_block):
-                Ass[:, -n_block + i] = Ax[-n_block + i] @ SS
-            Ass[-n_block:, :] = np.transpose(Ass[:, -n_block:])
+            if n_ss_new > 0:
+                Ass[:, -n_ss_new:] = SS.dot(Ax[-n_ss_new:])
+                Ass[-n_ss_new:, :] = np.transpose(Ass[:, -n_ss_new:])
+            if target is not None:
+                AxAx = AxAx_cont[:n_ss_vec, :n_ss_vec]
+                if n_ss_new > 0:
+                    AxAx[:, -n_ss_new:] = Ax.dot(Ax[-n_ss_new:])
+                    AxAx[-n_ss_new:, :] = np.transpose(AxAx[:, -n_ss_new:])
 
         # Compute the which(== largest, smallest, ...) eigenpair of Ass
-        # and the associated ritz vector as well as residual
-        with state.timer.record("rayleigh_ritz"):
-            if Ass.shape == (n_block, n_block):
-                rvals, rvecs = la.eigh(Ass)  # Do a full diagonalisation
-            else:
-                # TODO Maybe play with precision a little here
-                # TODO Maybe use previous vectors somehow
-                v0 = None
-                rvals, rvecs = sla.eigsh(Ass, k=n_block, which=which, v0=v0)
-
-        with state.timer.record("residuals"):
-            # Form residuals, A * SS * v - λ * SS * v = Ax * v + SS * (-λ*v)
-            def form_residual(rval, rvec):
-                coefficients = np.hstack((rvec, -rval * rvec))
-                return lincomb(coefficients, Ax + SS, evaluate=True)
-            residuals = [form_residual(rvals[i], v)
-                         for i, v in enumerate(np.transpose(rvecs))]
-            assert len(residuals) == n_block
-
-            # Update the state's eigenpairs and residuals
-            epair_mask = select_eigenpairs(rvals, n_ep, which)
-            state.eigenvalues = rvals[epair_mask]
-            state.residuals = [residuals[i] for i in epair_mask]
-            state.residual_norms = np.array([r @ r for r in state.residuals])
-            # TODO This is misleading ... actually residual_norms contains
-            #      the norms squared. That's also the used e.g. in adcman to
-            #      check for convergence, so using the norm squared is fine,
-            #      in theory ... it should just be consistent. I think it is
-            #      better to go for the actual norm (no squared) inside the code
-            #
-            #      If this adapted, also change the conv_tol to tol conversion
-            #      inside the Lanczos procedure.
+        # and the associated ritz vector as well as residual. After a switch
+        # to double precision both are recomputed within the same iteration.
+        while True:
+            with state.timer.record("rayleigh_ritz"):
+                if target is not None:
+                    # Harmonic Ritz pairs ordered by the Rayleigh quotient
+                    rvals, rvecs = harmonic_ritz_pairs(Ass, AxAx, target, n_block)
+                    order = np.argsort(rvals)
+                    rvals, rvecs = rvals[order], rvecs[:, order]
+                elif Ass.shape == (n_block, n_block):
+                    rvals, rvecs = la.eigh(Ass)  # Do a full diagonalisation
+                else:
+                    # TODO Maybe play with precision a little here
+                    # TODO Maybe use previous vectors somehow
+                    v0 = None
+                    rvals, rvecs = sla.eigsh(Ass, k=n_block, which=which, v0=v0)
+
+            with state.timer.record("residuals"):
+                # Release locked pairs whose Ritz value moved further than
+                # the residual norm at locking, i.e. the root has changed
+                if lock_tol is not None:
+                    locked &= (np.abs(rvals - locked_rvals)
+                               <= np.sqrt(residual_norms))
+                active = np.nonzero(~locked)[0]
+
+                # Form residuals of the unlocked Ritz pairs,
+                # A * SS * v - λ * SS * v = Ax * v + SS * (-λ*v)
+                rvecs_active = rvecs[:, active]
+                residuals_active = (
+                    Ax.lincomb(np.transpose(rvecs_active))
+                    - SS.lincomb(np.transpose(rvecs_active * rvals[active]))
+                )
+                if residuals is None:
+                    residuals = residuals_active
+                else:
+                    residuals[active] = residuals_active
+                residual_norms[active] = residuals_active.rowwise_dot(
+                    residuals_active)
+                assert len(residuals) == n_block
+
+                # Lock converged Ritz pairs
+                if lock_tol is not None:
+                    newly_locked = active[residual_norms[active] < lock_tol]
+                    locked[newly_locked] = True
+                    locked_rvals[newly_locked] = rvals[newly_locked]
+                    active = np.nonzero(~locked)[0]
+                    state.n_locked = np.count_nonzero(locked)
+
+                # Update the state's eigenpairs and residuals
+                if target is not None:
+                    epair_mask = select_eigenpairs(rvals - target, n_ep, "SM")
+                else:
+                    epair_mask = select_eigenpairs(rvals, n_ep, which)
+                state.eigenvalues = rvals[epair_mask]
+                state.residuals = residuals[epair_mask]
+                state.residual_norms = residual_norms[epair_mask]
+                # TODO This is misleading ... actually residual_norms contains
+                #      the norms squared. That's also the used e.g. in adcman to
+                #      check for convergence, so using the norm squared is fine,
+                #      in theory ... it should just be consistent. I think it is
+                #      better to go for the actual norm (no squared) inside the code
+                #
+                #      If this adapted, also change the conv_tol to tol conversion
+                #      inside the Lanczos procedure.
+
+                # Select the Ritz pairs, which contribute new subspace vectors
+                expand = select_expansion(active, epair_mask, residual_norms,
+                                          retired, max_expansion)
+                not_expanded = np.setdiff1d(active, expand)
+                retired[np.setdiff1d(not_expanded, epair_mask)] = True
+
+                if preconditioning_method != "Davidson":
+                    # Ritz vectors of the expanded pairs for the correction
+                    ritz_vectors = SS.lincomb(np.transpose(rvecs[:, expand]))
+
+            if storage.get("dtype", np.float64) == np.float64 or \
+                    np.max(state.residual_norms) >= mixed_precision_tol:
+                break
+
+            # Switch to double precision: Restart from the current Ritz
+            # vectors, which are orthonormalised and to which the matrix is
+            # applied again in double precision. The Ritz vectors accumulated
+            # in single precision may be nearly dependent, which the shifted
+            # CholeskyQR takes care of.
+            with state.timer.record("projection"):
+                storage["dtype"] = np.float64
+                ritz = SS.lincomb(np.transpose(rvecs)).astype(np.float64)
+                SS = allocate_subspace(ortho.cholesky_qr(ritz)[0])
+                state.subspace_vectors = SS
+                Ax = allocate_subspace(evaluate(matrix @ SS.to_list()))
+                state.n_applies += n_block
+                n_ss_vec = len(SS)
+                Ass = Ass_cont[:n_ss_vec, :n_ss_vec]
+                Ass[:] = SS.dot(Ax)
+                if target is not None:
+                    AxAx = AxAx_cont[:n_ss_vec, :n_ss_vec]
+                    AxAx[:] = Ax.dot(Ax)
+                n_ss_new = 0
+                n_ss_stored = 0
+                rvecs_prev = None
+                residuals = None
+                locked[:] = False
+            state.precision_switch_iter = state.n_iter
+            callback(state, "precision_switch")
 
         callback(state, "next_iter")
         state.timer.restart("iteration")
+
         if is_converged(state):
             # Build the eigenvectors we desire from the subspace vectors:
-            state.eigenvectors = [lincomb(v, SS, evaluate=True)
-                                  for i, v in enumerate(np.transpose(rvecs))
-                                  if i in epair_mask]
+            state.eigenvectors = SS.lincomb(
+                np.transpose(rvecs[:, epair_mask])).to_list()
 
             state.converged = True
             callback(state, "is_converged")
@@ -223,44 +712,81 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
             warnings.warn(la.LinAlgWarning(
                 f"Maximum number of iterations (== {max_iter}) "
                 "reached in davidson procedure."))
-            state.eigenvectors = [lincomb(v, SS, evaluate=True)
-                                  for i, v in enumerate(np.transpose(rvecs))
-                                  if i in epair_mask]
+            state.eigenvectors = SS.lincomb(
+                np.transpose(rvecs[:, epair_mask])).to_list()
             state.timer.stop("iteration")
             state.converged = False
             return state
 
-        if n_ss_vec + n_block > max_subspace:
-            callback(state, "restart")
+        if n_ss_vec + len(expand) > max_subspace:
             with state.timer.record("projection"):
                 # The addition of the preconditioned vectors goes beyond max.
                 # subspace size => Collapse first, ie keep current Ritz vectors
-                # as new subspace
-                SS = [lincomb(v, SS, evaluate=True) for v in np.transpose(rvecs)]
+                # (plus further Ritz vectors and the previous iteration's
+                # Ritz vectors if requested) as new subspace
+                coefficients, n_prev_kept = restart_coefficients(
+                    Ass, rvecs, rvecs_prev, n_restart_ritz, n_restart_previous,
+                    which, AxAx=AxAx if target is not None else None,
+                    target=target
+                )
+                n_ss_before = n_ss_vec
+                SS = allocate_subspace(SS.lincomb(np.transpose(coefficients)))
                 state.subspace_vectors = SS
-                Ax = [lincomb(v, Ax, evaluate=True) for v in np.transpose(rvecs)]
+                Ax = allocate_subspace(Ax.lincomb(np.transpose(coefficients)))
                 n_ss_vec = len(SS)
 
                 # Update projection of ADC matrix A onto subspace
                 Ass = Ass_cont[:n_ss_vec, :n_ss_vec]
-                for i in range(n_ss_vec):
-                    Ass[:, i] = Ax[i] @ SS
+                Ass[:] = SS.dot(Ax)
+                if target is not None:
+                    AxAx = AxAx_cont[:n_ss_vec, :n_ss_vec]
+                    AxAx[:] = Ax.dot(Ax)
+                n_ss_stored = 0
+
+                # Express the current Ritz vectors in the new subspace basis
+                # (for standard Ritz vectors these are the first basis vectors)
+                rvecs = np.transpose(coefficients) @ rvecs
+            state.restart_statistics.append({
+                "n_iter": state.n_iter,
+                "n_applies": state.n_applies,
+                "subspace_size_before": n_ss_before,
+                "subspace_size_after": n_ss_vec,
+                "n_ritz": n_ss_vec - n_prev_kept,
+                "n_previous": n_prev_kept,
+                "max_residual_norm": float(np.max(state.residual_norms)),
+            })
+            callback(state, "restart")
             # continue to add residuals to space
+        rvecs_prev = rvecs
 
         with state.timer.record("preconditioner"):
             if preconditioner:
+                # Epsilon factor to make sure that 1 / (shift - diagonal)
+                # does not become ill-conditioned as soon as the shift
+                # approaches the actual diagonal values (which are the
+                # eigenvalues for the ADC(2) doubles part if the coupling
+                # block are absent)
+                rvals_eps = 1e-6
                 if hasattr(preconditioner, "update_shifts"):
-                    # Epsilon factor to make sure that 1 / (shift - diagonal)
-                    # does not become ill-conditioned as soon as the shift
-                    # approaches the actual diagonal values (which are the
-                    # eigenvalues for the ADC(2) doubles part if the coupling
-                    # block are absent)
-                    rvals_eps = 1e-6
-                    preconditioner.update_shifts(rvals - rvals_eps)
-
-                preconds = evaluate(preconditioner @ residuals)
+                    preconditioner.update_shifts(rvals[expand] - rvals_eps)
+
+                if preconditioning_method == "Davidson":
+                    preconds = preconditioner @ residuals[expand]
+                    if not isinstance(preconds, AmplitudeVectorBlock):
+                        preconds = AmplitudeVectorBlock.from_vectors(
+                            evaluate(preconds))
+                elif preconditioning_method == "Olsen":
+                    preconds = olsen_correction(preconditioner,
+                                                residuals[expand], ritz_vectors)
+                elif preconditioning_method == "Jacobi-Davidson":
+                    preconds, n_applies = jacobi_davidson_correction(
+                        matrix, preconditioner, residuals[expand],
+                        ritz_vectors, rvals[expand] - rvals_eps,
+                        correction_max_iter, explicit_symmetrisation
+                    )
+                    state.n_applies += n_applies
             else:
-                preconds = residuals
+                preconds = residuals[expand]
 
             # Explicitly symmetrise the new vectors if requested
             if explicit_symmetrisation:
@@ -270,24 +796,18 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
         # which are already contained in the subspace.
         # Then add those, which have a significant norm to the subspace.
         with state.timer.record("orthogonalisation"):
-            n_ss_added = 0
-            for i in range(n_block):
-                pvec = preconds[i]
-                # Project out the components of the current subspace
-                # That is form (1 - SS * SS^T) * pvec = pvec + SS * (-SS^T * pvec)
-                coefficients = np.hstack(([1], -(pvec @ SS)))
-                pvec = lincomb(coefficients, [pvec] + SS, evaluate=True)
-                pnorm = np.sqrt(pvec @ pvec)
-                if pnorm > residual_min_norm:
-                    # Extend the subspace
-                    SS.append(evaluate(pvec / pnorm))
-                    n_ss_added += 1
-                    n_ss_vec = len(SS)
+            # Form (1 - SS * SS^T) * P for all preconditioned vectors P
+            # at once and orthonormalise them by CholeskyQR2, dropping
+            # the vectors with a norm below residual_min_norm
+            preconds = ortho.orthonormalise_against(preconds, SS,
+                                                    residual_min_norm)
+            n_ss_added = len(preconds)
+            if n_ss_added > 0:
+                SS.extend(preconds)
+                n_ss_vec = len(SS)
 
             if debug_checks:
-                orth = np.array([[SS[i] @ SS[j] for i in range(n_ss_vec)]
-                                 for j in range(n_ss_vec)])
-                orth -= np.eye(n_ss_vec)
+                orth = SS.dot(SS) - np.eye(n_ss_vec)
                 state.subspace_orthogonality = np.max(np.abs(orth))
                 if state.subspace_orthogonality > n_problem * eps:
                     warnings.warn(la.LinAlgWarning(
@@ -298,9 +818,8 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
         if n_ss_added == 0:
             state.timer.stop("iteration")
             state.converged = False
-            state.eigenvectors = [lincomb(v, SS, evaluate=True)
-                                  for i, v in enumerate(np.transpose(rvecs))
-                                  if i in epair_mask]
+            state.eigenvectors = SS.lincomb(
+                np.transpose(rvecs[:, epair_mask])).to_list()
             warnings.warn(la.LinAlgWarning(
                 "Davidson procedure could not generate any further vectors for "
                 "the subspace. Iteration cannot be continued like this and will "
@@ -308,15 +827,29 @@ def davidson_iterations(matrix, state, max_subspace, max_iter, n_ep,
             return state
 
         with state.timer.record("projection"):
-            Ax.extend(matrix @ SS[-n_ss_added:])
+            Ax.extend(evaluate(matrix @ SS[-n_ss_added:].to_list()))
             state.n_applies += n_ss_added
+            n_ss_new = n_ss_added
+
+        if checkpoint:
+            with state.timer.record("checkpoint"):
+                n_ss_valid = n_ss_vec - n_ss_new
+                write_checkpoint(checkpoint, state, SS, Ax,
+                                 Ass_cont[:n_ss_valid, :n_ss_valid],
+                                 n_unchanged=n_ss_stored, rvecs=rvecs_prev,
+                                 retired=retired)
+                n_ss_stored = n_ss_vec
 
 
 def eigsh(matrix, guesses, n_ep=None, max_subspace=None,
           conv_tol=1e-9, which="SA", max_iter=70,
           callback=None, preconditioner=None,
           preconditioning_method="Davidson", debug_checks=False,
-          residual_min_norm=None, explicit_symmetrisation=IndexSymmetrisation):
+          residual_min_norm=None, explicit_symmetrisation=IndexSymmetrisation,
+          lock_converged=False, checkpoint=None, restart_from=None,
+          max_memory=None, scratch_dir=None, correction_max_iter=3,
+          n_restart_ritz=None, n_restart_previous=0, max_expansion=None,
+          mixed_precision_tol=None, target=None):
     """Davidson eigensolver for ADC problems
 
     Parameters
@@ -341,8 +874,8 @@ def eigsh(matrix, guesses, n_ep=None, max_subspace=None,
     preconditioner
         Preconditioner (type or instance)
     preconditioning_method : str, optional
-        Precondititoning method. Valid values are "Davidson"
-        or "Sleijpen-van-der-Vorst"
+        Precondititoning method. Valid values are "Davidson", "Olsen"
+        or "Jacobi-Davidson" (also "Sleijpen-van-der-Vorst")
     explicit_symmetrisation
         Explicit symmetrisation to apply to new subspace vectors before
         adding them to the subspace. Allows to correct for loss of index
@@ -354,6 +887,44 @@ def eigsh(matrix, guesses, n_ep=None, max_subspace=None,
         Minimal norm a residual needs to have in order to be accepted as
         a new subspace vector
         (defaults to 2 * len(matrix) * machine_expsilon)
+    lock_converged : bool, optional
+        Lock eigenpairs as soon as they are converged, i.e. stop computing
+        their residuals and stop extending the subspace in their direction.
+        Since the residuals of locked pairs are not updated any more, they
+        may grow beyond `conv_tol` unnoticed as the subspace changes.
+        Disabled by default.
+    checkpoint : str or SolverCheckpoint or NoneType, optional
+        HDF5 file to which the solver state is written after each iteration
+    restart_from : str or SolverCheckpoint or NoneType, optional
+        HDF5 checkpoint file from which a previous run is resumed. The
+        `guesses` only serve as a template for the vector layout in this case.
+    max_memory : int or NoneType, optional
+        Memory budget (in bytes) for the subspace vectors and matrix-vector
+        products, beyond which they are stored in memory-mapped scratch files
+    scratch_dir : str or NoneType, optional
+        Directory for the scratch files (defaults to the system's temporary
+        directory)
+    correction_max_iter : int, optional
+        Number of inner iterations for the Jacobi-Davidson correction equation
+    n_restart_ritz : int or NoneType, optional
+        Number of Ritz vectors kept on a subspace collapse (thick restart,
+        defaults to the block size)
+    n_restart_previous : int, optional
+        Number of previous-iteration Ritz vectors additionally kept on a
+        subspace collapse (GD+k restart, defaults to 0, i.e. disabled)
+    max_expansion : int or NoneType, optional
+        Maximal number of new subspace vectors per iteration. Only the worst
+        converged wanted eigenpairs contribute, and the extra pairs beyond
+        `n_ep` are only used as long as the budget is not exhausted by the
+        wanted pairs. ``None`` expands with all unconverged pairs.
+    mixed_precision_tol : float or NoneType, optional
+        Residual norm (squared) down to which the subspace is kept in single
+        precision, before the solver switches to double precision
+        (e.g. 1e-4). ``None`` uses double precision throughout.
+    target : float or NoneType, optional
+        Compute the eigenpairs closest to this value (e.g. an excitation
+        energy in a core or Rydberg region) using a harmonic Ritz extraction.
+        If set, `which` is ignored.
     """
     if not isinstance(matrix, AdcMatrixlike):
         raise TypeError("matrix is not of type AdcMatrixlike")
@@ -390,21 +961,50 @@ def eigsh(matrix, guesses, n_ep=None, max_subspace=None,
             "".format(conv_tol, matrix.shape[1] * np.finfo(float).eps)
         ))
 
-    state = DavidsonState(matrix, guesses)
-    davidson_iterations(matrix, state, max_subspace, max_iter,
-                        n_ep=n_ep, is_converged=convergence_test,
-                        callback=callback, which=which,
-                        preconditioner=preconditioner,
-                        preconditioning_method=preconditioning_method,
-                        debug_checks=debug_checks,
-                        residual_min_norm=residual_min_norm,
-                        explicit_symmetrisation=explicit_symmetrisation)
+    if restart_from is None:
+        state = DavidsonState(matrix, guesses)
+    elif isinstance(restart_from, SolverCheckpoint):
+        state = DavidsonState.from_checkpoint(matrix, guesses, restart_from)
+    else:
+        with SolverCheckpoint(restart_from, "r") as restart_checkpoint:
+            state = DavidsonState.from_checkpoint(matrix, guesses,
+                                                  restart_checkpoint)
+    if restart_from is not None and state.n_block < n_ep:
+        raise ValueError("n_ep cannot exceed the block size of the "
+                         "restarted solver.")
+
+    close_checkpoint = False
+    if checkpoint is not None and not isinstance(checkpoint, SolverCheckpoint):
+        checkpoint = SolverCheckpoint(checkpoint)
+        close_checkpoint = True
+
+    try:
+        davidson_iterations(matrix, state, max_subspace, max_iter,
+                            n_ep=n_ep, is_converged=convergence_test,
+                            callback=callback, which=which,
+                            preconditioner=preconditioner,
+                            preconditioning_method=preconditioning_method,
+                            debug_checks=debug_checks,
+                            residual_min_norm=residual_min_norm,
+                            explicit_symmetrisation=explicit_symmetrisation,
+                            lock_tol=conv_tol if lock_converged else None,
+                            checkpoint=checkpoint, max_memory=max_memory,
+                            scratch_dir=scratch_dir,
+                            correction_max_iter=correction_max_iter,
+                            n_restart_ritz=n_restart_ritz,
+                            n_restart_previous=n_restart_previous,
+                            max_expansion=max_expansion,
+                            mixed_precision_tol=mixed_precision_tol,
+                            target=target)
+    finally:
+        if close_checkpoint:
+            checkpoint.close()
     return state
 
 
 def jacobi_davidson(*args, **kwargs):
-    return eigsh(*args, preconditioner=JacobiPreconditioner,
-                 preconditioning_method="Davidson", **kwargs)
+    kwargs.setdefault("preconditioning_method", "Davidson")
+    return eigsh(*args, preconditioner=JacobiPreconditioner, **kwargs)
 
 
 def davidson(*args, **kwargs):
@@ -20,10 +20,13 @@
 ## along with adcc. If not, see <http://www.gnu.org/licenses/>.
 ##
 ## ---------------------------------------------------------------------
+import numpy as np
+
 from libadcc import amplitude_vector_enforce_spin_kind
 
 from adcc import evaluate
 from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
 # TODO
 #    This interface is not that great and leads to duplicate information
@@ -50,13 +53,24 @@ class IndexSymmetrisation():
         """
         Symmetrise a set of new vectors to be added to the subspace.
 
-        new_vectors          Vectors to symmetrise (updated in-place)
+        new_vectors          Vectors to symmetrise (list of AmplitudeVector
+                             or AmplitudeVectorBlock, updated in-place)
 
         Returns:
             The updated new_vectors
         """
         if isinstance(new_vectors, AmplitudeVector):
             return self.symmetrise([new_vectors])[0]
+        if isinstance(new_vectors, AmplitudeVectorBlock):
+            # The index antisymmetry of the doubles is built into the packed
+            # storage of an AmplitudeVectorBlock, such that only blocks stored
+            # without packing need to be symmetrised on the tensors.
+            if any(not new_vectors.antisymmetric_pairs[b]
+                   for b in self.symmetrisation_functions
+                   if b in new_vectors.shapes):
+                for i, vec in enumerate(new_vectors):
+                    new_vectors[i] = IndexSymmetrisation.symmetrise(self, vec)
+            return new_vectors
         for vec in new_vectors:
             if not isinstance(vec, AmplitudeVector):
                 raise TypeError("new_vectors has to be an "
@@ -76,10 +90,66 @@ class IndexSpinSymmetrisation(IndexSymmetrisation):
     def __init__(self, matrix, enforce_spin_kind="singlet"):
         super().__init__(matrix)
         self.enforce_spin_kind = enforce_spin_kind
+        self.matrix = matrix
+        self.__singlet_positions = None
+
+    def singlet_positions(self, block):
+        """
+        Return the positions (and signs) of the elements in the packed doubles
+        rows of an AmplitudeVectorBlock, which are needed to enforce singlet
+        spin on the rows: Each unique alpha-alpha-alpha-alpha element and its
+        beta-beta-beta-beta image are replaced by the sum of the corresponding
+        alpha-beta-alpha-beta and alpha-beta-beta-alpha elements, as done by
+        libadcc's amplitude_vector_enforce_spin_kind on the tensors.
+        """
+        if self.__singlet_positions is not None:
+            return self.__singlet_positions
+
+        mospaces = self.matrix.mospaces
+        spaces = self.matrix.axis_spaces["pphh"]
+        n_alpha = [mospaces.n_orbs_alpha(sp) for sp in spaces]
+        if any(mospaces.n_orbs(sp) != 2 * n for sp, n in zip(spaces, n_alpha)):
+            raise ValueError("Singlet spin can only be enforced for "
+                             "restricted references.")
+
+        # Unique alpha-alpha-alpha-alpha elements
+        i, j, a, b = np.meshgrid(*[np.arange(n) for n in n_alpha],
+                                 indexing="ij")
+        unique = np.ones(i.shape, dtype=bool)
+        index = (i, j, a, b)
+        for p, q in block.antisymmetric_pairs["pphh"]:
+            unique &= index[p] < index[q]
+        i, j, a, b = (ix[unique] for ix in index)
+        n0, n1, n2, n3 = n_alpha
+
+        aaaa, _ = block.packed_positions("pphh", (i, j, a, b))
+        bbbb, _ = block.packed_positions("pphh", (i + n0, j + n1, a + n2, b + n3))
+        abab = block.packed_positions("pphh", (i, j + n1, a, b + n3))
+        abba = block.packed_positions("pphh", (i, j + n1, a + n2, b))
+        self.__singlet_positions = (aaaa, bbbb, abab, abba)
+        return self.__singlet_positions
 
     def symmetrise(self, new_vectors):
         if isinstance(new_vectors, AmplitudeVector):
             return self.symmetrise([new_vectors])[0]
+        if isinstance(new_vectors, AmplitudeVectorBlock):
+            new_vectors = super().symmetrise(new_vectors)
+            if "pphh" not in new_vectors.shapes \
+                    or self.enforce_spin_kind == "triplet":
+                # For triplets the antisymmetric spin-block mapping
+                # of the guesses is already sufficient
+                return new_vectors
+            if self.enforce_spin_kind != "singlet":
+                raise NotImplementedError("Only implemented for spin_kind == "
+                                          "'singlet' and spin_kind == "
+                                          "'triplet'.")
+            aaaa, bbbb, (abab, sign_abab), (abba, sign_abba) = \
+                self.singlet_positions(new_vectors)
+            doubles = new_vectors.data["pphh"]
+            values = doubles[:, abab] * sign_abab + doubles[:, abba] * sign_abba
+            doubles[:, aaaa] = values
+            doubles[:, bbbb] = values
+            return new_vectors
         new_vectors = super().symmetrise(new_vectors)
 
         # Enforce singlet (or other spin_kind) spin in the doubles block
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import numpy as np
+import scipy.linalg as la
+
+from adcc import copy, evaluate
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+from .preconditioner import PreconditionerIdentity
+from .conjugate_gradient import State
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+def gmres(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100, callback=None,
+          Pinv=None, explicit_symmetrisation=IndexSymmetrisation,
+          max_subspace=20, raise_on_max_iter=True):
+    """Restarted generalised minimal residual (GMRES) algorithm with right
+    preconditioning.
+
+    GMRES neither requires the matrix nor the preconditioner to be symmetric
+    or positive definite, such that e.g. the (indefinite) shifted Jacobi
+    preconditioner ``(D - ω)^{-1}`` can be used above the first excitation
+    energy. Right preconditioning is employed, such that the minimised
+    residual is the residual of the original system. The Krylov basis is
+    orthogonalised using two rounds of block Gram-Schmidt and discarded
+    after `max_subspace` iterations (restart).
+
+    Parameters
+    ----------
+    matrix
+        Matrix object. Should be an ADC matrix.
+    rhs
+        Right-hand side, source.
+    x0
+        Initial guess
+    conv_tol : float
+        Convergence tolerance on the l2 norm of residuals to consider
+        them converged.
+    max_iter : int
+        Maximum number of iterations (i.e. matrix applies)
+    callback
+        Callback to call after each iteration
+    Pinv
+        Preconditioner to A, typically an estimate for A^{-1}
+    explicit_symmetrisation
+        Explicit symmetrisation to perform during iteration to ensure
+        obtaining a solution with matching symmetry criteria.
+    max_subspace : int
+        Maximal number of Krylov vectors before a restart
+    raise_on_max_iter : bool
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    if x0 is None:
+        x0 = rhs.zeros_like()
+    else:
+        x0 = copy(x0)
+
+    if Pinv is None:
+        Pinv = PreconditionerIdentity()
+    if Pinv is not None and isinstance(Pinv, type):
+        Pinv = Pinv(matrix)
+
+    def precondition(vector):
+        z = evaluate(Pinv @ vector)
+        if explicit_symmetrisation:
+            z = explicit_symmetrisation.symmetrise(z)
+        return z
+
+    state = State()
+    state.solution = x0
+    state.residual = evaluate(rhs - matrix @ state.solution)
+    state.n_applies += 1
+    state.residual_norm = np.sqrt(state.residual @ state.residual)
+
+    callback(state, "start")
+    while True:
+        if state.residual_norm < conv_tol:
+            state.converged = True
+            callback(state, "is_converged")
+            return state
+
+        if state.n_iter >= max_iter:
+            if not raise_on_max_iter:
+                return state
+            raise la.LinAlgError("Maximum number of iterations (== "
+                                 + str(max_iter) + " reached in gmres "
+                                 "procedure.")
+
+        # Arnoldi process on matrix @ Pinv started from the residual
+        # building the Hessenberg matrix H, such that A Pinv V_k = V_{k+1} H
+        beta = float(state.residual_norm)
+        basis = AmplitudeVectorBlock.from_vectors([state.residual / beta],
+                                                  capacity=max_subspace + 1)
+        hessenberg = np.zeros((max_subspace + 1, max_subspace))
+        rhs_small = np.zeros(max_subspace + 1)
+        rhs_small[0] = beta
+        n_basis = 0
+        while n_basis < max_subspace and state.n_iter < max_iter:
+            state.n_iter += 1
+            w = evaluate(matrix @ precondition(basis[n_basis]))
+            state.n_applies += 1
+            for _ in range(2):
+                coefficients = basis.dot(w)
+                w = evaluate(w - basis.lincomb(coefficients))
+                hessenberg[:n_basis + 1, n_basis] += coefficients
+            hnorm = float(np.sqrt(w @ w))
+            hessenberg[n_basis + 1, n_basis] = hnorm
+            n_basis += 1
+
+            # Solve the small least-squares problem min |beta e1 - H y|
+            H = hessenberg[:n_basis + 1, :n_basis]
+            y = np.linalg.lstsq(H, rhs_small[:n_basis + 1], rcond=None)[0]
+            small_residual = rhs_small[:n_basis + 1] - H @ y
+            state.residual_norm = np.linalg.norm(small_residual)
+            callback(state, "next_iter")
+            if hnorm <= np.finfo(float).eps * beta:
+                break  # Invariant subspace found, solution is exact
+            basis.append(w / hnorm)
+            if state.residual_norm < conv_tol:
+                break
+
+        # Update the solution and form the residual
+        # r = V_{k+1} (beta e1 - H y) without applying the matrix
+        state.solution = evaluate(
+            state.solution + precondition(basis[:n_basis].lincomb(y))
+        )
+        state.residual = basis.lincomb(small_residual[:len(basis)])
+        state.residual_norm = np.sqrt(state.residual @ state.residual)
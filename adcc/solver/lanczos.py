@@ -25,9 +25,8 @@ import warnings
 import numpy as np
 import scipy.linalg as la
 
-from adcc import lincomb
-
 from .common import select_eigenpairs
+from .checkpoint import SolverCheckpoint
 from .LanczosIterator import LanczosIterator
 from .SolverStateBase import EigenSolverStateBase
 from .explicit_symmetrisation import IndexSymmetrisation
@@ -37,6 +36,7 @@ class LanczosState(EigenSolverStateBase):
     def __init__(self, iterator):
         super().__init__(iterator.matrix)
         self.n_restart = 0
+        self.n_reorthogonalisations = 0  # Reorthogonalisations (partial)
         self.subspace_residual = None  # Lanczos subspace residual vector(s)
         self.subspace_vectors = None   # Current subspace vectors
         self.algorithm = "lanczos"
@@ -79,16 +79,11 @@ def compute_true_residuals(subspace, rvals, rvecs, epair_mask):
     V = subspace.subspace
     AV = subspace.matrix_product
 
-    def form_residual(rval, rvec):
-        coefficients = np.hstack((rvec, -rval * rvec))
-        return lincomb(coefficients, AV + V, evaluate=True)
-    residuals = [form_residual(rvals[i], rvec)
-                 for i, rvec in enumerate(np.transpose(rvecs))
-                 if i in epair_mask]
-    eigenvectors = [lincomb(rvec, V, evaluate=True)
-                    for i, rvec in enumerate(np.transpose(rvecs))
-                    if i in epair_mask]
-    rnorms = np.array([np.sqrt(r @ r) for r in residuals])
+    rvecs = rvecs[:, epair_mask]
+    residuals = (AV.lincomb(np.transpose(rvecs))
+                 - V.lincomb(np.transpose(rvecs * rvals[epair_mask])))
+    eigenvectors = V.lincomb(np.transpose(rvecs)).to_list()
+    rnorms = residuals.norms()
 
     # Note here the actual residual norm (and not the residual norm squared)
     # is returned.
@@ -114,8 +109,7 @@ def check_convergence(subspace, rvals, rvecs, tol):
     b = subspace.rayleigh_extension
 
     # Norm of the residual vector block
-    norm_residual = np.sqrt(sum(subspace.residual[p] @ subspace.residual[p]
-                                for p in range(subspace.n_block)))
+    norm_residual = np.sqrt(np.sum(subspace.residual.norms()**2))
 
     # Minimal tolerance for convergence criterion
     # same settings as in ARPACK are used:
@@ -137,7 +131,7 @@ def check_convergence(subspace, rvals, rvecs, tol):
 
 def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9,
                        which="LA", max_iter=100, callback=None,
-                       debug_checks=False, state=None):
+                       debug_checks=False, state=None, checkpoint=None):
     """Drive the Lanczos iterations
 
     Parameters
@@ -163,6 +157,12 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
     debug_checks : bool, optional
         Enable some potentially costly debug checks
         (Loss of orthogonality etc.)
+    state : LanczosState or NoneType, optional
+        Solver state to continue from
+    checkpoint : SolverCheckpoint or NoneType, optional
+        Checkpoint to which the Lanczos subspace and the solver state are
+        written after each iteration. Only the vectors added in an iteration
+        are appended to the file.
     """
     if callback is None:
         def callback(state, identifier):
@@ -178,11 +178,15 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
 
     if state is None:
         state = LanczosState(iterator)
+    if not state.timer.is_running("iteration"):
         callback(state, "start")
         state.timer.restart("iteration")
-        n_applies_offset = 0
-    else:
-        n_applies_offset = state.n_applies
+    n_applies_offset = state.n_applies - iterator.n_applies
+    n_reorth_offset = state.n_reorthogonalisations \
+        - iterator.n_reorthogonalisations
+
+    # Number of subspace vectors, which are unchanged since the last checkpoint
+    n_ss_stored = 0
 
     for subspace in iterator:
         b = subspace.rayleigh_extension
@@ -201,6 +205,9 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
         # Update state
         state.n_iter += 1
         state.n_applies = subspace.n_applies + n_applies_offset
+        state.n_reorthogonalisations = (subspace.n_reorthogonalisations
+                                        + n_reorth_offset)
+        state.orthogonality_estimate = subspace.orthogonality_estimate
         state.converged = False
         state.eigenvectors = None  # Not computed in Lanczos
         state.subspace_vectors = subspace.subspace
@@ -218,6 +225,19 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
         callback(state, "next_iter")
         state.timer.restart("iteration")
 
+        if checkpoint:
+            with state.timer.record("checkpoint"):
+                iterator.write_checkpoint(checkpoint, n_unchanged=n_ss_stored)
+                checkpoint.store("state", {
+                    "n_iter": state.n_iter,
+                    "n_applies": state.n_applies,
+                    "n_restart": state.n_restart,
+                    "n_reorthogonalisations": state.n_reorthogonalisations,
+                    "eigenvalues": state.eigenvalues,
+                })
+                checkpoint.flush()
+                n_ss_stored = len(subspace.subspace)
+
         if converged:
             state = amend_true_residuals(state, subspace, rvals,
                                          rvecs, epair_mask)
@@ -243,21 +263,20 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
             V = subspace.subspace
             vn, betan = subspace.ortho.qr(subspace.residual)
 
-            Y = [lincomb(rvec, V, evaluate=True)
-                 for i, rvec in enumerate(np.transpose(rvecs))
-                 if i in epair_mask]
+            Y = V.lincomb(np.transpose(rvecs[:, epair_mask]))
             Theta = rvals[epair_mask]
             Sigma = rvecs[:, epair_mask].T @ b @ betan.T
 
             iterator = LanczosIterator(
                 iterator.matrix, vn, ritz_vectors=Y, ritz_values=Theta,
                 ritz_overlaps=Sigma,
-                explicit_symmetrisation=iterator.explicit_symmetrisation
+                explicit_symmetrisation=iterator.explicit_symmetrisation,
+                reorthogonalisation=iterator.reorthogonalisation
             )
             state.n_restart += 1
             return lanczos_iterations(
                 iterator, n_ep, min_subspace, max_subspace, conv_tol, which,
-                max_iter, callback, debug_checks, state)
+                max_iter, callback, debug_checks, state, checkpoint)
 
     state = amend_true_residuals(state, subspace, rvals, rvecs, epair_mask)
     state.timer.stop("iteration")
@@ -269,11 +288,32 @@ def lanczos_iterations(iterator, n_ep, min_subspace, max_subspace, conv_tol=1e-9
     return state
 
 
+def restore_checkpoint(matrix, guesses, checkpoint, explicit_symmetrisation,
+                       reorthogonalisation="full"):
+    """
+    Construct the LanczosIterator and the LanczosState to resume
+    the iterations from a checkpoint.
+    """
+    iterator = LanczosIterator.from_checkpoint(
+        matrix, guesses, checkpoint,
+        explicit_symmetrisation=explicit_symmetrisation,
+        reorthogonalisation=reorthogonalisation
+    )
+    data = checkpoint.load("state")
+    state = LanczosState(iterator)
+    state.n_iter = data["n_iter"]
+    state.n_applies = data["n_applies"]
+    state.n_restart = data["n_restart"]
+    state.n_reorthogonalisations = data.get("n_reorthogonalisations", 0)
+    return iterator, state
+
+
 def lanczos(matrix, guesses, n_ep, max_subspace=None,
             conv_tol=1e-9, which="LM", max_iter=100,
             callback=None, debug_checks=False,
             explicit_symmetrisation=IndexSymmetrisation,
-            min_subspace=None):
+            min_subspace=None, checkpoint=None, restart_from=None,
+            reorthogonalisation="full"):
     """Lanczos eigensolver for ADC problems
 
     Parameters
@@ -304,12 +344,39 @@ def lanczos(matrix, guesses, n_ep, max_subspace=None,
         symmetries during orthogonalisation (type or instance).
     min_subspace : int or NoneType, optional
         Subspace size to collapse to when performing a thick restart.
+    checkpoint : str or SolverCheckpoint or NoneType, optional
+        HDF5 file to which the solver state is written after each iteration
+    restart_from : str or SolverCheckpoint or NoneType, optional
+        HDF5 checkpoint file from which a previous run is resumed. The
+        `guesses` only serve as a template for the vector layout in this case.
+    reorthogonalisation : str, optional
+        "full" to orthogonalise each new Lanczos block against the complete
+        subspace or "partial" to only do so, when the loss of orthogonality
+        estimated by the ω-recurrence exceeds the square root of the machine
+        epsilon. The number of reorthogonalisations is recorded in
+        the `n_reorthogonalisations` attribute of the returned state.
     """
     if explicit_symmetrisation is not None and \
             isinstance(explicit_symmetrisation, type):
         explicit_symmetrisation = explicit_symmetrisation(matrix)
-    iterator = LanczosIterator(matrix, guesses,
-                               explicit_symmetrisation=explicit_symmetrisation)
+
+    state = None
+    if restart_from is None:
+        iterator = LanczosIterator(
+            matrix, guesses, explicit_symmetrisation=explicit_symmetrisation,
+            reorthogonalisation=reorthogonalisation
+        )
+    else:
+        if isinstance(restart_from, SolverCheckpoint):
+            iterator, state = restore_checkpoint(matrix, guesses, restart_from,
+                                                 explicit_symmetrisation,
+                                                 reorthogonalisation)
+        else:
+            with SolverCheckpoint(restart_from, "r") as restart_checkpoint:
+                iterator, state = restore_checkpoint(
+                    matrix, guesses, restart_checkpoint, explicit_symmetrisation,
+                    reorthogonalisation
+                )
 
     if not isinstance(guesses, list):
         guesses = [guesses]
@@ -325,5 +392,14 @@ def lanczos(matrix, guesses, n_ep, max_subspace=None,
             "".format(conv_tol, matrix.shape[1] * np.finfo(float).eps)
         ))
 
-    return lanczos_iterations(iterator, n_ep, min_subspace, max_subspace,
-                              conv_tol, which, max_iter, callback, debug_checks)
+    close_checkpoint = False
+    if checkpoint is not None and not isinstance(checkpoint, SolverCheckpoint):
+        checkpoint = SolverCheckpoint(checkpoint)
+        close_checkpoint = True
+    try:
+        return lanczos_iterations(iterator, n_ep, min_subspace, max_subspace,
+                                  conv_tol, which, max_iter, callback,
+                                  debug_checks, state, checkpoint)
+    finally:
+        if close_checkpoint:
+            checkpoint.close()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import sys
+import warnings
+import numpy as np
+import scipy.linalg as la
+
+from adcc import evaluate
+from adcc.AdcMatrix import AdcMatrixlike
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+from .common import select_eigenpairs
+from .preconditioner import JacobiPreconditioner
+from .SolverStateBase import EigenSolverStateBase
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+class LobpcgState(EigenSolverStateBase):
+    def __init__(self, matrix, guesses):
+        super().__init__(matrix)
+        self.residuals = None  # Current residuals (AmplitudeVectorBlock)
+        self.n_locked = 0      # Number of soft-locked (converged) Ritz pairs
+        self.n_block = len(guesses)  # Block size
+        self.basis_size = 0    # Current size of the [X, W, P] basis
+        self.algorithm = "lobpcg"
+
+
+def default_print(state, identifier, file=sys.stdout):
+    """
+    A default print function for the lobpcg callback
+    """
+    from adcc.timings import strtime, strtime_short
+
+    if identifier == "start" and state.n_iter == 0:
+        print("Niter n_ss  max_residual  time  Ritz values",
+              file=file)
+    elif identifier == "next_iter":
+        time_iter = state.timer.current("iteration")
+        fmt = "{n_iter:3d}  {ss_size:4d}  {residual:12.5g}  {tstr:5s}"
+        print(fmt.format(n_iter=state.n_iter, tstr=strtime_short(time_iter),
+                         ss_size=state.basis_size,
+                         residual=np.max(state.residual_norms)),
+              "", state.eigenvalues[:7], file=file)
+        if state.n_locked > 0:
+            print(33 * " " + "locked: {:d}".format(state.n_locked), file=file)
+    elif identifier == "is_converged":
+        soltime = state.timer.total("iteration")
+        print("=== Converged ===", file=file)
+        print("    Number of matrix applies:   ", state.n_applies, file=file)
+        print("    Total solver time:          ", strtime(soltime), file=file)
+
+
+def svqb_coefficients(gram, tolerance):
+    """
+    Return the coefficients orthonormalising a set of vectors with the passed
+    Gram matrix (SVQB, Stathopoulos and Wu, SIAM J. Sci. Comput. 23, 2165
+    (2002)). Directions, which are linearly dependent within `tolerance`
+    relative to the largest eigenvalue of the Gram matrix, are dropped.
+    """
+    scaling = 1 / np.sqrt(np.maximum(np.diag(gram), np.finfo(float).tiny))
+    gram = scaling[:, None] * gram * scaling[None, :]
+    evals, evecs = la.eigh(gram)
+    keep = evals > tolerance * max(np.max(evals), 1)
+    return scaling[:, None] * evecs[:, keep] / np.sqrt(evals[keep])
+
+
+def orthonormalise(vectors, tolerance, n_rounds=2):
+    """
+    Orthonormalise an AmplitudeVectorBlock using `n_rounds` of SVQB,
+    dropping linearly dependent vectors.
+    """
+    for _ in range(n_rounds):
+        if len(vectors) == 0:
+            break
+        coefficients = svqb_coefficients(vectors.dot(vectors), tolerance)
+        vectors = vectors.lincomb(np.transpose(coefficients))
+    return vectors
+
+
+def block_gram(left, right):
+    """
+    Matrix of all dot products between the vectors of the list of
+    AmplitudeVectorBlocks `left` and the ones of the list `right`.
+    """
+    return np.block([[lblock.dot(rblock) for rblock in right]
+                     for lblock in left])
+
+
+def block_lincomb(blocks, coefficients):
+    """
+    Form linear combinations of the vectors of the list of
+    AmplitudeVectorBlocks `blocks`, where the rows of `coefficients`
+    run over the vectors of all blocks, see
+    :py:meth:`AmplitudeVectorBlock.lincomb`.
+    """
+    start = 0
+    ret = None
+    for block in blocks:
+        part = block.lincomb(np.transpose(
+            coefficients[start:start + len(block)]))
+        ret = part if ret is None else ret + part
+        start += len(block)
+    return ret
+
+
+def lobpcg_iterations(matrix, state, X, max_iter, n_ep, is_converged, which,
+                      callback=None, preconditioner=None, debug_checks=False,
+                      explicit_symmetrisation=None, lock_tol=None):
+    """Drive the LOBPCG iterations
+
+    Parameters
+    ----------
+    matrix
+        Matrix to diagonalise
+    state
+        LobpcgState to update
+    X : AmplitudeVectorBlock
+        Guess vectors
+    max_iter : int
+        Maximal number of iterations
+    n_ep : int
+        Number of eigenpairs to be computed
+    is_converged
+        Function to test for convergence
+    which : str
+        Which eigenvectors to converge to. Needs to be chosen such that
+        it agrees with the selected preconditioner.
+    callback : callable, optional
+        Callback to run after each iteration
+    preconditioner : optional
+        Preconditioner instance
+    debug_checks : bool, optional
+        Enable some potentially costly debug checks
+        (Loss of orthogonality etc.)
+    explicit_symmetrisation : optional
+        Explicit symmetrisation instance to apply to the preconditioned
+        residuals before adding them to the basis
+    lock_tol : float or NoneType, optional
+        Tolerance on the l2 norm squared of the residual below which a Ritz
+        pair is soft-locked, i.e. stays in the Rayleigh-Ritz procedure, but
+        does not contribute further search directions.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    n_block = state.n_block
+    eps = np.finfo(float).eps
+    tolerance = 10 * len(X) * eps  # For dropping linearly dependent vectors
+
+    callback(state, "start")
+    state.timer.restart("iteration")
+
+    with state.timer.record("projection"):
+        X = orthonormalise(X, tolerance)
+        if len(X) < n_block:
+            raise ValueError("The guess vectors are linearly dependent.")
+        AX = AmplitudeVectorBlock.from_vectors(evaluate(matrix @ X.to_list()))
+        state.n_applies += n_block
+
+    # Previous search directions P (orthonormal and orthogonal to X)
+    P = AmplitudeVectorBlock(X.template)
+    AP = AmplitudeVectorBlock(X.template)
+    W = AmplitudeVectorBlock(X.template)
+    AW = AmplitudeVectorBlock(X.template)
+    active = np.arange(n_block)
+
+    while state.n_iter < max_iter:
+        state.n_iter += 1
+
+        # Rayleigh-Ritz in the orthonormal basis S = [X, W, P].
+        # The basis is never concatenated to keep the memory footprint
+        # at three times the block size (plus the matrix applied to it).
+        with state.timer.record("rayleigh_ritz"):
+            S, AS = [X, W, P], [AX, AW, AP]
+            Ass = block_gram(S, AS)
+            Ass = (Ass + Ass.T) / 2
+            fvals, fvecs = la.eigh(Ass)
+            ritz = select_eigenpairs(fvals, n_block, which)
+            rvals, rvecs = fvals[ritz], fvecs[:, ritz]
+            state.basis_size = len(Ass)
+
+            # New search directions: The components of the new Ritz vectors
+            # of the active pairs along W and P, orthonormalised against the
+            # Ritz vectors in the coefficient space. Since S is orthonormal,
+            # so are the resulting directions.
+            pcoeff = rvecs[:, active].copy()
+            pcoeff[:len(X)] = 0
+            for _ in range(2):
+                pcoeff -= rvecs @ (rvecs.T @ pcoeff)
+            pcoeff = pcoeff @ svqb_coefficients(pcoeff.T @ pcoeff,
+                                                np.sqrt(eps))
+
+            X = block_lincomb(S, rvecs)
+            AX = block_lincomb(AS, rvecs)
+            P = block_lincomb(S, pcoeff)
+            AP = block_lincomb(AS, pcoeff)
+            del S, AS
+
+        with state.timer.record("residuals"):
+            residuals = AX - X * rvals
+            residual_norms = residuals.rowwise_dot(residuals)
+
+            # Soft locking: Converged pairs do not contribute search
+            # directions, but their Ritz vectors still take part in the
+            # Rayleigh-Ritz procedure.
+            if lock_tol is not None:
+                active = np.nonzero(residual_norms >= lock_tol)[0]
+                state.n_locked = n_block - len(active)
+
+            epair_mask = select_eigenpairs(rvals, n_ep, which)
+            state.eigenvalues = rvals[epair_mask]
+            state.residuals = residuals[epair_mask]
+            state.residual_norms = residual_norms[epair_mask]
+
+        callback(state, "next_iter")
+        state.timer.restart("iteration")
+        if is_converged(state):
+            state.eigenvectors = X[epair_mask].to_list()
+            state.converged = True
+            callback(state, "is_converged")
+            state.timer.stop("iteration")
+            return state
+
+        if state.n_iter == max_iter:
+            break
+
+        with state.timer.record("preconditioner"):
+            if preconditioner:
+                if hasattr(preconditioner, "update_shifts"):
+                    preconditioner.update_shifts(rvals[active] - 1e-6)
+                W = preconditioner @ residuals[active]
+                if not isinstance(W, AmplitudeVectorBlock):
+                    W = AmplitudeVectorBlock.from_vectors(evaluate(W))
+            else:
+                W = residuals[active]
+            if explicit_symmetrisation:
+                explicit_symmetrisation.symmetrise(W)
+
+        with state.timer.record("orthogonalisation"):
+            # Orthogonalise W against X and P (twice is enough) and
+            # orthonormalise the remaining vectors among each other
+            for _ in range(2):
+                W = W - block_lincomb([X, P], block_gram([X, P], [W]))
+            W = orthonormalise(W, tolerance)
+
+            if debug_checks:
+                orth = block_gram([X, W, P], [X, W, P])
+                orth -= np.eye(len(orth))
+                state.basis_orthogonality = np.max(np.abs(orth))
+                if state.basis_orthogonality > matrix.shape[1] * eps:
+                    warnings.warn(la.LinAlgWarning(
+                        "LOBPCG basis has lost orthogonality. "
+                        "Expect inaccurate results."
+                    ))
+
+        if len(W) == 0:
+            state.eigenvectors = X[epair_mask].to_list()
+            state.timer.stop("iteration")
+            state.converged = False
+            warnings.warn(la.LinAlgWarning(
+                "LOBPCG could not generate any further search directions. "
+                "Iteration cannot be continued like this and will be aborted "
+                "without convergence. Try a different guess."))
+            return state
+
+        with state.timer.record("projection"):
+            AW = AmplitudeVectorBlock.from_vectors(
+                evaluate(matrix @ W.to_list()))
+            state.n_applies += len(W)
+
+    warnings.warn(la.LinAlgWarning(
+        f"Maximum number of iterations (== {max_iter}) "
+        "reached in lobpcg procedure."))
+    state.eigenvectors = X[epair_mask].to_list()
+    state.timer.stop("iteration")
+    state.converged = False
+    return state
+
+
+def lobpcg(matrix, guesses, n_ep=None, conv_tol=1e-9, which="SA",
+           max_iter=100, callback=None, preconditioner=JacobiPreconditioner,
+           debug_checks=False, explicit_symmetrisation=IndexSymmetrisation,
+           lock_converged=False):
+    """Locally optimal block preconditioned conjugate gradient (LOBPCG)
+    eigensolver for ADC problems
+
+    In each iteration the Rayleigh-Ritz procedure is performed in the basis
+    spanned by the current Ritz vectors X, the preconditioned residuals W
+    and the previous search directions P. Unlike the Davidson subspace, this
+    basis never exceeds three times the block size (Knyazev, SIAM J. Sci.
+    Comput. 23, 517 (2001)). The basis is kept orthonormal following
+    Hetmaniuk and Lehoucq, J. Comput. Phys. 218, 324 (2006).
+
+    Parameters
+    ----------
+    matrix
+        ADC matrix instance
+    guesses : list
+        Guess vectors (fixes also the block size)
+    n_ep : int or NoneType, optional
+        Number of eigenpairs to be computed
+    conv_tol : float, optional
+        Convergence tolerance on the l2 norm squared of residuals to consider
+        them converged
+    which : str, optional
+        Which eigenvectors to converge to (e.g. LM, LA, SM, SA)
+    max_iter : int, optional
+        Maximal number of iterations
+    callback : callable, optional
+        Callback to run after each iteration
+    preconditioner
+        Preconditioner (type or instance)
+    debug_checks : bool, optional
+        Enable some potentially costly debug checks
+        (Loss of orthogonality etc.)
+    explicit_symmetrisation
+        Explicit symmetrisation to apply to new search directions before
+        adding them to the basis. Allows to correct for loss of index
+        or spin symmetries (type or instance)
+    lock_converged : bool, optional
+        Soft-lock eigenpairs as soon as they are converged, i.e. stop
+        computing search directions for them. Disabled by default.
+    """
+    if not isinstance(matrix, AdcMatrixlike):
+        raise TypeError("matrix is not of type AdcMatrixlike")
+    for guess in guesses:
+        if not isinstance(guess, AmplitudeVector):
+            raise TypeError("One of the guesses is not of type AmplitudeVector")
+
+    if preconditioner is not None and isinstance(preconditioner, type):
+        preconditioner = preconditioner(matrix)
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    if n_ep is None:
+        n_ep = len(guesses)
+    elif n_ep > len(guesses):
+        raise ValueError("n_ep cannot exceed the number of guess vectors.")
+
+    def convergence_test(state):
+        state.residuals_converged = state.residual_norms < conv_tol
+        state.converged = np.all(state.residuals_converged)
+        return state.converged
+
+    if conv_tol < matrix.shape[1] * np.finfo(float).eps:
+        warnings.warn(la.LinAlgWarning(
+            "Convergence tolerance (== {:5.2g}) lower than "
+            "estimated maximal numerical accuracy (== {:5.2g}). "
+            "Convergence might be hard to achieve."
+            "".format(conv_tol, matrix.shape[1] * np.finfo(float).eps)
+        ))
+
+    state = LobpcgState(matrix, guesses)
+    lobpcg_iterations(matrix, state, AmplitudeVectorBlock.from_vectors(guesses),
+                      max_iter, n_ep=n_ep, is_converged=convergence_test,
+                      which=which, callback=callback,
+                      preconditioner=preconditioner, debug_checks=debug_checks,
+                      explicit_symmetrisation=explicit_symmetrisation,
+                      lock_tol=conv_tol if lock_converged else None)
+    return state
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import numpy as np
+import scipy.linalg as la
+
+from adcc import copy, evaluate
+
+from ..functions import dot
+from .preconditioner import JacobiPreconditioner, PreconditionerIdentity
+from .conjugate_gradient import State
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+def minres(matrix, rhs, x0=None, conv_tol=1e-9, max_iter=100, callback=None,
+           Pinv=None, explicit_symmetrisation=IndexSymmetrisation,
+           raise_on_max_iter=True):
+    """Preconditioned minimal residual (MINRES) algorithm for symmetric,
+    possibly indefinite matrices.
+
+    In contrast to :py:func:`conjugate_gradient` the matrix does not need
+    to be positive definite, such that shifted ADC matrices
+    ``matrix - ω`` with a frequency ω above the first excitation energy
+    can be treated. Each iteration costs one matrix apply and minimises the
+    residual over the Krylov subspace (Paige and Saunders, SIAM J. Numer.
+    Anal. 12, 617 (1975)). The l2 norm of the residual is updated in each
+    iteration without additional matrix applies.
+
+    Parameters
+    ----------
+    matrix
+        Matrix object. Should be an ADC matrix.
+    rhs
+        Right-hand side, source.
+    x0
+        Initial guess
+    conv_tol : float
+        Convergence tolerance on the l2 norm of residuals to consider
+        them converged.
+    max_iter : int
+        Maximum number of iterations
+    callback
+        Callback to call after each iteration
+    Pinv
+        Preconditioner to A, which needs to be symmetric and positive
+        definite. If a :py:class:`JacobiPreconditioner` type is passed,
+        it is constructed with ``absolute=True``, i.e. the inverse of the
+        absolute value of the (shifted) diagonal is used.
+    explicit_symmetrisation
+        Explicit symmetrisation to perform during iteration to ensure
+        obtaining a solution with matching symmetry criteria.
+    raise_on_max_iter : bool
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    if x0 is None:
+        x0 = rhs.zeros_like()
+    else:
+        x0 = copy(x0)
+
+    if Pinv is None:
+        Pinv = PreconditionerIdentity()
+    if isinstance(Pinv, type) and issubclass(Pinv, JacobiPreconditioner):
+        Pinv = Pinv(matrix, absolute=True)
+    elif isinstance(Pinv, type):
+        Pinv = Pinv(matrix)
+
+    def precondition(residual):
+        z = evaluate(Pinv @ residual)
+        if explicit_symmetrisation:
+            z = explicit_symmetrisation.symmetrise(z)
+        return z
+
+    def preconditioned_norm(residual, z):
+        norm_sq = float(dot(residual, z))
+        if norm_sq < 0:
+            raise ValueError("Preconditioner passed to minres is not "
+                             "positive definite.")
+        return np.sqrt(norm_sq)
+
+    state = State()
+    state.solution = x0
+    state.residual = evaluate(rhs - matrix @ state.solution)
+    state.n_applies += 1
+    state.residual_norm = np.sqrt(state.residual @ state.residual)
+
+    # Lanczos vectors of the preconditioned matrix in the notation of
+    # scipy.sparse.linalg.minres: r1, r2 are the previous two residual-like
+    # vectors, y = Pinv @ r2 and w, w2 the update directions of the solution.
+    # Aw, Aw2 track matrix @ w to update the residual without matrix applies.
+    r1 = r2 = state.residual
+    y = precondition(r2)
+    beta1 = preconditioned_norm(r2, y)
+    beta = beta1
+    oldb = 0.0
+    cs, sn = -1.0, 0.0
+    dbar = epsln = 0.0
+    phibar = beta1
+    w = w2 = Aw = Aw2 = None
+
+    callback(state, "start")
+    if state.residual_norm < conv_tol or beta1 == 0:
+        state.converged = True
+        callback(state, "is_converged")
+        return state
+
+    while state.n_iter < max_iter:
+        state.n_iter += 1
+
+        v = y / beta
+        Av = evaluate(matrix @ v)
+        state.n_applies += 1
+        y = Av
+        if state.n_iter > 1:
+            y = y - (beta / oldb) * r1
+        alfa = float(dot(v, y))
+        y = evaluate(y - (alfa / beta) * r2)
+        r1, r2 = r2, y
+        y = precondition(r2)
+        oldb, beta = beta, preconditioned_norm(r2, y)
+
+        # Apply the previous Givens rotation to the new column of the
+        # Lanczos matrix and compute the next rotation
+        oldeps = epsln
+        delta = cs * dbar + sn * alfa
+        gbar = sn * dbar - cs * alfa
+        epsln = sn * beta
+        dbar = -cs * beta
+        gamma = max(np.hypot(gbar, beta), np.finfo(float).eps)
+        cs, sn = gbar / gamma, beta / gamma
+        phi = cs * phibar
+        phibar = sn * phibar
+
+        # Update the solution, the residual and the search directions
+        w1, w2 = w2, w
+        Aw1, Aw2 = Aw2, Aw
+        w, Aw = v, Av
+        if w2 is not None:
+            w = w - delta * w2
+            Aw = Aw - delta * Aw2
+        if w1 is not None:
+            w = w - oldeps * w1
+            Aw = Aw - oldeps * Aw1
+        w = evaluate(w / gamma)
+        Aw = evaluate(Aw / gamma)
+        state.solution = evaluate(state.solution + phi * w)
+        state.residual = evaluate(state.residual - phi * Aw)
+        state.residual_norm = np.sqrt(state.residual @ state.residual)
+
+        callback(state, "next_iter")
+        if state.residual_norm < conv_tol or beta == 0:
+            state.converged = True
+            callback(state, "is_converged")
+            return state
+
+        if state.n_iter == max_iter:
+            if not raise_on_max_iter:
+                return state
+            raise la.LinAlgError("Maximum number of iterations (== "
+                                 + str(max_iter) + " reached in minres "
+                                 "procedure.")
+    return state
@@ -21,8 +21,11 @@
 ##
 ## ---------------------------------------------------------------------
 import numpy as np
+import scipy.linalg as la
 
 from adcc import evaluate, lincomb
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
 
 class GramSchmidtOrthogonaliser:
@@ -45,11 +48,14 @@ class GramSchmidtOrthogonaliser:
         A simple (and inefficient / inaccurate) QR decomposition based
         on Gram-Schmidt. Use only if no alternatives.
 
-        vectors : list
-            List of vectors representing the input matrix to decompose.
+        vectors : list or AmplitudeVectorBlock
+            Vectors representing the input matrix to decompose.
         """
         if len(vectors) == 0:
             return []
+        elif isinstance(vectors, AmplitudeVectorBlock):
+            Q = self.orthogonalise(vectors)
+            return Q, np.triu(Q.dot(vectors))
         elif len(vectors) == 1:
             norm_v = np.sqrt(vectors[0] @ vectors[0])
             return [evaluate(vectors[0] / norm_v)], np.array([[norm_v]])
@@ -69,6 +75,13 @@ class GramSchmidtOrthogonaliser:
         """
         if len(vectors) == 0:
             return []
+        if isinstance(vectors, AmplitudeVectorBlock):
+            subspace = vectors[:1] / vectors[:1].norms()
+            subspace.reserve(len(vectors))
+            for i in range(1, len(vectors)):
+                w = self.orthogonalise_against(vectors[i:i + 1], subspace)
+                subspace.extend(w / w.norms())
+            return subspace
         subspace = [evaluate(vectors[0] / np.sqrt(vectors[0] @ vectors[0]))]
         for v in vectors[1:]:
             w = self.orthogonalise_against(v, subspace)
@@ -82,10 +95,26 @@ class GramSchmidtOrthogonaliser:
         ``(1 - SS * SS^T) * vector`.
 
         vector
-            Vector to make orthogonal to the subspace
-        subspace : list
+            Vector to make orthogonal to the subspace (AmplitudeVector or
+            AmplitudeVectorBlock, in which case all vectors are orthogonalised
+            at once).
+        subspace : list or AmplitudeVectorBlock
             Subspace of orthonormal vectors.
         """
+        if isinstance(vector, AmplitudeVectorBlock) or \
+                isinstance(subspace, AmplitudeVectorBlock):
+            if not isinstance(subspace, AmplitudeVectorBlock):
+                subspace = AmplitudeVectorBlock.from_vectors(subspace)
+            for _ in range(self.n_rounds):
+                if isinstance(vector, AmplitudeVectorBlock):
+                    coefficients = np.transpose(subspace.dot(vector))
+                else:
+                    coefficients = subspace.dot(vector)
+                vector = vector - subspace.lincomb(coefficients)
+                if self.explicit_symmetrisation is not None:
+                    vector = self.explicit_symmetrisation.symmetrise(vector)
+            return evaluate(vector)
+
         # Project out the components of the current subspace
         # That is form (1 - SS * SS^T) * vector = vector + SS * (-SS^T * vector)
         for _ in range(self.n_rounds):
@@ -94,3 +123,171 @@ class GramSchmidtOrthogonaliser:
             if self.explicit_symmetrisation is not None:
                 self.explicit_symmetrisation.symmetrise(vector)
         return vector
+
+
+class CholeskyQROrthogonaliser:
+    def __init__(self, explicit_symmetrisation=None, n_rounds=1):
+        """
+        Initialise the CholeskyQROrthogonaliser, which orthonormalises
+        complete blocks of vectors based on their Gram matrix (CholeskyQR2,
+        Fukaya et al., ScalA 2014, 31) instead of one vector at a time.
+        All overlaps are computed with one batched dot product per pass.
+
+        Parameters
+        ----------
+        explicit_symmetrisation
+            The explicit symmetrisation to use on the orthogonalised vectors
+        n_rounds : int
+            The number of times to project out the subspace in
+            :py:meth:`orthogonalise_against`
+        """
+        self.explicit_symmetrisation = explicit_symmetrisation
+        self.n_rounds = n_rounds
+
+    @staticmethod
+    def cholesky_qr(vectors):
+        """
+        Return the CholeskyQR factors ``Q, R`` of an AmplitudeVectorBlock
+        (``vectors = Q * R``) using two passes (CholeskyQR2). If the Gram
+        matrix of a pass is numerically singular, the pass is done with a
+        shift and an additional pass is appended (shifted CholeskyQR3,
+        Fukaya et al., SIAM J. Sci. Comput. 42, A477 (2020)). For linearly
+        dependent vectors ``vectors = Q * R`` still holds, but the diagonal
+        elements of ``R`` belonging to the dependent vectors vanish (up to
+        the size of the shift) and the corresponding columns of ``Q`` are
+        determined by rounding errors.
+        """
+        n_vectors = len(vectors)
+        n_problem = sum(int(np.prod(shape)) for shape in vectors.shapes.values())
+
+        def cholesky(gram):
+            try:
+                return la.cholesky(gram, lower=False), False
+            except la.LinAlgError:
+                shift = 11 * (n_problem + n_vectors * (n_vectors + 1)) \
+                    * np.finfo(float).eps * np.trace(gram)
+                return la.cholesky(gram + shift * np.eye(n_vectors),
+                                   lower=False), True
+
+        Q, R = vectors, np.eye(n_vectors)
+        n_pass = 2
+        i_pass = 0
+        while i_pass < n_pass:
+            Rpass, shifted = cholesky(Q.dot(Q))
+            if shifted:
+                # A shifted pass only improves the conditioning, so it is
+                # followed by a CholeskyQR2 (limited to four passes in total)
+                n_pass = min(i_pass + 3, 4)
+            Q = Q.lincomb(np.transpose(la.inv(Rpass)))
+            R = Rpass @ R
+            i_pass += 1
+        return Q, R
+
+    def qr(self, vectors):
+        """
+        QR decomposition of the passed vectors based on CholeskyQR2.
+
+        vectors : list or AmplitudeVectorBlock
+            Vectors representing the input matrix to decompose.
+        """
+        if len(vectors) == 0:
+            return []
+        if isinstance(vectors, AmplitudeVectorBlock):
+            return self.cholesky_qr(vectors)
+        Q, R = self.cholesky_qr(AmplitudeVectorBlock.from_vectors(vectors))
+        return Q.to_list(), R
+
+    def orthogonalise(self, vectors):
+        """
+        Orthogonalise the passed vectors with each other and return
+        orthonormal vectors.
+        """
+        if len(vectors) == 0:
+            return []
+        return self.qr(vectors)[0]
+
+    def orthogonalise_against(self, vector, subspace):
+        """
+        Orthogonalise the passed vector against a subspace. The latter is assumed
+        to only consist of orthonormal vectors. Effectively computes
+        ``(1 - SS * SS^T) * vector`` using one batched dot product and
+        linear combination per round.
+
+        vector
+            Vector to make orthogonal to the subspace (AmplitudeVector or
+            AmplitudeVectorBlock, in which case all vectors are orthogonalised
+            at once).
+        subspace : list or AmplitudeVectorBlock
+            Subspace of orthonormal vectors.
+        """
+        unpack = isinstance(vector, AmplitudeVector)
+        if unpack:
+            vector = AmplitudeVectorBlock.from_vectors([vector])
+        if not isinstance(subspace, AmplitudeVectorBlock):
+            subspace = AmplitudeVectorBlock.from_vectors(subspace)
+        for _ in range(self.n_rounds):
+            if len(subspace) > 0:
+                coefficients = np.transpose(subspace.dot(vector))
+                vector = vector - subspace.lincomb(coefficients)
+            if self.explicit_symmetrisation is not None:
+                vector = self.explicit_symmetrisation.symmetrise(vector)
+        return vector[0] if unpack else vector
+
+    def orthonormalise_against(self, vectors, subspace, min_norm=0.0):
+        """
+        Orthonormalise an AmplitudeVectorBlock against a subspace of
+        orthonormal vectors and within itself (block Gram-Schmidt with
+        CholeskyQR2). Vectors, which have a norm smaller than `min_norm`
+        after removing the components along the subspace and along
+        the preceding vectors, are dropped, i.e. the result is the same
+        as the one of a sequential Gram-Schmidt dropping such vectors.
+
+        Parameters
+        ----------
+        vectors : AmplitudeVectorBlock
+            Vectors to orthonormalise
+        subspace : AmplitudeVectorBlock
+            Subspace of orthonormal vectors
+        min_norm : float, optional
+            Minimal norm of a vector to be kept
+        """
+        norms = vectors.norms()
+        vectors = self.__project(vectors, subspace)
+        if np.any(vectors.norms() < norms / np.sqrt(2)):
+            # Most of some vectors was contained in the subspace,
+            # so project a second time to avoid losing orthogonality
+            vectors = self.__project(vectors, subspace)
+
+        # Cholesky factorisation of the Gram matrix dropping the vectors,
+        # which are (numerically) linearly dependent on the previous ones
+        gram = vectors.dot(vectors)
+        n_vectors = len(vectors)
+        keep = []
+        R = np.zeros((0, 0))
+        for j in range(n_vectors):
+            c = la.solve_triangular(R, gram[keep, j], trans="T") \
+                if keep else np.zeros(0)
+            d = gram[j, j] - c @ c
+            cutoff = max(min_norm**2, 100 * n_vectors * np.finfo(float).eps
+                         * gram[j, j])
+            if d > cutoff:
+                R = np.block([[R, c[:, None]],
+                              [np.zeros((1, len(keep))), np.sqrt(d)]])
+                keep.append(j)
+        if not keep:
+            return vectors[:0]
+        Q = vectors[keep].lincomb(np.transpose(la.inv(R)))
+
+        # Second pass to restore the orthogonality lost in the first,
+        # which is only needed against the subspace if R is ill-conditioned
+        if np.linalg.cond(R) > 10:
+            Q = self.__project(Q, subspace)
+        return self.cholesky_qr(Q)[0]
+
+    def __project(self, vectors, subspace):
+        if len(subspace) > 0:
+            vectors = vectors - subspace.lincomb(
+                np.transpose(subspace.dot(vectors)))
+        if self.explicit_symmetrisation is not None:
+            vectors = self.explicit_symmetrisation.symmetrise(vectors)
+        return vectors
@@ -24,6 +24,7 @@ import numpy as np
 
 from adcc.AdcMatrix import AdcMatrixlike
 from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
 
 
 class PreconditionerIdentity:
@@ -42,15 +43,19 @@ class JacobiPreconditioner:
     Jacobi-type preconditioner
 
     Represents the application of (D - σ I)^{-1}, where
-    D is the diagonal of the adcmatrix.
+    D is the diagonal of the adcmatrix. If `absolute` is True,
+    |D - σ I|^{-1} is applied instead, which is positive definite
+    even if σ lies inside the spectrum of D (as required by MINRES).
     """
-    def __init__(self, adcmatrix, shifts=0.0):
+    def __init__(self, adcmatrix, shifts=0.0, absolute=False):
         if not isinstance(adcmatrix, AdcMatrixlike):
             raise TypeError("Only an AdcMatrixlike may be used with this "
                             "preconditioner for now.")
 
         self.diagonal = adcmatrix.diagonal()
         self.shifts = shifts
+        self.absolute = absolute
+        self.__dense_diagonal = None
 
     def update_shifts(self, shifts):
         """
@@ -62,12 +67,28 @@ class JacobiPreconditioner:
         """
         self.shifts = shifts
 
+    @property
+    def dense_diagonal(self):
+        """
+        The diagonal as a dictionary of flat arrays (one per block) in the
+        storage layout of an AmplitudeVectorBlock, which is used to apply
+        the preconditioner to an AmplitudeVectorBlock.
+        """
+        if self.__dense_diagonal is None:
+            rows = AmplitudeVectorBlock(self.diagonal).to_rows(self.diagonal)
+            self.__dense_diagonal = {b: row.reshape(1, -1)
+                                     for b, row in rows.items()}
+        return self.__dense_diagonal
+
     def apply(self, invecs):
         if isinstance(invecs, AmplitudeVector):
             if not isinstance(self.shifts, (float, np.number)):
                 raise TypeError("Can only apply JacobiPreconditioner "
                                 "to a single vector if shifts is "
                                 "only a single number.")
+            if self.absolute:
+                block = AmplitudeVectorBlock.from_vectors([invecs])
+                return self.apply(block)[0]
             return invecs / (self.diagonal - self.shifts)
         elif isinstance(invecs, list):
             if len(self.shifts) != len(invecs):
@@ -75,9 +96,27 @@ class JacobiPreconditioner:
                                  "with number of shifts stored inside "
                                  "precoditioner. Update using the "
                                  "'update_shifts' method.")
-
+            if self.absolute:
+                block = AmplitudeVectorBlock.from_vectors(invecs)
+                return self.apply(block).to_list()
             return [v / (self.diagonal - self.shifts[i])
                     for i, v in enumerate(invecs)]
+        elif isinstance(invecs, AmplitudeVectorBlock):
+            shifts = self.shifts
+            if isinstance(shifts, (float, np.number)):
+                shifts = np.full(len(invecs), shifts)
+            if len(shifts) != len(invecs):
+                raise ValueError("Number of vectors passed does not agree "
+                                 "with number of shifts stored inside "
+                                 "precoditioner. Update using the "
+                                 "'update_shifts' method.")
+            data = {}
+            for b, arr in invecs.data.items():
+                denominator = self.dense_diagonal[b] - shifts[:, None]
+                if self.absolute:
+                    denominator = np.abs(denominator)
+                data[b] = arr / denominator
+            return invecs.from_data(invecs.template, data)
         else:
             raise TypeError("Input type not understood: " + str(type(invecs)))
 
@@ -85,3 +124,119 @@ class JacobiPreconditioner:
         return self.apply(invecs)
 
     # __matvec__
+
+
+class SinglesBlockPreconditioner(JacobiPreconditioner):
+    """
+    Preconditioner combining the exact inverse of the singles block with a
+    Jacobi-type inverse of the remaining blocks
+
+    Represents the application of (M_ss - σ I)^{-1} ⊕ (D_dd - σ I)^{-1},
+    where M_ss is the ph_ph (singles) block of the adcmatrix and D_dd the
+    diagonal of the other blocks. In contrast to the plain
+    JacobiPreconditioner the couplings inside the singles block (e.g.
+    exchange and the ADC(2) i1 / i2 intermediates) are accounted for.
+    The singles block is built on construction as a dense array over the
+    singles elements with the passed `spin_change` (at the cost of one apply
+    of the ph_ph block per element) and diagonalised once, such that
+    applying it with any shift only requires a diagonal scaling in the
+    eigenbasis. The other singles elements, which are not coupled to these
+    by the matrix, are treated like the remaining blocks. Since the
+    singles-dominated part of the problem is inverted (nearly) exactly,
+    this preconditioner should be combined with the Olsen or
+    Jacobi-Davidson correction in the Davidson solver.
+    If `absolute` is True, the absolute values of the shifted eigenvalues
+    and diagonal elements are inverted.
+    """
+    def __init__(self, adcmatrix, shifts=0.0, absolute=False, spin_change=0):
+        super().__init__(adcmatrix, shifts, absolute)
+        if "ph" not in adcmatrix.axis_blocks:
+            raise ValueError("SinglesBlockPreconditioner requires a matrix "
+                             "with a singles (ph) block.")
+        self.singles_indices = self.singles_elements(adcmatrix, spin_change)
+        singles = self.singles_block(adcmatrix, self.singles_indices)
+        self.singles_eigenvalues, self.singles_eigenvectors = \
+            np.linalg.eigh(singles)
+
+    @staticmethod
+    def singles_elements(adcmatrix, spin_change=0):
+        """
+        Return the indices of the singles elements, which achieve the passed
+        spin change, in the flattened layout of the ph block of an
+        AmplitudeVectorBlock. Only C1 symmetry is supported, such that these
+        are all elements of the allowed spin blocks.
+        """
+        if int(spin_change) != spin_change:
+            raise ValueError("spin_change needs to be an integer for the "
+                             "singles block.")
+
+        # Spin projection of the occupied and virtual orbitals
+        ms = []
+        for space in adcmatrix.axis_spaces["ph"]:
+            n_orbs = adcmatrix.mospaces.n_orbs(space)
+            n_orbs_alpha = adcmatrix.mospaces.n_orbs_alpha(space)
+            ms.append(np.where(np.arange(n_orbs) < n_orbs_alpha, 0.5, -0.5))
+        indices = np.flatnonzero(np.add.outer(-ms[0], ms[1]).ravel()
+                                 == spin_change)
+        if indices.size == 0:
+            raise ValueError("The singles block contains no elements with "
+                             f"a spin change of {spin_change}.")
+        return indices
+
+    @staticmethod
+    def singles_block(adcmatrix, indices=None):
+        """
+        Build the singles (ph_ph) block of the matrix as a dense array over the
+        passed `indices` of the flattened layout of the ph block of an
+        AmplitudeVectorBlock (defaults to all elements).
+        """
+        template = adcmatrix.diagonal().ph.nosym_like()
+        shape = template.shape
+        if indices is None:
+            indices = np.arange(int(np.prod(shape)))
+        singles = np.zeros((len(indices), len(indices)))
+        unit = np.zeros(int(np.prod(shape)))
+        for j, index in enumerate(indices):
+            unit[index] = 1.0
+            tensor = template.zeros_like()
+            tensor.set_from_ndarray(unit.reshape(shape))
+            column = adcmatrix.block_apply("ph_ph", tensor).to_ndarray()
+            singles[:, j] = column.ravel()[indices]
+            unit[index] = 0.0
+        return (singles + singles.T) / 2
+
+    def apply(self, invecs):
+        if isinstance(invecs, AmplitudeVector):
+            if not isinstance(self.shifts, (float, np.number)):
+                raise TypeError("Can only apply SinglesBlockPreconditioner "
+                                "to a single vector if shifts is "
+                                "only a single number.")
+            block = AmplitudeVectorBlock.from_vectors([invecs])
+            return self.apply(block)[0]
+        elif isinstance(invecs, list):
+            if len(self.shifts) != len(invecs):
+                raise ValueError("Number of vectors passed does not agree "
+                                 "with number of shifts stored inside "
+                                 "precoditioner. Update using the "
+                                 "'update_shifts' method.")
+            block = AmplitudeVectorBlock.from_vectors(invecs)
+            return self.apply(block).to_list()
+        elif isinstance(invecs, AmplitudeVectorBlock):
+            ret = super().apply(invecs)
+            shifts = self.shifts
+            if isinstance(shifts, (float, np.number)):
+                shifts = np.full(len(invecs), shifts)
+
+            # Exact inverse of the shifted singles block in its eigenbasis
+            U = self.singles_eigenvectors
+            indices = self.singles_indices
+            coefficients = invecs.data["ph"][:, indices] @ U
+            denominator = (self.singles_eigenvalues[None, :]
+                           - np.asarray(shifts)[:, None])
+            if self.absolute:
+                denominator = np.abs(denominator)
+            coefficients /= denominator
+            ret.data["ph"][:, indices] = coefficients @ U.T
+            return ret
+        else:
+            raise TypeError("Input type not understood: " + str(type(invecs)))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import sys
+import numpy as np
+import scipy.linalg as la
+
+from adcc import evaluate
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+class ShiftedState:
+    def __init__(self, shifts):
+        self.shifts = shifts                # Shifts of the systems
+        self.solution = None                # Solutions for all shifts
+        self.residual_norm = None           # Residual norms for all shifts
+        self.converged_shifts = np.zeros(len(shifts), dtype=bool)
+        self.converged = False              # Flag whether all are converged
+        self.n_iter = 0                     # Number of iterations
+        self.n_applies = 0                  # Number of applies
+
+
+def default_print(state, identifier, file=sys.stdout):
+    if identifier == "start" and state.n_iter == 0:
+        print("Niter n_conv  residual_norm", file=file)
+    elif identifier == "next_iter":
+        fmt = "{n_iter:3d}  {n_conv:5d}  {residual:12.5g}"
+        print(fmt.format(n_iter=state.n_iter,
+                         n_conv=np.sum(state.converged_shifts),
+                         residual=np.max(state.residual_norm)), file=file)
+    elif identifier == "is_converged":
+        print("=== Converged ===", file=file)
+        print("    Number of matrix applies:   ", state.n_applies, file=file)
+
+
+def shifted_minres(matrix, rhs, shifts, conv_tol=1e-9, max_iter=100,
+                   callback=None, explicit_symmetrisation=IndexSymmetrisation,
+                   raise_on_max_iter=True):
+    """Solve the shifted systems ``(matrix - shift) @ x = rhs`` for many
+    shifts simultaneously using multi-shift MINRES.
+
+    Since Krylov subspaces are invariant under shifts of the matrix, a single
+    Lanczos sequence built from the unshifted `matrix` and the `rhs` serves
+    all shifts. Only the scalar Givens rotations of MINRES and three vectors
+    per shift (the solution and two update directions) depend on the shift,
+    such that the number of matrix applies is that of the slowest shift
+    instead of the sum over all shifts. Since MINRES only requires the
+    shifted matrices to be symmetric, shifts above excitation energies
+    (indefinite systems) are supported as well. A zero initial guess is
+    used and no preconditioning is possible, as both would break the
+    shift invariance.
+
+    Parameters
+    ----------
+    matrix
+        Matrix object. Should be an ADC matrix.
+    rhs : AmplitudeVector
+        Right-hand side, source.
+    shifts : list or numpy.ndarray
+        Shifts (e.g. frequencies) for which the systems are solved
+    conv_tol : float
+        Convergence tolerance on the l2 norm of residuals to consider
+        them converged. The residual norms are the estimates obtained
+        by the MINRES recurrence.
+    max_iter : int
+        Maximum number of iterations (i.e. matrix applies)
+    callback
+        Callback to call after each iteration
+    explicit_symmetrisation
+        Explicit symmetrisation to apply to the Lanczos vectors
+        (type or instance).
+    raise_on_max_iter : bool
+        Raise a LinAlgError if the maximum number of iterations is reached.
+        If False the unconverged state is returned instead.
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+    if not isinstance(rhs, AmplitudeVector):
+        raise TypeError("rhs needs to be an AmplitudeVector")
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    shifts = np.atleast_1d(np.asarray(shifts, dtype=float))
+    n_shifts = len(shifts)
+    state = ShiftedState(shifts)
+
+    # Lanczos vectors v_{k-1}, v_k (shift-independent) and the per-shift
+    # solutions and MINRES update directions w_{k-1}, w_{k-2}
+    r = AmplitudeVectorBlock.from_vectors([rhs])
+    beta = np.sqrt(r.rowwise_dot(r)[0])
+    v_prev = None
+    X = AmplitudeVectorBlock.from_data(rhs, {
+        b: np.zeros((n_shifts, arr.shape[1])) for b, arr in r.data.items()
+    })
+    W = X.copy()
+    W_prev = X.copy()
+
+    # Per-shift MINRES scalars (Paige and Saunders, SIAM J. Numer. Anal. 12,
+    # 617 (1975), with the notation of scipy.sparse.linalg.minres)
+    cs = -np.ones(n_shifts)
+    sn = np.zeros(n_shifts)
+    dbar = np.zeros(n_shifts)
+    epsln = np.zeros(n_shifts)
+    phibar = np.full(n_shifts, beta)
+    state.residual_norm = phibar.copy()
+    active = np.flatnonzero(state.residual_norm >= conv_tol)
+    state.converged_shifts[:] = state.residual_norm < conv_tol
+
+    def finalise(state):
+        state.solution = X.to_list()
+        return state
+
+    callback(state, "start")
+    if len(active) == 0:
+        state.converged = True
+        callback(state, "is_converged")
+        return finalise(state)
+
+    beta_prev = 0.0
+    v = r / beta
+    while state.n_iter < max_iter:
+        state.n_iter += 1
+
+        # Lanczos step: Av = beta_prev v_prev + alpha v + beta v_next
+        Av = AmplitudeVectorBlock.from_vectors([evaluate(matrix @ v[0])])
+        state.n_applies += 1
+        alpha = v.rowwise_dot(Av)[0]
+        r = Av - v * alpha
+        if v_prev is not None:
+            r = r - v_prev * beta_prev
+        if explicit_symmetrisation:
+            r = explicit_symmetrisation.symmetrise(r)
+        beta_next = np.sqrt(r.rowwise_dot(r)[0])
+
+        # Givens rotations for each shift, where the diagonal of the
+        # shifted tridiagonal matrix is alpha - shift
+        alfa = alpha - shifts[active]
+        oldeps = epsln[active]
+        delta = cs[active] * dbar[active] + sn[active] * alfa
+        gbar = sn[active] * dbar[active] - cs[active] * alfa
+        epsln[active] = sn[active] * beta_next
+        dbar[active] = -cs[active] * beta_next
+        gamma = np.maximum(np.hypot(gbar, beta_next), np.finfo(float).eps)
+        cs[active] = gbar / gamma
+        sn[active] = beta_next / gamma
+        phi = cs[active] * phibar[active]
+        phibar[active] = sn[active] * phibar[active]
+
+        # w_k = (v_k - oldeps w_{k-2} - delta w_{k-1}) / gamma
+        W_new = (v.lincomb(np.ones((len(active), 1)))
+                 - W[active] * delta - W_prev[active] * oldeps) / gamma
+        W_prev[active] = W[active]
+        W[active] = W_new
+        X[active] = X[active] + W_new * phi
+
+        state.residual_norm[active] = np.abs(phibar[active])
+        state.converged_shifts = state.residual_norm < conv_tol
+        callback(state, "next_iter")
+        active = np.flatnonzero(~state.converged_shifts)
+        if len(active) == 0 or beta_next < np.finfo(float).eps * beta:
+            # All converged or Krylov space exhausted (exact solutions)
+            state.converged = True
+            callback(state, "is_converged")
+            return finalise(state)
+
+        if state.n_iter == max_iter:
+            if not raise_on_max_iter:
+                return finalise(state)
+            raise la.LinAlgError("Maximum number of iterations (== "
+                                 + str(max_iter) + " reached in shifted "
+                                 "MINRES procedure.")
+
+        v_prev, v = v, r / beta_next
+        beta_prev = beta_next
+    return finalise(state)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import sys
+import numpy as np
+
+from adcc.AdcMatrix import AdcMatrixlike
+from adcc.AmplitudeVector import AmplitudeVector
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+from adcc.visualisation import shapefctns
+
+from .LanczosIterator import LanczosIterator
+from .explicit_symmetrisation import IndexSymmetrisation
+
+
+def broaden(energies, nodes, weights, width, shape="lorentzian"):
+    """
+    Broaden the lines with positions `nodes` and intensities `weights` and
+    evaluate the result at `energies`.
+    """
+    if not hasattr(shapefctns, shape):
+        raise ValueError("Unknown broadening function: " + shape)
+    shapefctn = getattr(shapefctns, shape)
+    energies = np.asarray(energies)
+    return shapefctn(energies[:, None], nodes[None, :], width) @ weights
+
+
+class SpectralFunctionState:
+    def __init__(self, iterator):
+        """Initialise a SpectralFunctionState.
+
+        The state represents the spectral function of the matrix with respect
+        to the transition moments by a Gauss quadrature: The nodes are the
+        eigenvalues of the block-tridiagonal Lanczos matrix and the weights
+        follow from the first components of its eigenvectors.
+
+        Parameters
+        ----------
+        iterator : LanczosIterator
+            Iterator generating the Lanczos subspace
+        """
+        self.matrix = iterator.matrix
+        self.excitation_energy = None     # Quadrature nodes
+        self.transition_dipole_moment = None  # Quadrature amplitudes
+        self.spectrum_change = None       # Change of the broadened spectrum
+        self.converged = False            # Flag whether iteration is converged
+        self.n_iter = 0                   # Number of iterations
+        self.n_applies = 0                # Number of applies
+        self.n_reorthogonalisations = 0   # Number of reorthogonalisations
+        self.algorithm = "lanczos_spectrum"
+        self.timer = iterator.timer
+
+    @property
+    def oscillator_strength(self):
+        """Oscillator strengths, i.e. the weights of the quadrature nodes"""
+        return 2. / 3. * (np.sum(self.transition_dipole_moment**2, axis=1)
+                          * np.abs(self.excitation_energy))
+
+    def broadened(self, energies, width=0.01, shape="lorentzian"):
+        """
+        Evaluate the broadened spectrum of oscillator strengths on the passed
+        energies (in atomic units).
+
+        Parameters
+        ----------
+        energies : numpy.ndarray
+            Energies at which the spectrum is evaluated
+        width : float, optional
+            Gaussian broadening standard deviation or Lorentzian broadening
+            gamma parameter (in atomic units)
+        shape : str, optional
+            The broadening to use (lorentzian or gaussian)
+        """
+        return broaden(energies, self.excitation_energy,
+                       self.oscillator_strength, width, shape)
+
+    def to_spectrum(self):
+        """
+        Return the quadrature nodes and oscillator strengths as an
+        :class:`adcc.visualisation.ExcitationSpectrum` (in atomic units),
+        which can be broadened using its `broaden_lines` function.
+        """
+        from adcc.visualisation import ExcitationSpectrum
+
+        sp = ExcitationSpectrum(self.excitation_energy, self.oscillator_strength)
+        sp.xlabel = "Energy (au)"
+        sp.ylabel = "Oscillator strengths (au)"
+        return sp
+
+
+def default_print(state, identifier, file=sys.stdout):
+    """
+    A default print function for the lanczos_spectrum callback
+    """
+    from adcc.timings import strtime, strtime_short
+
+    if identifier == "start" and state.n_iter == 0:
+        print("Niter n_applies  spectrum_change  time", file=file)
+    elif identifier == "next_iter":
+        time_iter = state.timer.current("iteration")
+        change = state.spectrum_change
+        if change is None:
+            change = np.inf
+        fmt = "{n_iter:3d}  {n_applies:9d}  {change:15.5g}  {tstr:5s}"
+        print(fmt.format(n_iter=state.n_iter, n_applies=state.n_applies,
+                         change=change, tstr=strtime_short(time_iter)),
+              file=file)
+    elif identifier == "is_converged":
+        soltime = state.timer.total("iteration")
+        print("=== Converged ===", file=file)
+        print("    Number of matrix applies:   ", state.n_applies, file=file)
+        print("    Total solver time:          ", strtime(soltime), file=file)
+
+
+def default_transition_moments(matrix):
+    """
+    Modified transition moments of the electric dipole operator for the
+    method of the passed ADC matrix (ADC(2) for ADC(3) and higher).
+    """
+    from adcc.adc_pp import modified_transition_moments
+
+    method = matrix.method
+    if method.level >= 3:
+        method = method.at_level(2)
+    return modified_transition_moments(method, matrix.ground_state,
+                                       intermediates=matrix.intermediates)
+
+
+def gauss_quadrature(subspace, moments_r):
+    """
+    Compute nodes and amplitudes of the Gauss quadrature representing
+    the spectral function in the Lanczos subspace.
+
+    Parameters
+    ----------
+    subspace : LanczosSubspace
+        Lanczos subspace started from the orthonormalised transition moments
+    moments_r : numpy.ndarray
+        Triangular factor relating the transition moments F to the first
+        Lanczos block V_1 by ``F = V_1 * moments_r``.
+    """
+    nodes, vectors = np.linalg.eigh(subspace.subspace_matrix)
+    # F_c^T y_n = sum_i (V_1)_i^T y_n R_{i,c} = (Y_1^T R)_{n,c}
+    amplitudes = vectors[:subspace.n_block, :].T @ moments_r
+    return nodes, amplitudes
+
+
+def lanczos_spectrum_iterations(iterator, moments_r, conv_tol=1e-4,
+                                max_iter=100, width=0.01, energy_range=None,
+                                callback=None):
+    """Drive the Lanczos iterations for the spectral function
+
+    Parameters
+    ----------
+    iterator : LanczosIterator
+        Iterator generating the Lanczos subspace started from the
+        orthonormalised transition moments
+    moments_r : numpy.ndarray
+        Triangular factor relating the transition moments F to the
+        first Lanczos block V_1 by ``F = V_1 * moments_r``.
+    conv_tol : float, optional
+        Convergence tolerance on the maximal change of the broadened spectrum
+        between two iterations relative to the maximal intensity.
+    max_iter : int, optional
+        Maximal number of iterations
+    width : float, optional
+        Lorentzian broadening used for the convergence check
+    energy_range : tuple or NoneType, optional
+        Energy window in which convergence is checked. By default the range
+        of the quadrature nodes is used.
+    callback : callable, optional
+        Callback to run after each iteration
+    """
+    if callback is None:
+        def callback(state, identifier):
+            pass
+
+    state = SpectralFunctionState(iterator)
+    callback(state, "start")
+    state.timer.restart("iteration")
+
+    previous = None
+    for subspace in iterator:
+        with state.timer.record("quadrature"):
+            nodes, amplitudes = gauss_quadrature(subspace, moments_r)
+        state.excitation_energy = nodes
+        state.transition_dipole_moment = amplitudes
+        state.n_iter = subspace.n_iter
+        state.n_applies = subspace.n_applies
+        state.n_reorthogonalisations = subspace.n_reorthogonalisations
+
+        if energy_range is None:
+            emin, emax = nodes[0], nodes[-1]
+        else:
+            emin, emax = energy_range
+        n_points = max(100, int(np.ceil(4 * (emax - emin) / width)))
+        grid = np.linspace(emin, emax, n_points)
+        spectrum = state.broadened(grid, width=width)
+        if previous is not None:
+            spectrum_previous = broaden(grid, *previous, width)
+            scale = max(np.max(np.abs(spectrum)), np.finfo(float).tiny)
+            state.spectrum_change = \
+                np.max(np.abs(spectrum - spectrum_previous)) / scale
+        previous = (nodes, state.oscillator_strength)
+
+        callback(state, "next_iter")
+        state.timer.restart("iteration")
+
+        if state.spectrum_change is not None \
+                and state.spectrum_change < conv_tol:
+            state.converged = True
+            callback(state, "is_converged")
+            state.timer.stop("iteration")
+            return state
+
+        if state.n_iter >= max_iter:
+            state.timer.stop("iteration")
+            return state
+
+    # The Krylov space is exhausted, so the quadrature is exact
+    state.converged = True
+    callback(state, "is_converged")
+    state.timer.stop("iteration")
+    return state
+
+
+def lanczos_spectrum(matrix, transition_moments=None, conv_tol=1e-4,
+                     max_iter=100, width=0.01, energy_range=None,
+                     callback=None, explicit_symmetrisation=IndexSymmetrisation,
+                     reorthogonalisation="partial"):
+    """Compute the (broadened) absorption spectrum of an ADC matrix by block
+    Lanczos without converging individual eigenstates
+
+    The block Lanczos iteration is started from the modified transition
+    moments F of the three dipole components. After k block steps the
+    block-tridiagonal Lanczos matrix T defines a Gauss quadrature for the
+    spectral function ``F^T δ(ω - A) F``, which exactly reproduces its first
+    2k moments. The quadrature nodes (eigenvalues of T) and weights (first
+    components of the eigenvectors of T) are returned as an oscillator
+    strength spectrum, which is equivalent to the continued-fraction
+    representation of the Lorentzian-broadened spectrum. No Ritz vectors
+    are formed, such that the cost is dominated by the matrix applies.
+
+    Parameters
+    ----------
+    matrix
+        ADC matrix instance
+    transition_moments : list, optional
+        Transition moment vectors starting the Lanczos iteration. By default
+        the modified transition moments of the electric dipole operator
+        are computed for the method of the matrix (ADC(2) for ADC(3)).
+    conv_tol : float, optional
+        Convergence tolerance on the maximal change of the broadened spectrum
+        between two iterations relative to its maximal intensity
+    max_iter : int, optional
+        Maximal number of block Lanczos steps
+    width : float, optional
+        Lorentzian broadening (in atomic units) employed to check
+        the convergence of the spectrum
+    energy_range : tuple or NoneType, optional
+        Energy window (in atomic units) in which the convergence is checked.
+        By default the range of the quadrature nodes is used.
+    callback : callable, optional
+        Callback to run after each iteration
+    explicit_symmetrisation : optional
+        Explicit symmetrisation to use after orthogonalising the
+        subspace vectors (type or instance).
+    reorthogonalisation : str, optional
+        Reorthogonalisation strategy of the Lanczos iterator
+        ("full" or "partial")
+    """
+    if not isinstance(matrix, AdcMatrixlike):
+        raise TypeError("matrix is not of type AdcMatrixlike")
+    if transition_moments is None:
+        transition_moments = default_transition_moments(matrix)
+    if isinstance(transition_moments, AmplitudeVector):
+        transition_moments = [transition_moments]
+    for moment in transition_moments:
+        if not isinstance(moment, AmplitudeVector):
+            raise TypeError("One of the transition moments is not of type "
+                            "AmplitudeVector")
+
+    if explicit_symmetrisation is not None and \
+            isinstance(explicit_symmetrisation, type):
+        explicit_symmetrisation = explicit_symmetrisation(matrix)
+
+    # Components vanishing by symmetry do not contribute to the spectrum
+    moments = AmplitudeVectorBlock.from_vectors(transition_moments)
+    norms = moments.norms()
+    nonzero = norms > np.finfo(float).eps * max(1.0, np.max(norms))
+    if not np.any(nonzero):
+        raise ValueError("All transition moments are zero.")
+    moments = moments[np.flatnonzero(nonzero)]
+
+    iterator = LanczosIterator(matrix, moments,
+                               explicit_symmetrisation=explicit_symmetrisation,
+                               reorthogonalisation=reorthogonalisation)
+    guesses, moments_r = iterator.ortho.qr(moments)
+    iterator.residual = guesses
+
+    # Zero rows for the vanishing components keep the amplitudes
+    # aligned with the passed transition moments
+    moments_r_full = np.zeros((len(guesses), len(transition_moments)))
+    moments_r_full[:, nonzero] = moments_r
+    return lanczos_spectrum_iterations(iterator, moments_r_full, conv_tol,
+                                       max_iter, width, energy_range, callback)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import pytest
+import unittest
+
+from pytest import approx
+
+from adcc import LazyMp
+from adcc.testdata.cache import cache
+from adcc.solver.chebyshev import chebyshev, estimate_spectral_bounds
+
+
+class TestSolverChebyshev(unittest.TestCase):
+    def test_adc2_singlets(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = chebyshev(matrix, guesses, n_ep=6, degree=12)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets[:6])
+        lower, upper = res.spectral_bounds
+        assert upper > ref_singlets[-1]
+        assert upper > res.filter_bounds[0]
+
+    def test_spectral_bounds_invalid_guess(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guess = adcc.guesses_singlet(matrix, n_guesses=1, block="ph")[0]
+
+        lower, upper, n_applies = estimate_spectral_bounds(matrix, guess, 1)
+        assert lower <= upper
+        assert n_applies == 1
+        with pytest.raises(ValueError):
+            estimate_spectral_bounds(matrix, guess, 0)
+        with pytest.raises(ValueError):
+            estimate_spectral_bounds(matrix, guess.zeros_like())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import os
+import adcc
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pytest
+
+from pytest import approx
+
+from adcc import AmplitudeVectorBlock, LazyMp
+from adcc.testdata.cache import cache
+from adcc.solver.lanczos import lanczos
+from adcc.solver.davidson import jacobi_davidson
+from adcc.solver.checkpoint import SolverCheckpoint
+
+
+class TestSolverCheckpoint(unittest.TestCase):
+    def test_davidson_restart(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=6, block="ph")
+        kwargs = dict(n_ep=6, lock_converged=False)
+
+        full = jacobi_davidson(matrix, guesses, **kwargs)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "checkpoint.hdf5")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                part = jacobi_davidson(matrix, guesses, max_iter=3,
+                                       checkpoint=fn, **kwargs)
+            assert not part.converged
+            res = jacobi_davidson(matrix, guesses, restart_from=fn, **kwargs)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:6]
+        assert res.converged
+        assert res.n_iter == full.n_iter
+        assert res.n_applies == full.n_applies
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_davidson_restart_locking(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=6, block="ph")
+        kwargs = dict(n_ep=6, lock_converged=True)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "checkpoint.hdf5")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                part = jacobi_davidson(matrix, guesses, max_iter=6,
+                                       checkpoint=fn, **kwargs)
+            assert not part.converged
+            with SolverCheckpoint(fn, "r") as checkpoint:
+                retired = checkpoint.load("state")["retired"]
+                assert retired.shape == (6, )
+            res = jacobi_davidson(matrix, guesses, restart_from=fn, **kwargs)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:6]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_davidson_restart_mixed_precision(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        kwargs = dict(n_ep=9, mixed_precision_tol=1e-4)
+
+        full = jacobi_davidson(matrix, guesses, **kwargs)
+        i_switch = full.precision_switch_iter
+        assert i_switch is not None and i_switch + 1 < full.n_iter
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "checkpoint.hdf5")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                part = jacobi_davidson(matrix, guesses, max_iter=i_switch + 1,
+                                       checkpoint=fn, **kwargs)
+            assert part.precision_switch_iter == i_switch
+
+            # The single-precision vectors written before the switch
+            # are replaced by the double-precision ones
+            with SolverCheckpoint(fn, "r") as checkpoint:
+                stored = checkpoint.load_vectors("subspace_vectors",
+                                                 guesses[0])
+            assert stored.dtype == np.float64
+            for b in stored.data:
+                np.testing.assert_array_equal(
+                    stored.data[b], part.subspace_vectors.data[b])
+            res = jacobi_davidson(matrix, guesses, restart_from=fn, **kwargs)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.n_iter == full.n_iter
+        assert res.subspace_vectors.dtype == np.float64
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_killed_during_flush(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=5, block="ph")
+        block = AmplitudeVectorBlock.from_vectors(guesses)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "checkpoint.hdf5")
+            checkpoint = SolverCheckpoint(fn)
+            checkpoint.store_vectors("vectors", block[:2])
+            checkpoint.store("state", {"n_iter": 1})
+            checkpoint.flush()
+            checkpoint.store_vectors("vectors", block[:4], n_unchanged=2)
+            checkpoint.store("state", {"n_iter": 2})
+            checkpoint.flush()
+
+            # Collapse of the vectors, job killed before committing
+            checkpoint.store_vectors("vectors", block[3:])
+            checkpoint.store("state", {"n_iter": 3})
+            checkpoint.close()
+            with SolverCheckpoint(fn) as checkpoint:
+                assert checkpoint.load("state")["n_iter"] == 2
+                stored = checkpoint.load_vectors("vectors", guesses[0])
+                np.testing.assert_allclose(stored.dot(block),
+                                           block[:4].dot(block), atol=1e-14)
+
+                # Collapse of the vectors, job killed while committing
+                checkpoint.store_vectors("vectors", block[3:])
+                checkpoint.store("state", {"n_iter": 3})
+                move = checkpoint.h5f.move
+
+                def killed_move(source, dest):
+                    move(source, dest)
+                    raise KeyboardInterrupt
+
+                checkpoint.h5f.move = killed_move
+                with pytest.raises(KeyboardInterrupt):
+                    checkpoint.flush()
+            with SolverCheckpoint(fn) as checkpoint:
+                assert checkpoint.load("state")["n_iter"] == 3
+                stored = checkpoint.load_vectors("vectors", guesses[0])
+                np.testing.assert_allclose(stored.dot(block),
+                                           block[3:].dot(block), atol=1e-14)
+
+    def test_lanczos_restart(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=5, block="ph")
+
+        full = lanczos(matrix, guesses, n_ep=5, which="SM")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "checkpoint.hdf5")
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                part = lanczos(matrix, guesses, n_ep=5, which="SM",
+                               max_iter=4, checkpoint=fn)
+            assert not part.converged
+            res = lanczos(matrix, guesses, n_ep=5, which="SM", restart_from=fn)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:5]
+        assert res.converged
+        assert res.n_applies == full.n_applies
+        assert res.eigenvalues == approx(ref_singlets)
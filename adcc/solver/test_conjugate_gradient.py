@@ -21,6 +21,7 @@
 ##
 ## ---------------------------------------------------------------------
 import adcc
+import pytest
 import unittest
 import numpy as np
 
@@ -29,7 +30,9 @@ from pytest import approx
 from adcc.solver import IndexSpinSymmetrisation
 from adcc.solver.power_method import default_print as powprint, power_method
 from adcc.solver.preconditioner import JacobiPreconditioner
-from adcc.solver.conjugate_gradient import (IterativeInverse,
+from adcc.AdcMatrix import AdcMatrixShifted
+from adcc.solver.conjugate_gradient import (DeflationSpace, IterativeInverse,
+                                            block_conjugate_gradient,
                                             conjugate_gradient,
                                             default_print as cgprint,
                                             guess_from_previous)
@@ -94,3 +97,60 @@ class TestConjugateGradient(unittest.TestCase):
                                  conv_tol=conv_tol, Pinv=JacobiPreconditioner)
         residual = matrix @ res.solution - rhs
         assert np.sqrt(residual @ residual) < conv_tol
+
+    def test_adc2_block_linear_solve(self):
+        conv_tol = 1e-9
+        matrix = adcc.AdcMatrix("adc2", cache.refstate["h2o_sto3g"])
+        rhss = []
+        for _ in range(3):
+            rhs = adcc.guess_zero(matrix)
+            rhs.set_random()
+            rhss.append(rhs)
+        # Linearly dependent right-hand side, which needs to be deflated
+        rhss.append(adcc.evaluate(rhss[0] + 2.0 * rhss[1]))
+
+        res = block_conjugate_gradient(matrix, rhss, rhss, callback=cgprint,
+                                       conv_tol=conv_tol,
+                                       Pinv=JacobiPreconditioner)
+        assert res.converged
+        for x, rhs in zip(res.solution, rhss):
+            residual = matrix @ x - rhs
+            assert np.sqrt(residual @ residual) < conv_tol
+
+        # Start from zero guesses
+        res = block_conjugate_gradient(matrix, rhss[:3], conv_tol=conv_tol,
+                                       Pinv=JacobiPreconditioner)
+        assert res.converged
+        for x, rhs in zip(res.solution, rhss):
+            residual = matrix @ x - rhs
+            assert np.sqrt(residual @ residual) < conv_tol
+
+        inverse = IterativeInverse(matrix, Pinv=JacobiPreconditioner,
+                                   conv_tol=conv_tol, block=True)
+        for x, rhs in zip(inverse @ rhss[:3], rhss):
+            residual = matrix @ x - rhs
+            assert np.sqrt(residual @ residual) < conv_tol
+        with pytest.raises(ValueError):
+            IterativeInverse(matrix, block=True, cg_type="fletcher_reeves")
+
+    def test_adc2_deflated_linear_solve(self):
+        conv_tol = 1e-8
+        refstate = cache.refstate["h2o_sto3g"]
+        state = adcc.adc2(refstate, n_singlets=3, conv_tol=1e-10)
+        rhs = adcc.guess_zero(state.matrix)
+        rhs.set_random()
+
+        # Close to the first resonance
+        shift = 0.95 * state.excitation_energy[0]
+        matrix = AdcMatrixShifted(state.matrix, -shift)
+        deflation = DeflationSpace(state.matrix, state).shifted(-shift)
+
+        results = []
+        for defl in (None, deflation):
+            res = conjugate_gradient(matrix, rhs, rhs, callback=cgprint,
+                                     conv_tol=conv_tol, max_iter=500,
+                                     Pinv=JacobiPreconditioner, deflation=defl)
+            residual = matrix @ res.solution - rhs
+            assert np.sqrt(residual @ residual) < conv_tol
+            results.append(res)
+        assert results[1].n_iter <= results[0].n_iter
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from numpy.testing import assert_allclose
+
+from adcc import LazyMp
+from adcc.testdata.cache import cache
+from adcc.solver.damped_response import damped_response
+
+
+class TestSolverDampedResponse(unittest.TestCase):
+    def test_adc2_singlet_resonances(self):
+        refdata = cache.reference_data["h2o_sto3g"]["adc2"]["singlet"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        # At the resonances the reference states dominate the spectrum
+        damping = 1e-3
+        energies = refdata["eigenvalues"]
+        tdms = refdata["transition_dipole_moments"]
+        frequencies = energies[:3]
+        res = damped_response(matrix, frequencies, damping, conv_tol=1e-6,
+                              batch_size=2)
+        assert res.converged
+
+        lorentzian = (damping / ((energies - frequencies[:, None])**2
+                                 + damping**2)
+                      - damping / ((energies + frequencies[:, None])**2
+                                   + damping**2))
+        ref = lorentzian @ np.sum(tdms**2, axis=1) / 3
+        assert_allclose(res.isotropic_polarisability.imag, ref, rtol=1e-3)
+        assert_allclose(res.polarisability, res.polarisability.transpose(0, 2, 1),
+                        atol=1e-8)
+
+    def test_adc2_singlet_restart(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        energies = cache.reference_data["h2o_sto3g"]["adc2"]["singlet"][
+            "eigenvalues"]
+        frequencies = energies[:3]
+
+        ref = damped_response(matrix, frequencies, 1e-3, conv_tol=1e-6,
+                              batch_size=2)
+        res = damped_response(matrix, frequencies, 1e-3, conv_tol=1e-6,
+                              batch_size=2, max_subspace=60, max_iter=300)
+        assert res.converged
+        assert res.n_restarts > 0
+        assert ref.n_restarts == 0
+        assert_allclose(res.isotropic_polarisability.imag,
+                        ref.isotropic_polarisability.imag, rtol=1e-3)
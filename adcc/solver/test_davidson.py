@@ -22,12 +22,17 @@
 ## ---------------------------------------------------------------------
 import adcc
 import unittest
+import numpy as np
 
 from pytest import approx
 
 from adcc import LazyMp
 from adcc.testdata.cache import cache
-from adcc.solver.davidson import jacobi_davidson
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+from adcc.solver.davidson import (ProjectedShiftedMatrix, jacobi_davidson,
+                                  jacobi_davidson_correction)
+from adcc.solver.preconditioner import (JacobiPreconditioner,
+                                        SinglesBlockPreconditioner)
 
 
 class TestSolverDavidson(unittest.TestCase):
@@ -54,3 +59,159 @@ class TestSolverDavidson(unittest.TestCase):
         ref_triplets = refdata["adc2"]["triplet"]["eigenvalues"]
         assert res.converged
         assert res.eigenvalues == approx(ref_triplets)
+
+    def test_adc2_singlets_locking(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=9)
+        res_locked = jacobi_davidson(matrix, guesses, n_ep=9,
+                                     lock_converged=True)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.n_locked == 0
+        assert res.eigenvalues == approx(ref_singlets)
+        assert res_locked.converged
+        assert res_locked.eigenvalues == approx(ref_singlets)
+        assert res_locked.n_applies <= res.n_applies
+
+    def test_adc2_singlets_out_of_core(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        vector_bytes = 8 * matrix.shape[1]
+        res = jacobi_davidson(matrix, guesses, n_ep=9,
+                              max_memory=20 * vector_bytes)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.subspace_vectors.is_out_of_core
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_adc2_singlets_olsen(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=9,
+                              preconditioning_method="Olsen")
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_adc2_singlets_singles_block_preconditioner(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=9,
+                              preconditioner=SinglesBlockPreconditioner,
+                              preconditioning_method="Olsen")
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_adc2_singlets_jacobi_davidson_correction(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=9,
+                              preconditioning_method="Jacobi-Davidson",
+                              correction_max_iter=2)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+
+    def test_jacobi_davidson_correction_indefinite(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=6, block="ph")
+
+        # Shift inside the spectrum, such that the projected shifted
+        # matrix of the correction equation is indefinite
+        u = guesses[5] / np.sqrt(guesses[5] @ guesses[5])
+        rval = u @ (matrix @ u)
+        residual = adcc.evaluate(matrix @ u - rval * u)
+        preconditioner = JacobiPreconditioner(matrix)
+
+        def correction_residual_norm(max_iter):
+            corrections, n_applies = jacobi_davidson_correction(
+                matrix, preconditioner,
+                AmplitudeVectorBlock.from_vectors([residual]),
+                AmplitudeVectorBlock.from_vectors([u]), np.array([rval]),
+                max_iter=max_iter,
+            )
+            assert not preconditioner.absolute
+            assert 0 < n_applies <= max_iter + 1
+
+            t = corrections[0]
+            assert abs(t @ u) < 1e-10
+            diff = ProjectedShiftedMatrix(matrix, u, rval) @ t + residual
+            return np.sqrt(diff @ diff)
+
+        # max_iter == 0 returns the Olsen starting guess
+        assert correction_residual_norm(20) < correction_residual_norm(0)
+
+    def test_adc2_singlets_restart(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=4, block="ph")
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:4]
+
+        for n_ritz, n_previous in [(None, None), (None, 4), (6, 2)]:
+            kwargs = {}
+            if n_previous is not None:
+                kwargs["n_restart_previous"] = n_previous
+            res = jacobi_davidson(matrix, guesses, n_ep=4, max_subspace=12,
+                                  n_restart_ritz=n_ritz, **kwargs)
+            assert res.converged
+            assert res.eigenvalues == approx(ref_singlets)
+            assert len(res.restart_statistics) > 0
+            for stats in res.restart_statistics:
+                assert stats["subspace_size_after"] <= 12 - 4
+                if n_previous is None:
+                    # GD+k restart is disabled by default
+                    assert stats["n_previous"] == 0
+
+    def test_adc2_singlets_max_expansion(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=8, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=5, max_expansion=3)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:5]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+        assert res.n_applies <= 8 + 3 * res.n_iter
+
+    def test_adc2_singlets_mixed_precision(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        events = []
+
+        def callback(state, identifier):
+            events.append((identifier, state.n_iter))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=9, block="ph")
+        res = jacobi_davidson(matrix, guesses, n_ep=9, mixed_precision_tol=1e-4,
+                              callback=callback)
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"]
+        assert res.converged
+        assert res.precision_switch_iter is not None
+
+        # The Ritz pairs are recomputed in the iteration of the switch
+        i_switch = events.index(("precision_switch", res.precision_switch_iter))
+        assert events[i_switch + 1] == ("next_iter", res.precision_switch_iter)
+        n_iter_events = [n for ident, n in events if ident == "next_iter"]
+        assert n_iter_events == list(range(1, res.n_iter + 1))
+        assert res.subspace_vectors.dtype == np.float64
+        assert res.eigenvalues == approx(ref_singlets)
@@ -60,6 +60,20 @@ class TestSolverLanczos(unittest.TestCase):
         assert res.converged
         assert res.eigenvalues == approx(ref_triplets)
 
+    def test_adc2_singlets_partial_reorthogonalisation(self):
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        guesses = adcc.guesses_singlet(matrix, n_guesses=5, block="ph")
+        res = lanczos(matrix, guesses, n_ep=5, which="SM", debug_checks=True,
+                      reorthogonalisation="partial")
+
+        ref_singlets = refdata["adc2"]["singlet"]["eigenvalues"][:5]
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets)
+        assert res.n_reorthogonalisations < res.n_iter
+        assert res.subspace_orthogonality < 1e-7
+
     def test_adc2_shift_invert_singlets(self):
         refdata = cache.reference_data["h2o_sto3g"]
         matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
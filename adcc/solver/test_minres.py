@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from adcc.AdcMatrix import AdcMatrixShifted
+from adcc.solver.minres import minres
+from adcc.solver.preconditioner import JacobiPreconditioner
+from adcc.solver.conjugate_gradient import default_print as cgprint
+from adcc.testdata.cache import cache
+
+
+class TestMinres(unittest.TestCase):
+    def test_adc2_indefinite_linear_solve(self):
+        conv_tol = 1e-8
+        refdata = cache.reference_data["h2o_sto3g"]
+        matrix = adcc.AdcMatrix("adc2", cache.refstate["h2o_sto3g"])
+        rhs = adcc.guess_zero(matrix)
+        rhs.set_random()
+
+        # Between the first and second singlet excitation energy
+        eigenvalues = refdata["adc2"]["singlet"]["eigenvalues"]
+        shift = (eigenvalues[0] + eigenvalues[1]) / 2
+        shifted = AdcMatrixShifted(matrix, -shift)
+        for Pinv in (None, JacobiPreconditioner):
+            res = minres(shifted, rhs, callback=cgprint, conv_tol=conv_tol,
+                         max_iter=300, Pinv=Pinv)
+            assert res.converged
+            residual = shifted @ res.solution - rhs
+            assert np.sqrt(residual @ residual) < conv_tol
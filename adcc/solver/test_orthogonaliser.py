@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from numpy.testing import assert_allclose
+
+from adcc import LazyMp
+from adcc.testdata.cache import cache
+from adcc.AmplitudeVectorBlock import AmplitudeVectorBlock
+from adcc.solver.orthogonaliser import (CholeskyQROrthogonaliser,
+                                        GramSchmidtOrthogonaliser)
+
+
+class TestCholeskyQROrthogonaliser(unittest.TestCase):
+    def setUp(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        guesses = adcc.guesses_singlet(matrix, n_guesses=6, block="ph")
+        self.ortho = CholeskyQROrthogonaliser()
+        self.subspace = AmplitudeVectorBlock.from_vectors(guesses[:3])
+        self.vectors = AmplitudeVectorBlock.from_vectors(
+            [adcc.evaluate(matrix @ v) for v in guesses[3:]]
+        )
+
+    def test_qr(self):
+        reference, reference_r = GramSchmidtOrthogonaliser().qr(self.vectors)
+        q, r = self.ortho.qr(self.vectors)
+        assert_allclose(q.dot(q), np.eye(len(q)), atol=1e-12)
+        assert_allclose(np.abs(r), np.abs(reference_r), atol=1e-12)
+        assert_allclose(np.abs(q.dot(reference)), np.eye(len(q)), atol=1e-12)
+
+    def test_qr_dependent(self):
+        # The last vector is linearly dependent on the others
+        vectors = self.vectors.copy()
+        vectors.extend([adcc.evaluate(self.vectors[0] - 2 * self.vectors[1])])
+        q, r = self.ortho.qr(vectors)
+        assert len(q) == len(vectors)
+        assert abs(r[-1, -1]) < 1e-8 * abs(r[0, 0])
+        for b in vectors.blocks_ph:
+            assert_allclose(q.lincomb(np.transpose(r)).data[b],
+                            vectors.data[b], atol=1e-12)
+
+        # The independent vectors are unaffected
+        reference, reference_r = self.ortho.qr(self.vectors)
+        assert_allclose(r[:-1, :-1], reference_r, atol=1e-12)
+        assert_allclose(q[:-1].dot(reference), np.eye(len(reference)),
+                        atol=1e-12)
+
+    def test_orthonormalise_against(self):
+        # The last vector is linearly dependent and has to be dropped
+        vectors = self.vectors.copy()
+        vectors.extend([adcc.evaluate(2 * self.subspace[0] + self.vectors[0]
+                                      - self.vectors[1])])
+        new = self.ortho.orthonormalise_against(vectors, self.subspace,
+                                                min_norm=1e-8)
+        assert len(new) == len(self.vectors)
+        assert_allclose(new.dot(new), np.eye(len(new)), atol=1e-12)
+        assert_allclose(new.dot(self.subspace), 0, atol=1e-12)
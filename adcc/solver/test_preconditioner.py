@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from adcc import LazyMp
+from adcc.testdata.cache import cache
+from adcc.solver.preconditioner import SinglesBlockPreconditioner
+
+
+class TestSinglesBlockPreconditioner(unittest.TestCase):
+    def base_test_singles_block(self, case, method, spin_change=0):
+        if adcc.AdcMethod(method).is_core_valence_separated:
+            ground_state = LazyMp(cache.refstate_cvs[case])
+        else:
+            ground_state = LazyMp(cache.refstate[case])
+        matrix = adcc.AdcMatrix(method, ground_state)
+
+        indices = SinglesBlockPreconditioner.singles_elements(matrix,
+                                                              spin_change)
+        singles = SinglesBlockPreconditioner.singles_block(matrix, indices)
+        assert singles.shape == (len(indices), len(indices))
+
+        template = matrix.diagonal().ph.nosym_like()
+        rng = np.random.default_rng(42)
+        for _ in range(3):
+            vector = np.zeros(template.size)
+            vector[indices] = rng.standard_normal(len(indices))
+            tensor = template.zeros_like()
+            tensor.set_from_ndarray(vector.reshape(template.shape))
+            ref = matrix.block_apply("ph_ph", tensor).to_ndarray().ravel()
+
+            # The other spin blocks are not coupled to the selected elements
+            np.testing.assert_allclose(singles @ vector[indices], ref[indices],
+                                       atol=1e-12)
+            np.testing.assert_allclose(np.delete(ref, indices), 0, atol=1e-12)
+
+    def test_singles_block_h2o(self):
+        self.base_test_singles_block("h2o_sto3g", "adc2")
+
+    def test_singles_block_h2o_cvs(self):
+        self.base_test_singles_block("h2o_sto3g", "cvs-adc2x")
+
+    def test_singles_block_cn(self):
+        self.base_test_singles_block("cn_sto3g", "adc2")
+
+    def test_singles_block_hf3_spin_flip(self):
+        self.base_test_singles_block("hf3_631g", "adc2", spin_change=-1)
+
+    def test_apply_inverse(self):
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+        preconditioner = SinglesBlockPreconditioner(matrix, shifts=0.1)
+        guesses = adcc.guesses_singlet(matrix, n_guesses=3, block="ph")
+
+        for guess in guesses:
+            precond = preconditioner.apply(guess)
+            ref = (matrix.block_apply("ph_ph", precond.ph)
+                   - 0.1 * precond.ph).evaluate()
+            np.testing.assert_allclose(ref.to_ndarray(), guess.ph.to_ndarray(),
+                                       atol=1e-12)
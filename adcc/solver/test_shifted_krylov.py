@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from adcc.testdata.cache import cache
+from adcc.solver.shifted_krylov import default_print, shifted_minres
+
+
+class TestShiftedMinres(unittest.TestCase):
+    def test_adc2_shifted_linear_solve(self):
+        conv_tol = 1e-8
+        refdata = cache.reference_data["h2o_sto3g"]["adc2"]["singlet"]
+        matrix = adcc.AdcMatrix("adc2", cache.refstate["h2o_sto3g"])
+        rhs = adcc.guess_zero(matrix)
+        rhs.set_random()
+
+        # Frequencies below and above the first excitation energy
+        first = refdata["eigenvalues"][0]
+        shifts = np.linspace(0, first + 0.1, 12)
+        res = shifted_minres(matrix, rhs, shifts, conv_tol=conv_tol,
+                             max_iter=500, callback=default_print,
+                             explicit_symmetrisation=None)
+        assert res.converged
+        for shift, x in zip(shifts, res.solution):
+            residual = matrix @ x - shift * x - rhs
+            assert np.sqrt(residual @ residual) < 10 * conv_tol
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import adcc
+import unittest
+import numpy as np
+
+from numpy.testing import assert_allclose
+from pytest import approx
+
+from adcc import LazyMp
+from adcc.adc_pp import modified_transition_moments
+from adcc.testdata.cache import cache
+from adcc.solver.spectral_function import broaden, lanczos_spectrum
+
+
+class TestSolverSpectralFunction(unittest.TestCase):
+    def test_adc2_sum_rule(self):
+        # The first moment of the spectral function is exact for any
+        # number of Lanczos steps
+        ground_state = LazyMp(cache.refstate["h2o_sto3g"])
+        matrix = adcc.AdcMatrix("adc2", ground_state)
+        mtms = modified_transition_moments("adc2", ground_state)
+
+        res = lanczos_spectrum(matrix, mtms, max_iter=2, conv_tol=0)
+        first_moment = 2. / 3. * sum(mtm @ (matrix @ mtm) for mtm in mtms)
+        assert res.n_iter == 2
+        assert np.sum(res.oscillator_strength) == approx(first_moment)
+
+    def test_adc2_singlet_spectrum(self):
+        refdata = cache.reference_data["h2o_sto3g"]["adc2"]["singlet"]
+        matrix = adcc.AdcMatrix("adc2", LazyMp(cache.refstate["h2o_sto3g"]))
+
+        res = lanczos_spectrum(matrix, conv_tol=1e-8, max_iter=200)
+        assert res.converged
+
+        energies = refdata["eigenvalues"]
+        tdms = refdata["transition_dipole_moments"]
+        ref_strength = 2. / 3. * np.sum(tdms**2, axis=1) * energies
+
+        # The lowest part of the spectrum agrees with the reference states
+        width = 0.005
+        grid = np.linspace(energies[0] - 0.1, energies[-1] - 0.1, 500)
+        ref_spectrum = broaden(grid, energies, ref_strength, width, "gaussian")
+        spectrum = res.broadened(grid, width=width, shape="gaussian")
+        assert_allclose(spectrum, ref_spectrum, atol=1e-6 * max(ref_spectrum))
+
+        spectrum = res.to_spectrum()
+        assert spectrum.x == approx(res.excitation_energy)
+        assert spectrum.y == approx(res.oscillator_strength)
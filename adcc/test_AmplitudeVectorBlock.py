@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+## vi: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
+## ---------------------------------------------------------------------
+##
+## Copyright (C) 2021 by the adcc authors
+##
+## This file is part of adcc.
+##
+## adcc is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published
+## by the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## adcc is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with adcc. If not, see <http://www.gnu.org/licenses/>.
+##
+## ---------------------------------------------------------------------
+import tempfile
+import unittest
+import numpy as np
+
+import adcc
+from adcc import AmplitudeVectorBlock
+from adcc.testdata.cache import cache
+from adcc.solver.preconditioner import JacobiPreconditioner
+from adcc.solver.explicit_symmetrisation import IndexSpinSymmetrisation
+
+
+class TestAmplitudeVectorBlock(unittest.TestCase):
+    def setUp(self):
+        self.matrix = adcc.AdcMatrix("adc2", cache.refstate["h2o_sto3g"])
+        self.vectors = [adcc.guess_zero(self.matrix) for i in range(4)]
+        for vec in self.vectors:
+            vec.set_random()
+
+    def test_roundtrip(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        assert len(block) == 4
+        for ref, vec in zip(self.vectors, block.to_list()):
+            for b in ref.blocks_ph:
+                np.testing.assert_allclose(ref[b].to_ndarray(),
+                                           vec[b].to_ndarray(), atol=1e-14)
+
+    def test_antisymmetric_storage(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        no, _, nv, _ = self.vectors[0].pphh.shape
+        assert block.data["pphh"].shape == \
+            (4, no * (no - 1) // 2 * nv * (nv - 1) // 2)
+        assert block.data["ph"].shape == (4, self.vectors[0].ph.size)
+
+        vector = self.vectors[0].copy()
+        vector.pphh = vector.pphh.nosym_like().set_random()
+        with self.assertRaises(ValueError):
+            block.append(vector)
+
+    def test_dot(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        ref = np.array([[v @ w for w in self.vectors] for v in self.vectors])
+        np.testing.assert_allclose(block.dot(block), ref, atol=1e-12)
+        np.testing.assert_allclose(block @ self.vectors[1], ref[:, 1],
+                                   atol=1e-12)
+        np.testing.assert_allclose(block.norms()**2, np.diag(ref), atol=1e-12)
+
+    def test_lincomb(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        coefficients = np.random.randn(3, 4)
+        res = block.lincomb(coefficients)
+        assert len(res) == 3
+        for i in range(3):
+            ref = adcc.lincomb(coefficients[i], self.vectors, evaluate=True)
+            diff = ref - res[i]
+            assert np.sqrt(diff @ diff) < 1e-12
+
+    def test_single_precision(self):
+        vectors = []
+        for _ in range(4):
+            vec = adcc.guess_zero(self.matrix,
+                                  spin_block_symmetrisation="symmetric")
+            vectors.append(vec.set_random())
+        block = AmplitudeVectorBlock.from_vectors(vectors, dtype=np.float32)
+        coefficients = np.random.randn(2, 4)
+        res = block.lincomb(coefficients)
+        assert res.dtype == np.float32
+        for i, vec in enumerate(res.to_list()):
+            ref = adcc.lincomb(coefficients[i], vectors, evaluate=True)
+            for b in ref.blocks_ph:
+                np.testing.assert_allclose(ref[b].to_ndarray(),
+                                           vec[b].to_ndarray(), atol=1e-5)
+
+    def test_spin_symmetrisation(self):
+        symmetrisation = IndexSpinSymmetrisation(self.matrix,
+                                                 enforce_spin_kind="singlet")
+        vectors = []
+        for _ in range(3):
+            vec = adcc.guess_zero(self.matrix,
+                                  spin_block_symmetrisation="symmetric")
+            vectors.append(vec.set_random())
+        block = AmplitudeVectorBlock.from_vectors(vectors)
+        assert symmetrisation.symmetrise(block) is block
+
+        ref = symmetrisation.symmetrise([vec.copy() for vec in vectors])
+        for ref_vec, vec in zip(ref, block.to_list()):
+            for b in ref_vec.blocks_ph:
+                np.testing.assert_allclose(ref_vec[b].to_ndarray(),
+                                           vec[b].to_ndarray(), atol=1e-14)
+
+    def test_extend_slice(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors[:2], capacity=4)
+        block.extend(AmplitudeVectorBlock.from_vectors(self.vectors[2:]))
+        assert len(block) == 4
+        assert block.capacity == 4
+        block.append(self.vectors[0])
+        assert len(block) == 5
+        np.testing.assert_allclose(block[-2:].dot(block[:1]),
+                                   block.dot(block)[-2:, :1])
+
+    def test_preconditioner(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        shifts = np.array([0.1, 0.2, 0.3, 0.4])
+        preconditioner = JacobiPreconditioner(self.matrix)
+        preconditioner.update_shifts(shifts)
+        res = preconditioner @ block
+        ref = preconditioner @ self.vectors
+        for i in range(4):
+            diff = ref[i] - res[i]
+            assert np.sqrt(diff @ diff) < 1e-12
+
+    def test_out_of_core(self):
+        block = AmplitudeVectorBlock.from_vectors(self.vectors)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ooc = AmplitudeVectorBlock(self.vectors[0], capacity=2,
+                                       scratch_dir=tmpdir, chunk_size=3)
+            ooc.extend(self.vectors)
+            assert ooc.is_out_of_core
+            assert not block.is_out_of_core
+
+            coefficients = np.random.randn(2, 4)
+            np.testing.assert_allclose(ooc.dot(ooc), block.dot(block),
+                                       atol=1e-12)
+            np.testing.assert_allclose(ooc.norms(), block.norms(), atol=1e-12)
+            lincomb = ooc.lincomb(coefficients)
+            assert lincomb.is_out_of_core
+            assert not block.lincomb(coefficients).is_out_of_core
+            for b in block.blocks_ph:
+                np.testing.assert_allclose(lincomb.data[b],
+                                           block.lincomb(coefficients).data[b],
+                                           atol=1e-12)
+            del lincomb
+            del ooc
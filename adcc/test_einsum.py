@@ -25,7 +25,7 @@ import numpy as np
 
 from numpy.testing import assert_allclose
 
-from adcc import einsum, empty_like, nosym_like
+from adcc import contraction_plans, einsum, empty_like, nosym_like
 from adcc.testdata.cache import cache
 
 import pytest
@@ -180,3 +180,24 @@ class TestEinsum(unittest.TestCase):
         b = nosym_like(refstate.fov)
         c = nosym_like(refstate.foo)
         self.base_test("ij,ia,ik->jka", a, b, c)
+
+    def test_contraction_plans(self):
+        refstate = cache.refstate["h2o_sto3g"]
+        a = empty_like(refstate.foo).set_random()
+        b = empty_like(refstate.oovv).set_random()
+        ref = np.einsum("ik,kjab->ijab", a.to_ndarray(), b.to_ndarray())
+
+        contraction_plans.clear()
+        contraction_plans.check = True
+        try:
+            for _ in range(2):  # Compile, then replay the plan
+                out = einsum("ik,kjab->ijab", a, b)
+                assert_allclose(out.to_ndarray(), ref, rtol=1e-10, atol=1e-14)
+            assert len(contraction_plans) == 1
+
+            contraction_plans.enabled = False
+            out = einsum("ik,kjab->ijab", a, b)
+            assert_allclose(out.to_ndarray(), ref, rtol=1e-10, atol=1e-14)
+        finally:
+            contraction_plans.check = False
+            contraction_plans.enabled = True
@@ -22,6 +22,7 @@
 ## ---------------------------------------------------------------------
 import adcc
 import pytest
+import numpy as np
 
 from pytest import approx
 
@@ -215,6 +216,25 @@ class TestWorkflow:
         assert res.converged
         assert res.eigenvalues == approx(ref_singlets[:3])
 
+        res = diagonalise_adcmatrix(matrix, n_states=3, kind="singlet",
+                                    eigensolver="lobpcg")
+        assert res.converged
+        assert res.eigenvalues == approx(ref_singlets[:3])
+
+        # States closest to a target energy
+        target = ref_singlets[4]
+        res = diagonalise_adcmatrix(matrix, n_states=3, kind="singlet",
+                                    target_energy=target)
+        closest = np.sort(ref_singlets[np.argsort(np.abs(ref_singlets
+                                                         - target))[:3]])
+        assert res.converged
+        assert res.eigenvalues == approx(closest)
+
+        with pytest.raises(InputError):  # No target energy with lanczos
+            res = diagonalise_adcmatrix(matrix, n_states=3, kind="singlet",
+                                        eigensolver="lanczos",
+                                        target_energy=target)
+
         with pytest.raises(InputError):  # Too low tolerance
             res = diagonalise_adcmatrix(matrix, n_states=9, kind="singlet",
                                         eigensolver="davidson",
@@ -34,6 +34,8 @@ from .AdcMethod import AdcMethod
 from .exceptions import InputError
 from .ExcitedStates import ExcitedStates
 from .ReferenceState import ReferenceState as adcc_ReferenceState
+from .solver.lobpcg import lobpcg
+from .solver.chebyshev import chebyshev
 from .solver.lanczos import lanczos
 from .solver.davidson import jacobi_davidson
 from .solver.explicit_symmetrisation import (IndexSpinSymmetrisation,
@@ -88,7 +90,12 @@ def run_adc(data_or_matrix, n_states=None, kind="any", conv_tol=None,
         whatever is larger)
 
     eigensolver : str, optional
-        The eigensolver algorithm to use.
+        The eigensolver algorithm to use ("davidson", "lanczos", "lobpcg"
+        or "chebyshev"). "lobpcg" keeps only three times the number of
+        guesses as basis vectors, such that less memory is needed than for
+        "davidson". "chebyshev" (Chebyshev-filtered subspace iteration)
+        needs more matrix applies, but far fewer orthogonalisations,
+        which pays off for many states.
 
     n_guesses : int, optional
         Total number of guesses to compute. By default only guesses derived from
@@ -135,6 +142,29 @@ def run_adc(data_or_matrix, n_states=None, kind="any", conv_tol=None,
         Maximal subspace size
     max_iter : int, optional
         Maximal number of iterations
+    preconditioning_method : str, optional
+        Correction used to extend the Davidson subspace: "Davidson" (default,
+        preconditioned residuals), "Olsen" or "Jacobi-Davidson"
+        (approximate solution of the Jacobi-Davidson correction equation
+        with `correction_max_iter` inner MINRES iterations)
+    max_expansion : int, optional
+        Maximal number of new Davidson subspace vectors (i.e. matrix applies)
+        per iteration. Only the worst-converged states contribute then.
+    mixed_precision_tol : float, optional
+        Keep the Davidson subspace in single precision until the residual
+        norms drop below this value, then refine in double precision.
+    target_energy : float, optional
+        Compute the `n_states` states with excitation energies closest to
+        this value (in Hartree) instead of the lowest states, e.g. to
+        reach core or Rydberg regions. Uses a harmonic Ritz extraction in
+        the Davidson solver and guesses from the singles diagonal
+        closest to the target.
+    checkpoint : str, optional
+        HDF5 file to which the state of the eigensolver is written after each
+        iteration, such that an interrupted calculation can be resumed
+    restart_from : str, optional
+        HDF5 checkpoint file written by a previous (interrupted) calculation
+        from which the eigensolver is resumed
 
     Returns
     -------
@@ -333,7 +363,8 @@ def validate_state_parameters(reference_state, n_states=None, n_singlets=None,
 
 def diagonalise_adcmatrix(matrix, n_states, kind, eigensolver="davidson",
                           guesses=None, n_guesses=None, n_guesses_doubles=None,
-                          conv_tol=None, output=sys.stdout, **solverargs):
+                          conv_tol=None, output=sys.stdout, target_energy=None,
+                          **solverargs):
     """
     This function seeks appropriate guesses and afterwards proceeds to
     diagonalise the ADC matrix using the specified eigensolver.
@@ -371,15 +402,33 @@ def diagonalise_adcmatrix(matrix, n_states, kind, eigensolver="davidson",
             "Lanczos", matrix, kind, solver.lanczos.default_print,
             output=output)
         run_eigensolver = lanczos
+    elif eigensolver == "lobpcg":
+        n_guesses_per_state = 1
+        callback = setup_solver_printing(
+            "LOBPCG", matrix, kind, solver.lobpcg.default_print,
+            output=output)
+        run_eigensolver = lobpcg
+    elif eigensolver == "chebyshev":
+        n_guesses_per_state = 2
+        callback = setup_solver_printing(
+            "Chebyshev-filtered subspace iteration", matrix, kind,
+            solver.chebyshev.default_print, output=output)
+        run_eigensolver = chebyshev
     else:
         raise InputError(f"Solver {eigensolver} unknown, try 'davidson'.")
+    if target_energy is not None:
+        if eigensolver != "davidson":
+            raise InputError("target_energy is only supported with the "
+                             "davidson eigensolver.")
+        solverargs["target"] = target_energy
 
     # Obtain or check guesses
     if guesses is None:
         if n_guesses is None:
             n_guesses = estimate_n_guesses(matrix, n_states, n_guesses_per_state)
         guesses = obtain_guesses_by_inspection(matrix, n_guesses, kind,
-                                               n_guesses_doubles)
+                                               n_guesses_doubles,
+                                               target=target_energy)
     else:
         if len(guesses) < n_states:
             raise InputError("Less guesses provided via guesses (== {}) "
@@ -434,12 +483,15 @@ def estimate_n_guesses(matrix, n_states, singles_only=True,
     return max(n_states, n_guesses)
 
 
-def obtain_guesses_by_inspection(matrix, n_guesses, kind, n_guesses_doubles=None):
+def obtain_guesses_by_inspection(matrix, n_guesses, kind, n_guesses_doubles=None,
+                                 target=None):
     """
     Obtain guesses by inspecting the diagonal matrix elements.
     If n_guesses_doubles is not None, this is number is always adhered to.
     Otherwise the number of doubles guesses is adjusted to fill up whatever
     the singles guesses cannot provide to reach n_guesses.
+    If target is not None, the singles guesses are taken from the diagonal
+    elements closest to this value and no doubles guesses are used.
     Internal function called from run_adc.
     """
     if n_guesses_doubles is not None and n_guesses_doubles > 0 \
@@ -447,6 +499,10 @@ def obtain_guesses_by_inspection(matrix, n_guesses, kind, n_guesses_doubles=None
         raise InputError("n_guesses_doubles > 0 is only sensible if the ADC "
                          "method has a doubles block (i.e. it is *not* ADC(0), "
                          "ADC(1) or a variant thereof.")
+    if n_guesses_doubles is not None and n_guesses_doubles > 0 \
+       and target is not None:
+        raise InputError("n_guesses_doubles > 0 cannot be combined with "
+                         "target_energy.")
 
     # Determine guess function
     guess_function = {"any": guesses_any, "singlet": guesses_singlet,
@@ -457,10 +513,11 @@ def obtain_guesses_by_inspection(matrix, n_guesses, kind, n_guesses_doubles=None
     n_guess_singles = n_guesses
     if n_guesses_doubles is not None:
         n_guess_singles = n_guesses - n_guesses_doubles
-    singles_guesses = guess_function(matrix, n_guess_singles, block="ph")
+    singles_guesses = guess_function(matrix, n_guess_singles, block="ph",
+                                     target=target)
 
     doubles_guesses = []
-    if "pphh" in matrix.axis_blocks:
+    if "pphh" in matrix.axis_blocks and target is None:
         # Determine number of doubles guesses to request if not
         # explicitly specified
         if n_guesses_doubles is None: